@@ -0,0 +1,55 @@
+"""
+Compare the raw sheet readers of step 1 on a Gas Bench export:
+
+    python benchmarks/bench_reader.py path/to/export.xlsx [--sheet NAME] [--repeat N]
+
+Reports the best wall time of each engine over N runs and checks that the
+iterparse reader returns the same frame as pd.read_excel for the columns
+step 1 uses.
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from steps.carbon.step1_data import HEADERS  # noqa: E402
+from steps.carbon.xlsx_reader import read_gas_bench_sheet  # noqa: E402
+
+
+def best_time(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file")
+    parser.add_argument("--sheet", default="Default_Gas_Bench.wke")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    t_pandas, df_pandas = best_time(
+        lambda: pd.read_excel(args.file, sheet_name=args.sheet, engine="openpyxl"), args.repeat)
+    t_fast, df_fast = best_time(
+        lambda: read_gas_bench_sheet(args.file, args.sheet, HEADERS), args.repeat)
+
+    same = df_pandas[list(df_fast.columns)].equals(df_fast)
+    print(f"rows: {len(df_pandas)}, columns read: {len(df_fast.columns)} of {len(df_pandas.columns)}")
+    print(f"pd.read_excel (openpyxl): {t_pandas * 1000:8.1f} ms")
+    print(f"iterparse reader:         {t_fast * 1000:8.1f} ms  ({t_pandas / t_fast:.1f}x)")
+    print(f"same frame: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
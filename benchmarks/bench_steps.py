@@ -0,0 +1,157 @@
+"""
+Time the Carbonate steps on synthetic Gas Bench workbooks:
+
+    python benchmarks/bench_steps.py [--sizes 100,1000,10000] [--repeat 3] [--save-baseline]
+
+For each size (number of Lines) a workbook is generated once (see
+gas_bench.py, kept in --data-dir), then the full pipeline runs --repeat
+times on a fresh copy with a RunProfile. Reported per size: the best time
+of each step, of the initial load and the final save, and of the whole
+run.
+
+--save-baseline records the results in --baseline (benchmarks/baseline.json
+by default). Later runs compare against it and flag every timing that got
+more than --tolerance slower (and by more than 50 ms, below which timings
+are noise); the exit code is then 1. Baselines only mean something on the
+machine that recorded them.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# every run has to parse the raw sheet, not reuse it from the local cache
+os.environ["MRSI_RAW_CACHE_MB"] = "0"
+
+from benchmarks.gas_bench import generate  # noqa: E402
+from steps.carbon.pipeline import STEP_NAMES, run_pipeline  # noqa: E402
+from steps.carbon.profiling import RunProfile  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+NOISE_SECONDS = 0.05
+
+
+def parse_sizes(text):
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def workbook_for(data_dir, lines, seed):
+    """Generated workbook with `lines` Lines, created on first use."""
+    path = os.path.join(data_dir, f"gas_bench_{lines}_{seed}.xlsx")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        rows = generate(path, lines, seed=seed)
+        print(f"generated {os.path.basename(path)}: {rows} rows in {time.perf_counter() - start:.1f} s",
+              file=sys.stderr)
+    return path
+
+
+def run_once(source, work_dir):
+    """Run every step on a fresh copy of `source`; returns {timing name: seconds}."""
+    path = os.path.join(work_dir, os.path.basename(source))
+    shutil.copyfile(source, path)
+    profile = RunProfile(path)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_pipeline(path, incremental=False, profile=profile)
+    report = profile.report()
+    timings = {f"step {r['step']} {STEP_NAMES[r['step']]}": r["wall"] for r in report["steps"]}
+    for phase in ("load", "save"):
+        if phase in report["phases"]:
+            timings[phase] = report["phases"][phase]["wall"]
+    timings["pipeline"] = report["wall"]
+    failed = [step for step, err in results.items() if err is not None]
+    if failed:
+        raise RuntimeError(f"steps {failed} failed on {source}")
+    return timings
+
+
+def bench(sizes, repeat, data_dir, seed):
+    """{size: {timing name: best seconds}}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for lines in sizes:
+            source = workbook_for(data_dir, lines, seed)
+            best = {}
+            for _ in range(repeat):
+                for name, seconds in run_once(source, work_dir).items():
+                    best[name] = seconds if name not in best else min(best[name], seconds)
+            results[str(lines)] = best
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print a table of results against baseline; returns the slowdowns."""
+    slower = []
+    for size, timings in results.items():
+        print(f"\n{size} Lines")
+        base = baseline.get(size, {})
+        for name, seconds in timings.items():
+            line = f"  {name:<16} {seconds:9.3f} s"
+            if name in base:
+                ratio = seconds / base[name] if base[name] else float("inf")
+                line += f"   baseline {base[name]:9.3f} s  ({ratio:5.2f}x)"
+                if seconds > base[name] * (1 + tolerance) and seconds - base[name] > NOISE_SECONDS:
+                    line += "  SLOWER"
+                    slower.append((size, name, base[name], seconds))
+            print(line)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("100,1000,10000"),
+                        help="numbers of Lines, e.g. 100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "mrsi_benchmarks"),
+                        help="where the generated workbooks are kept between runs")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="record these results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="flag timings more than this fraction slower than the baseline (default 0.25)")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = bench(args.sizes, args.repeat, args.data_dir, args.seed)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            recorded = json.load(f)
+        baseline = recorded["results"]
+        if recorded.get("machine") != platform.node():
+            print(f"note: baseline recorded on {recorded.get('machine')!r}, not this machine", file=sys.stderr)
+    slower = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "machine": platform.node(),
+                "python": platform.python_version(),
+                "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "repeat": args.repeat,
+                "seed": args.seed,
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+    if slower:
+        print(f"\n{len(slower)} timing(s) more than {args.tolerance:.0%} slower than the baseline:")
+        for size, name, before, now in slower:
+            print(f"  {size} Lines, {name}: {before:.3f} s -> {now:.3f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Synthetic Gas Bench exports for the benchmarks:
+
+    python benchmarks/gas_bench.py out.xlsx --lines 1000 [--short 0.05] [--seed 0]
+
+Writes a workbook with a `Default_Gas_Bench.wke` sheet laid out like the
+instrument export: one block of peaks per Line (3 reference gas peaks, then
+the sample peaks), reference materials (CO2, NBS 18, NBS 19, IAEA 603,
+LSVEC) between the samples, identifiers with `r<N>` / `r<N>.<M>` run
+suffixes and a share of short blocks with fewer than 11 peaks.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+SHEET_NAME = "Default_Gas_Bench.wke"
+
+EXPORT_HEADERS = [
+    "Line", "Time Code", "Identifier 1", "Comment", "Identifier 2", "Analysis", "Preparation",
+    "Peak Nr", "Rt", "Ampl  44", "Ampl 45", "Ampl 46", "Area All", "Area 44",
+    "d 13C/12C", "d 18O/16O", "d 45CO2/44CO2",
+]
+
+PEAKS = 11  # peaks of a full Line
+REFERENCE_PEAKS = 3  # reference gas pulses at the start of every Line
+
+# Share of each reference material among the Lines (the rest are samples)
+# and its δ13C/δ18O as the instrument reads it (published value + offset)
+DEFAULT_MIX = {
+    "CO2": 0.06,
+    "NBS 18": 0.06,
+    "NBS 19": 0.06,
+    "IAEA 603": 0.06,
+    "LSVEC": 0.04,
+}
+REFERENCE_DELTAS = {
+    "CO2": (-3.5, -8.0),
+    "NBS 18": (-4.2, -21.6),
+    "NBS 19": (2.7, -0.9),
+    "IAEA 603": (3.2, -1.1),
+    "LSVEC": (-45.8, -25.4),
+}
+
+# Sample names; "N Arag" ones take the aragonite correction in step 4
+SAMPLE_NAMES = ["MC-{:02d}", "Coral {}", "N Arag {}", "N. Arag {}", "Spel-{:03d}"]
+
+
+def _identifiers(rnd, lines, mix, samples):
+    """Identifier 1 of every Line, with run suffixes numbered per name."""
+    names = list(mix) + ["sample"]
+    weights = list(mix.values()) + [max(0.0, 1.0 - sum(mix.values()))]
+    sample_names = [rnd.choice(SAMPLE_NAMES).format(i + 1) for i in range(samples)]
+    runs = {}
+    for _ in range(lines):
+        name = rnd.choices(names, weights)[0]
+        if name == "sample":
+            name = rnd.choice(sample_names)
+        runs[name] = runs.get(name, 0) + 1
+        suffix = f"r{runs[name]}"
+        if rnd.random() < 0.2:
+            # repeated measurement of the same run
+            suffix += f".{rnd.randint(1, 3)}"
+        yield name, f"{name} {suffix}"
+
+
+def generate(path, lines=100, short=0.05, mix=None, samples=20, seed=0):
+    """
+    Write a synthetic Gas Bench workbook to `path`. `lines` Lines, a
+    `short` share of them with fewer than 11 peaks (6 to 10), reference
+    materials drawn with the shares in `mix` ({name: share}, DEFAULT_MIX by
+    default) and the rest spread over `samples` sample names. The same
+    arguments always give the same workbook. Returns the number of rows.
+    """
+    rnd = random.Random(seed)
+    mix = DEFAULT_MIX if mix is None else mix
+    sample_deltas = {}
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_NAME)
+    ws.append(EXPORT_HEADERS)
+
+    start = datetime(2025, 5, 21, 8, 0, 0)
+    n_rows = 0
+    for line, (name, identifier) in enumerate(_identifiers(rnd, lines, mix, samples), start=1):
+        if name in REFERENCE_DELTAS:
+            d13c, d18o = REFERENCE_DELTAS[name]
+        else:
+            if name not in sample_deltas:
+                sample_deltas[name] = (rnd.uniform(-12, 4), rnd.uniform(-14, 1))
+            d13c, d18o = sample_deltas[name]
+        time_code = (start + timedelta(minutes=9 * line)).strftime("%Y/%m/%d %H:%M:%S")
+        peaks = PEAKS if rnd.random() >= short else rnd.randint(6, PEAKS - 1)
+        amplitude = rnd.uniform(2500, 6500)
+        for peak in range(1, peaks + 1):
+            if peak <= REFERENCE_PEAKS:
+                ampl44 = rnd.gauss(3800, 40)
+                delta_c, delta_o = rnd.gauss(0, 0.02), rnd.gauss(0, 0.03)
+            else:
+                # sample peaks get smaller with every injection
+                ampl44 = amplitude * (0.93 ** (peak - REFERENCE_PEAKS - 1)) * rnd.gauss(1, 0.01)
+                delta_c, delta_o = rnd.gauss(d13c, 0.05), rnd.gauss(d18o, 0.08)
+            area = ampl44 * rnd.uniform(0.0185, 0.0195)
+            ws.append([
+                line, time_code, identifier,
+                rnd.choice([None, None, "tray A", "re-run"]) if peak == 1 else None,
+                rnd.choice([None, "calcite", "aragonite"]) if peak == 1 else None,
+                1000 + line, "H3PO4" if peak == 1 else None,
+                peak, round(21.6 + 25.3 * (peak - 1) + rnd.gauss(0, 0.05), 1),
+                round(ampl44), round(ampl44 * 1.18), round(ampl44 * 1.41),
+                round(area * 1.03, 3), round(area, 3),
+                round(delta_c, 3), round(delta_o, 3), round(delta_c + 0.035 * delta_o, 3),
+            ])
+            n_rows += 1
+    wb.save(path)
+    return n_rows
+
+
+def parse_mix(text):
+    """'CO2=0.1,NBS 18=0.05' -> {'CO2': 0.1, 'NBS 18': 0.05}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, share = part.partition("=")
+        mix[name.strip()] = float(share)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Gas Bench workbook.")
+    parser.add_argument("output")
+    parser.add_argument("--lines", type=int, default=100)
+    parser.add_argument("--short", type=float, default=0.05, help="share of Lines with fewer than 11 peaks")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="reference shares, e.g. 'CO2=0.06,NBS 18=0.06,NBS 19=0.06,IAEA 603=0.06,LSVEC=0.04'")
+    parser.add_argument("--samples", type=int, default=20, help="distinct sample names")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = generate(args.output, args.lines, args.short, args.mix, args.samples, args.seed)
+    print(f"{args.output}: {args.lines} Lines, {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Headless batch runner for the Carbonate steps.
+
+    python cli.py sessions/ "2025-*/export*.xlsx" one.csv --steps 1-5 --workers 4
+
+Every workbook (or .csv/.txt export) runs in its own worker process; a file
+that fails does not stop the others. Progress goes to stderr and a JSON
+summary of all files is printed to stdout (or written with --output).
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from steps.carbon.jobs import run_job
+from steps.carbon.pipeline import STEP_NAMES
+from steps.carbon.step1_data import ENGINES
+from steps.carbon.step2_tosort import FILTER_CHOICES
+from steps.carbon.text_import import TEXT_EXTENSIONS, is_text_export, workbook_path_for
+
+INPUT_EXTENSIONS = (".xlsx",) + TEXT_EXTENSIONS
+
+
+def parse_steps(text):
+    """'1-5', '1,2,4' or '2-3,5' -> sorted list of step numbers."""
+    steps = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            steps.update(range(int(first), int(last) + 1))
+        else:
+            steps.add(int(part))
+    unknown = steps - set(STEP_NAMES)
+    if unknown or not steps:
+        raise argparse.ArgumentTypeError(f"steps must be within 1-{max(STEP_NAMES)}, got {text!r}")
+    return sorted(steps)
+
+
+def parse_views(text):
+    """'Start,End,Delta' -> ['Start', 'End', 'Delta'] (names as in FILTER_CHOICES)."""
+    by_name = {c.lower(): c for c in FILTER_CHOICES}
+    views = []
+    for part in text.split(","):
+        name = by_name.get(part.strip().lower())
+        if name is None:
+            raise argparse.ArgumentTypeError(f"views must be among {FILTER_CHOICES}, got {part.strip()!r}")
+        if name not in views:
+            views.append(name)
+    return views
+
+
+def expand_inputs(patterns):
+    """
+    Files named by paths, glob patterns or directories, in order, without
+    duplicates and without the workbooks written for the text exports among
+    them.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(INPUT_EXTENSIONS)
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            # skip Excel's lock files (~$name.xlsx) of workbooks that are open
+            if os.path.basename(path).startswith("~$"):
+                continue
+            path = os.path.abspath(path)
+            if path not in files:
+                files.append(path)
+    # the workbook of a text export is rewritten by the export's own job
+    outputs = {workbook_path_for(path) for path in files if is_text_export(path)}
+    return [path for path in files if path not in outputs]
+
+
+def cprofile_path_for(directory, path):
+    """Where --cprofile puts the stats of `path`: <directory>/<file name>.prof."""
+    return os.path.join(directory, os.path.basename(path) + ".prof")
+
+
+def run_batch(files, steps, sheet_name, filter_choice, engine="openpyxl", workers=None, incremental=True,
+              views=(), views_layout="sheets", profile=False, cprofile_dir=None, streaming=False):
+    """Run every file in a process pool; returns the per-file results in input order."""
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_job, path, steps, sheet_name, filter_choice, engine,
+                        incremental=incremental, views=views, views_layout=views_layout,
+                        profile=profile, trace_memory=profile,
+                        cprofile_path=cprofile_path_for(cprofile_dir, path) if cprofile_dir else None,
+                        streaming=streaming): path
+            for path in files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process itself died (e.g. out of memory)
+                result = {"file": path, "output": None, "ok": False, "cancelled": False,
+                          "steps": {}, "error": f"{type(e).__name__}: {e}", "seconds": None}
+            results[path] = result
+            mark = "✔" if result["ok"] else "✖"
+            print(f"{mark} {os.path.basename(path)} ({len(results)}/{len(files)})", file=sys.stderr)
+    return [results[path] for path in files]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Carbonate steps on many workbooks.")
+    parser.add_argument("inputs", nargs="+", help="workbooks, .csv/.txt exports, glob patterns or directories")
+    parser.add_argument("--steps", type=parse_steps, default=parse_steps("1-5"),
+                        help="steps to run, e.g. 1-5 or 1,2,4 (default: 1-5)")
+    parser.add_argument("--sheet", default="Default_Gas_Bench.wke", help="raw sheet read by step 1")
+    parser.add_argument("--filter", default="Last 6", choices=FILTER_CHOICES, help="step 2 filter")
+    parser.add_argument("--views", type=parse_views, default=[],
+                        help="further step 2 filter views built in the same pass, e.g. Start,End,Delta")
+    parser.add_argument("--views-table", action="store_true",
+                        help="put the views in one Excel table sheet instead of one sheet per view")
+    parser.add_argument("--engine", default="openpyxl", choices=ENGINES, help="step 1 raw sheet reader")
+    parser.add_argument("--streaming", action="store_true",
+                        help="step 1 for very large exports: REPLACES each workbook with a new one holding "
+                             "only Data and the raw sheet's values; other sheets, formatting and step "
+                             "records are dropped")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every selected step, even when its inputs did not change")
+    parser.add_argument("--profile", action="store_true",
+                        help="add per-step timings, peak memory and cell counts of every file to the summary")
+    parser.add_argument("--cprofile", metavar="DIR",
+                        help="also write cProfile stats of every file to DIR/<file name>.prof")
+    parser.add_argument("--output", help="write the JSON summary to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error("no input files found")
+    if args.cprofile:
+        os.makedirs(args.cprofile, exist_ok=True)
+    if args.streaming and 1 in args.steps:
+        print("--streaming: step 1 replaces every .xlsx workbook with Data and the raw sheet's values only; "
+              "its other sheets, formatting and step records are dropped.", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = run_batch(files, args.steps, args.sheet, args.filter, args.engine, args.workers,
+                        incremental=not args.force, views=args.views,
+                        views_layout="table" if args.views_table else "sheets",
+                        profile=args.profile, cprofile_dir=args.cprofile, streaming=args.streaming)
+    summary = {
+        "steps": args.steps,
+        "sheet_name": args.sheet,
+        "filter": args.filter,
+        "views": args.views,
+        "streaming": args.streaming,
+        "total": len(results),
+        "succeeded": sum(r["ok"] for r in results),
+        "failed": sum(not r["ok"] for r in results),
+        "seconds": round(time.perf_counter() - start, 3),
+        "files": results,
+    }
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,22 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+import multiprocessing
 import os
+import queue
 import sys
-import xlwings as xw
-import time
 import threading
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
 
 # ---- Import Carbonate Steps ----
-from steps.carbon.step1_data import step1_data
-from steps.carbon.step2_tosort import step2_tosort
-from steps.carbon.step3_last6 import step3_last6
-from steps.carbon.step4_group import step4_group
-from steps.carbon.step5_summary import step5_summary
+from steps.carbon.jobs import run_job
+from steps.carbon.pipeline import STEP_NAMES
+from steps.carbon.text_import import is_text_export
 
-
-def refresh_excel(file_path):
-    """Open Excel, recalc, save, and close."""
-    if not os.path.exists(file_path):
-        print(f"File {file_path} not found for refresh.")
-        return
-    app = xw.App(visible=False)
-    try:
-        wb = app.books.open(os.path.abspath(file_path))
-        wb.app.calculate()
-        time.sleep(1)
-        wb.save()
-        wb.close()
-    finally:
-        app.quit()
+# Carbonate files processed at the same time (each in its own process)
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# how often the GUI polls the workers for progress (ms)
+POLL_MS = 100
 
 
 def open_folder(file_path):
@@ -150,14 +138,21 @@ def launch_gui():
 
     file_action_frame = tk.Frame(root, bg="#F8F9FA")
 
+    # every file picked in the dialog; selected_file is the first one (for the open buttons)
+    selected_files = []
+
     def browse_file():
-        file_path = filedialog.askopenfilename(
-            title="Select Excel file",
-            filetypes=[("Excel files", "*.xlsx *.xls")]
+        file_paths = filedialog.askopenfilenames(
+            title="Select Excel files",
+            filetypes=[("Excel files", "*.xlsx *.xls"), ("Instrument text exports", "*.csv *.txt")]
         )
-        if file_path:
-            selected_file.set(file_path)
-            display_file.set(os.path.basename(file_path))
+        selected_files[:] = list(file_paths)
+        if file_paths:
+            selected_file.set(file_paths[0])
+            if len(file_paths) == 1:
+                display_file.set(os.path.basename(file_paths[0]))
+            else:
+                display_file.set(f"{len(file_paths)} files selected")
             file_action_frame.pack(pady=5)
         else:
             selected_file.set("")
@@ -213,6 +208,10 @@ def launch_gui():
         bg="white", fg="black", width=25
     )
     sheet_name_entry.pack(side="left", ipady=3, padx=(0, 10))
+    # very large exports: write Data straight to a new file (confirmed on run)
+    stream_data_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(step1_inner, text="Streaming (replaces file, Data only)",
+                    variable=stream_data_var).pack(side="left")
 
     # Step 2: To Sort (with dropdown)
     step2_outer = tk.Frame(carbon_frame, bg="#F5F5F5", highlightbackground="#E0E0E0", highlightthickness=1)
@@ -248,6 +247,11 @@ def launch_gui():
     step3_inner.pack(fill="x", padx=10, pady=8)
     ttk.Checkbutton(step3_inner, text="Step 5: Summary", variable=carbon_step_vars["Step 5: Summary"]).pack(side="left")
 
+    # Steps whose inputs did not change since they were last built are skipped
+    skip_unchanged_var = tk.BooleanVar(value=True)
+    tk.Checkbutton(carbon_frame, text="Skip steps that are already up to date",
+                   variable=skip_unchanged_var, bg="white", activebackground="white").pack(anchor="w", padx=15, pady=(5, 0))
+
     # ---- Water Tab ----
     water_frame = tk.Frame(notebook, bg="white")
     notebook.add(water_frame, text="Water")
@@ -293,64 +297,212 @@ def launch_gui():
             status_text.config(state="disabled")
         root.after(0, append)
 
-    # ---------------- Background Run ----------------
-    def run_steps(file_path, tab):
-        if tab == "Carbonate":
+    # ---------------- Job Queue ----------------
+    # Carbonate files run in a bounded pool of worker processes; the workers
+    # report step events through a manager queue that the Tk loop polls.
+    jobs_frame = tk.Frame(status_frame)
+    jobs_frame.pack(fill="x", before=status_text, pady=(0, 5))
+
+    overall_row = tk.Frame(jobs_frame)
+    overall_row.pack(fill="x")
+    overall_label = ttk.Label(overall_row, text="", width=18)
+    overall_label.pack(side="left")
+    overall_bar = ttk.Progressbar(overall_row, mode="determinate")
+    overall_bar.pack(side="left", fill="x", expand=True, padx=(5, 10))
+    cancel_btn = ttk.Button(overall_row, text="■ Cancel", state="disabled")
+    cancel_btn.pack(side="left")
+
+    job_list = tk.Frame(jobs_frame)
+    job_list.pack(fill="x", pady=(5, 0))
+
+    # per-step timings of finished files (RunProfile reports of the jobs)
+    timing_columns = ("file", "step", "wall", "cpu", "cells")
+    timing_table = ttk.Treeview(jobs_frame, columns=timing_columns, show="headings", height=4)
+    for column, heading, width in zip(timing_columns, ("File", "Step", "Wall s", "CPU s", "Cells written"),
+                                      (180, 110, 70, 70, 100)):
+        timing_table.heading(column, text=heading)
+        timing_table.column(column, width=width, anchor="w" if column in ("file", "step") else "e")
+    timing_table.pack(fill="x", pady=(5, 0))
+
+    def add_timings(file_path, report):
+        name = os.path.basename(file_path)
+        for record in report["steps"]:
+            if record["status"] != "done":
+                continue
+            timing_table.insert("", "end", values=(
+                name, f"{record['step']}: {record['name']}", f"{record['wall']:.3f}",
+                f"{record['cpu']:.3f}", record["cells_written"]))
+        save = report["phases"].get("save")
+        if save:
+            timing_table.insert("", "end", values=(name, "save", f"{save['wall']:.3f}", f"{save['cpu']:.3f}", ""))
+        if report["wall"] is not None:
+            timing_table.insert("", "end", values=(
+                name, "total", f"{report['wall']:.3f}", f"{report['cpu']:.3f}", ""))
+        rows = timing_table.get_children()
+        if rows:
+            timing_table.see(rows[-1])
+
+    # file path -> {"future", "bar", "status", "steps", "steps_run", "done", ...}
+    jobs = {}
+    batch = {"pool": None, "manager": None, "events": None, "cancel": None, "total": 0, "finished": 0}
+
+    def step_message(step, status, detail, filter_choice, sheet_name):
+        name = STEP_NAMES[step]
+        if status == "start":
+            if step == 2:
+                return f"Running Step 2: TO SORT (Filter: {filter_choice})...", "white"
+            return f"Running Step {step}: {name}...", "white"
+        if status == "done":
+            if step == 1:
+                return f"✔ Step 1: DATA completed successfully (Sheet: {sheet_name}).", "green"
+            if step == 2:
+                return f"✔ Step 2: TO SORT ({filter_choice}) completed successfully.", "green"
+            return f"✔ Step {step}: {name} completed successfully.", "green"
+        if status == "cancelled":
+            return f"■ Cancelled before Step {step}: {name}.", "orange"
+        if status == "skipped":
+            return f"⏭ Step {step}: {name} is up to date, skipped.", "gray"
+        return f"✖ Step {step}: {name} failed: {detail}", "red"
+
+    def add_job_row(file_path, n_steps):
+        row = tk.Frame(job_list)
+        row.pack(fill="x", pady=1)
+        ttk.Label(row, text=os.path.basename(file_path), width=28, anchor="w").pack(side="left")
+        bar = ttk.Progressbar(row, mode="determinate", maximum=max(n_steps, 1))
+        bar.pack(side="left", fill="x", expand=True, padx=5)
+        status = ttk.Label(row, text="Queued", width=16)
+        status.pack(side="left")
+        return bar, status
+
+    def start_carbon_jobs(file_paths):
+        sheet_name = sheet_name_var.get().strip()
+        filter_choice = filter_option.get()
+        steps = [n for n, label in enumerate(carbon_step_vars, start=1) if carbon_step_vars[label].get()]
+        streaming = stream_data_var.get() and 1 in steps
+        if streaming and not messagebox.askyesno(
+                "Streaming Step 1",
+                "Streaming Step 1 replaces each selected workbook with a new one holding only the "
+                "Data sheet and the values of the raw sheet.\n\nIts other sheets, formatting and "
+                "step records are dropped. Continue?"):
+            return
+
+        if batch["pool"] is None:
+            # new batch: fresh pool, event queue and cancel flag
+            for child in job_list.winfo_children():
+                child.destroy()
+            timing_table.delete(*timing_table.get_children())
+            jobs.clear()
+            workers = max(1, min(MAX_WORKERS, len(file_paths)))
+            batch.update(pool=ProcessPoolExecutor(max_workers=workers), manager=multiprocessing.Manager(),
+                         total=0, finished=0)
+            batch["events"] = batch["manager"].Queue()
+            batch["cancel"] = batch["manager"].Event()
+            cancel_btn.config(state="normal")
+            root.after(POLL_MS, poll_jobs)
+        elif batch["cancel"].is_set():
+            # files cancelled earlier are still finishing: the new ones get
+            # a cancel flag of their own instead of the one already set
+            batch["cancel"] = batch["manager"].Event()
+            cancel_btn.config(state="normal")
+
+        for file_path in file_paths:
+            job = jobs.get(file_path)
+            if job is not None and not job["done"]:
+                # never run two jobs on the same workbook at once
+                log_message(f"{os.path.basename(file_path)} is already queued.", "orange")
+                continue
             log_message(f"Starting Carbonate processing for: {os.path.basename(file_path)}", "white")
+            bar, status = add_job_row(file_path, len(steps))
+            future = batch["pool"].submit(run_job, file_path, steps, sheet_name, filter_choice,
+                                          events=batch["events"], cancel=batch["cancel"],
+                                          incremental=skip_unchanged_var.get(), profile=True,
+                                          streaming=streaming)
+            jobs[file_path] = {"future": future, "bar": bar, "status": status, "steps": steps,
+                               "filter": filter_choice, "sheet": sheet_name, "steps_run": 0, "done": False}
+            batch["total"] += 1
+        update_overall()
+
+    def update_overall():
+        overall_bar.config(maximum=max(batch["total"], 1), value=batch["finished"])
+        overall_label.config(text=f"{batch['finished']} / {batch['total']} files")
+
+    def poll_jobs():
+        if batch["pool"] is None:
+            return
+        # step events from the workers
+        while True:
+            try:
+                file_path, step, status, detail = batch["events"].get_nowait()
+            except queue.Empty:
+                break
+            job = jobs.get(file_path)
+            if job is None:
+                continue
+            message, color = step_message(step, status, detail, job["filter"], job["sheet"])
+            prefix = f"[{os.path.basename(file_path)}] " if len(jobs) > 1 else ""
+            log_message(prefix + message, color)
+            if status == "start":
+                job["status"].config(text=f"Step {step}: {STEP_NAMES[step]}")
+            elif status in ("done", "error", "skipped"):
+                job["steps_run"] += 1
+                job["bar"].config(value=job["steps_run"])
+            elif status == "cancelled":
+                job["status"].config(text="Cancelled")
+
+        # finished jobs
+        for file_path, job in jobs.items():
+            if job["done"] or not job["future"].done():
+                continue
+            job["done"] = True
+            batch["finished"] += 1
+            if job["future"].cancelled():
+                job["status"].config(text="Cancelled")
+                continue
+            try:
+                result = job["future"].result()
+            except Exception as e:
+                result = {"ok": False, "cancelled": False, "error": str(e), "output": None}
+            if result["error"]:
+                job["status"].config(text="Failed")
+                log_message(f"✖ {os.path.basename(file_path)} failed: {result['error']}", "red")
+            elif result["cancelled"]:
+                job["status"].config(text="Cancelled")
+            else:
+                job["status"].config(text="Done" if result["ok"] else "Done with errors")
+            if result.get("profile"):
+                add_timings(file_path, result["profile"])
+            if is_text_export(file_path) and result["output"]:
+                log_message(f"Workbook saved as {os.path.basename(result['output'])}", "white")
+                if selected_file.get() == file_path:
+                    # a text export is written to a new workbook: point the file buttons at it
+                    selected_file.set(result["output"])
+        update_overall()
+
+        if all(job["done"] for job in jobs.values()):
+            # batch finished: release the workers
+            batch["pool"].shutdown(wait=False)
+            batch["manager"].shutdown()
+            batch.update(pool=None, manager=None, events=None, cancel=None)
+            cancel_btn.config(state="disabled")
+            log_message("All selected steps finished.\n", "green")
+            return
+        root.after(POLL_MS, poll_jobs)
 
-            if carbon_step_vars["Step 1: Data"].get():
-                log_message("Running Step 1: DATA...", "white")
-                try:
-                    sheet_name = sheet_name_var.get().strip()
-                    step1_data(file_path, sheet_name)
-                    log_message(f"✔ Step 1: DATA completed successfully (Sheet: {sheet_name}).", "green")
-                except Exception as e:
-                    log_message(f"✖ Step 1: DATA failed: {e}", "red")
-
-            if carbon_step_vars["Step 1: Data"].get() and carbon_step_vars["Step 2: To Sort"].get():
-                log_message("Refreshing Excel...", "white")
-                try:
-                    refresh_excel(file_path)
-                    log_message("✔ Excel refreshed successfully.", "green")
-                except Exception as e:
-                    log_message(f"✖ Excel refresh failed: {e}", "red")
-
-            if carbon_step_vars["Step 2: To Sort"].get():
-                log_message(f"Running Step 2: TO SORT (Filter: {filter_option.get()})...", "white")
-                try:
-                    step2_tosort(file_path, filter_option.get())
-                    log_message(f"✔ Step 2: TO SORT ({filter_option.get()}) completed successfully.", "green")
-                except Exception as e:
-                    log_message(f"✖ Step 2: TO SORT failed: {e}", "red")
-
-            if carbon_step_vars["Step 3: Last 6"].get():
-                log_message("Running Step 3: LAST 6...", "white")
-                try:
-                    step3_last6(file_path)
-                    log_message("✔ Step 3: LAST 6 completed successfully.", "green")
-                except Exception as e:
-                    log_message(f"✖ Step 3: LAST 6 failed: {e}", "red")
-            
-            if carbon_step_vars["Step 4: Group"].get():
-                log_message("Running Step 4: GROUP...", "white")
-                try:
-                    from steps.carbon.step4_group import step4_group
-                    step4_group(file_path)
-                    log_message("✔ Step 4: GROUP completed successfully.", "green")
-                except Exception as e:
-                    log_message(f"✖ Step 4: GROUP failed: {e}", "red")
-
-            if carbon_step_vars["Step 5: Summary"].get():
-                log_message("Running Step 5: SUMMARY...", "white")
-                try:
-                    from steps.carbon.step5_summary import step5_summary
-                    step5_summary(file_path)
-                    log_message("✔ Step 5: SUMMARY completed successfully.", "green")
-                except Exception as e:
-                    log_message(f"✖ Step 5: SUMMARY failed: {e}", "red")
-
-
-        elif tab == "Water":
+    def cancel_jobs():
+        if batch["pool"] is None:
+            return
+        # queued files never start; running ones stop before their next step
+        for job in jobs.values():
+            job["future"].cancel()
+        batch["cancel"].set()
+        cancel_btn.config(state="disabled")
+        log_message("Cancelling: running files stop after their current step...", "orange")
+
+    cancel_btn.config(command=cancel_jobs)
+
+    # ---------------- Background Run ----------------
+    def run_water(file_paths):
+        for file_path in file_paths:
             log_message(f"Starting Water processing for: {os.path.basename(file_path)}", "white")
             if water_step_vars["Step 1: Data"].get():
                 log_message("Running Step 1: DATA...", "white")
@@ -362,8 +514,8 @@ def launch_gui():
         log_message("All selected steps finished.\n", "green")
 
     def run():
-        file_path = selected_file.get()
-        if not file_path or not os.path.exists(file_path):
+        file_paths = [p for p in selected_files if p]
+        if not file_paths or not all(os.path.exists(p) for p in file_paths):
             messagebox.showerror("Error", "Please select a valid file!")
             return
 
@@ -382,8 +534,11 @@ def launch_gui():
         root.update_idletasks()
 
         current_tab = notebook.tab(notebook.select(), "text")
-        thread = threading.Thread(target=run_steps, args=(file_path, current_tab), daemon=True)
-        thread.start()
+        if current_tab == "Carbonate":
+            start_carbon_jobs(file_paths)
+        else:
+            thread = threading.Thread(target=run_water, args=(file_paths,), daemon=True)
+            thread.start()
 
     run_btn = ttk.Button(root, text="▶ Run Selected Steps", command=run)
     run_btn.pack(pady=(20, 10))
@@ -392,4 +547,5 @@ def launch_gui():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     launch_gui()
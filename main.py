@@ -1,4 +1,7 @@
+import multiprocessing
+
 from gui import launch_gui
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     launch_gui()
@@ -0,0 +1,59 @@
+"""
+Sparse access to worksheet cells.
+
+openpyxl creates a Cell for every coordinate it is asked about: ws.cell()
+and ws.iter_rows() materialize whole rectangles even just to read them,
+and a cell written with None stays in the sheet, counts in max_row /
+max_column and is carried through every later step. The steps only
+create cells that hold something, read missing cells as empty, and the
+session drops the empty cells left over before saving (strip_empty_cells).
+"""
+from openpyxl.cell.cell import MergedCell
+
+
+def existing_cell(ws, row, column):
+    """The cell at (row, column) if the sheet has one, else None (never creates it)."""
+    return ws._cells.get((row, column))
+
+
+def cell_value(ws, row, column):
+    """Value of a cell, None for cells the sheet does not have."""
+    cell = ws._cells.get((row, column))
+    return None if cell is None else cell.value
+
+
+def iter_values(ws, min_row=None, max_row=None, min_col=None, max_col=None):
+    """
+    Rows of values like ws.iter_rows(values_only=True), same bounds and
+    defaults, without creating the missing cells of the rectangle.
+    """
+    if ws._current_row == 0 and not any([min_col, min_row, max_col, max_row]):
+        return
+    min_col = min_col or 1
+    min_row = min_row or 1
+    max_col = max_col or ws.max_column
+    max_row = max_row or ws.max_row
+    get = ws._cells.get
+    columns = range(min_col, max_col + 1)
+    for row in range(min_row, max_row + 1):
+        yield tuple(getattr(get((row, column)), "value", None) for column in columns)
+
+
+def append_row(ws, values):
+    """ws.append(values) without creating cells for the None values."""
+    ws.append({column: value for column, value in enumerate(values, start=1) if value is not None})
+
+
+def strip_empty_cells(ws):
+    """
+    Remove the cells of ws that hold nothing: no value, no style, no
+    comment, no hyperlink (they save to nothing anyway). Returns how many.
+    """
+    empty = [
+        key for key, cell in ws._cells.items()
+        if not isinstance(cell, MergedCell) and cell._value is None and not cell.has_style
+        and cell._comment is None and cell._hyperlink is None
+    ]
+    for key in empty:
+        del ws._cells[key]
+    return len(empty)
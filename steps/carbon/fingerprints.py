@@ -0,0 +1,179 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+
+from openpyxl.packaging.custom import StringProperty
+
+from steps.carbon.cells import iter_values
+from steps.carbon.raw_cache import sheet_key
+from steps.carbon.session import _as_saved
+from utils import cache_dir
+
+# Bump when a step's output changes for the same inputs, so old records stop matching
+FINGERPRINT_VERSION = 1
+
+# Custom document property holding the record of each step
+PROPERTY_PREFIX = "carbon.step"
+
+# Sheet each step builds; a step whose sheet is gone is never skipped
+OUTPUT_SHEETS = {1: "Data", 2: "To Sort", 3: "Last 6", 4: "Group", 5: "Summary"}
+
+# Step whose output each step reads (To Sort holds every Data row whatever
+# the filter, so Last 6 only depends on the rows, not on step 2's filter)
+INPUT_STEP = {2: 1, 3: 2, 4: 3, 5: 4}
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def sheet_digest(ws):
+    """Hash of the values of a worksheet, as they read back after a save."""
+    digest = hashlib.sha256()
+    for row in iter_values(ws):
+        digest.update(repr(tuple(_as_saved(v) for v in row)).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def digest_dir():
+    """MRSI_FINGERPRINT_DIR, else fingerprints in the tool's cache directory."""
+    return os.environ.get("MRSI_FINGERPRINT_DIR") or cache_dir("fingerprints")
+
+
+def _file_key(file_path, sheet_name):
+    """Content hash of sheet_name in the xlsx at file_path (raw_cache.sheet_key), None if unreadable."""
+    try:
+        return sheet_key(file_path, sheet_name, "fingerprint", FINGERPRINT_VERSION)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _load_digest(key):
+    try:
+        with open(os.path.join(digest_dir(), key), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _store_digest(key, digest):
+    directory = digest_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(digest)
+        os.replace(tmp, os.path.join(directory, key))
+    except OSError:
+        pass  # caching is best effort
+
+
+def remember_source(file_path, sheet_name, digest):
+    """
+    Record that sheet_name in the xlsx at file_path has the sheet_digest
+    `digest`, so the next run finds it by the file's content hash instead
+    of walking the sheet (called after saving the workbook).
+    """
+    key = _file_key(file_path, sheet_name)
+    if key is not None:
+        _store_digest(key, digest)
+
+
+class StepRecords:
+    """
+    What each Carbonate step was last built from, kept in the workbook as
+    custom document properties ("carbon.step1" ... "carbon.step5").
+
+    A record is "<lineage>:<params>". The lineage hashes the step's input
+    (the raw sheet for step 1, the lineage of INPUT_STEP otherwise, so steps
+    2-5 read no sheet at all); params hashes the options that only change
+    this step's own sheets (step 2's filter and views). A step can be
+    skipped when both match what a rebuild would use.
+
+    The raw sheet is identified by sheet_digest of its values. Walking it
+    costs about as much as parsing it, so the digest is also kept in a local
+    cache (digest_dir) under the content hash of the sheet in the file
+    (raw_cache.sheet_key), which only decompresses parts of the xlsx:
+    `file_path` is the file wb was loaded from (None for workbooks built in
+    memory), and after a save remember_source maps the saved file too.
+    """
+
+    def __init__(self, wb, file_path=None):
+        self.wb = wb
+        self.file_path = file_path
+        self._sources = {}  # sheet name -> sheet_digest
+        self.records = {}
+        for prop in wb.custom_doc_props.props:
+            if prop.name.startswith(PROPERTY_PREFIX):
+                step = prop.name[len(PROPERTY_PREFIX):]
+                lineage, _, params = str(prop.value).partition(":")
+                if step.isdigit():
+                    self.records[int(step)] = (lineage, params)
+
+    def expected(self, step, sheet_name, filter_choice, views=(), views_layout="sheets"):
+        """(lineage, params) step would be recorded with if it ran now."""
+        if step == 1:
+            if sheet_name not in self.wb.sheetnames:
+                return None, ""
+            source = self.source_digest(sheet_name)
+            lineage = _hash(FINGERPRINT_VERSION, 1, sheet_name, source)
+        else:
+            upstream = self.records.get(INPUT_STEP[step])
+            lineage = _hash(FINGERPRINT_VERSION, step, upstream[0] if upstream else None)
+        params = ""
+        if step == 2:
+            # runs without extra views keep the records they had before views existed
+            params = _hash(filter_choice, tuple(views), views_layout) if views else _hash(filter_choice)
+            params = params[:16]
+        return lineage, params
+
+    def source_digest(self, sheet_name, compute=True):
+        """
+        sheet_digest of sheet_name: found by the file's content hash, or
+        computed (and remembered for the file) unless compute is False, in
+        which case None is returned when it is not known yet.
+        """
+        digest = self._sources.get(sheet_name)
+        if digest is not None or sheet_name not in self.wb.sheetnames:
+            return digest
+        key = _file_key(self.file_path, sheet_name) if self.file_path else None
+        digest = _load_digest(key) if key is not None else None
+        if digest is None:
+            if not compute:
+                return None
+            digest = sheet_digest(self.wb[sheet_name])
+            if key is not None:
+                _store_digest(key, digest)
+        self._sources[sheet_name] = digest
+        return digest
+
+    def is_current(self, step, expected):
+        """True when step's sheet exists and was built from `expected`."""
+        return (
+            expected[0] is not None
+            and self.records.get(step) == expected
+            and OUTPUT_SHEETS[step] in self.wb.sheetnames
+        )
+
+    def forget(self, step):
+        """Drop the record of a step that is being rebuilt."""
+        self.records.pop(step, None)
+        self._write(step, None)
+
+    def record(self, step, expected):
+        """Record that step finished building from `expected`."""
+        self.records[step] = expected
+        self._write(step, f"{expected[0]}:{expected[1]}")
+
+    def _write(self, step, value):
+        props = self.wb.custom_doc_props
+        name = f"{PROPERTY_PREFIX}{step}"
+        props.props = [p for p in props.props if p.name != name]
+        if value is not None:
+            props.append(StringProperty(name=name, value=value))
@@ -0,0 +1,505 @@
+"""
+Small Excel formula evaluator for the formulas the Carbonate steps write.
+
+Supported: numbers, "strings", cell references ($ allowed) and A1:B2 ranges
+on the same sheet, + - * / ^ & and the comparison operators, and the
+functions ROUND, AVERAGE, STDEV, SUM, COUNT, IF, IFERROR, SLOPE, INTERCEPT.
+Results follow Excel's rules for blanks, text and errors closely enough that
+the values match what Excel caches for these sheets.
+"""
+import math
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from openpyxl.cell.rich_text import CellRichText
+from openpyxl.utils import column_index_from_string
+
+
+class ExcelError(str):
+    """An Excel error value such as #DIV/0! (stored as its text)."""
+
+
+DIV0 = ExcelError("#DIV/0!")
+VALUE = ExcelError("#VALUE!")
+NA = ExcelError("#N/A")
+REF = ExcelError("#REF!")
+NAME = ExcelError("#NAME?")
+
+
+class UnsupportedFormula(ValueError):
+    """Raised for formula syntax the evaluator does not understand."""
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+)
+  | (?P<func>[A-Za-z][A-Za-z0-9.]*(?=\())
+  | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<op><=|>=|<>|[-+*/^&=<>(),])
+""", re.VERBOSE)
+
+_REF_RE = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d+)")
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m:
+            raise UnsupportedFormula(f"Cannot parse formula near: {text[pos:]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind != "ws":
+            tokens.append((kind, m.group()))
+    return tokens
+
+
+def _parse_ref(text):
+    m = _REF_RE.fullmatch(text)
+    return int(m.group(2)), column_index_from_string(m.group(1).upper())
+
+
+class _Parser:
+    """Recursive-descent parser producing a tuple-based expression tree."""
+
+    _COMPARE = ("=", "<>", "<", ">", "<=", ">=")
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        tok = self.peek()
+        if tok[0] is None or (value is not None and tok[1] != value):
+            raise UnsupportedFormula(f"Expected {value!r}, got {tok[1]!r}")
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        node = self.comparison()
+        if self.peek()[0] is not None:
+            raise UnsupportedFormula(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def comparison(self):
+        node = self.concat()
+        while self.peek()[1] in self._COMPARE:
+            op = self.take()[1]
+            node = ("cmp", op, node, self.concat())
+        return node
+
+    def concat(self):
+        node = self.additive()
+        while self.peek()[1] == "&":
+            self.take()
+            node = ("concat", node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.term()
+        while self.peek()[1] in ("+", "-"):
+            op = self.take()[1]
+            node = ("arith", op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.power()
+        while self.peek()[1] in ("*", "/"):
+            op = self.take()[1]
+            node = ("arith", op, node, self.power())
+        return node
+
+    def power(self):
+        node = self.unary()
+        while self.peek()[1] == "^":
+            self.take()
+            node = ("arith", "^", node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek()[1] in ("-", "+"):
+            op = self.take()[1]
+            operand = self.unary()
+            return ("neg", operand) if op == "-" else operand
+        return self.primary()
+
+    def primary(self):
+        kind, text = self.take()
+        if kind == "number":
+            return ("const", float(text))
+        if kind == "string":
+            return ("const", text[1:-1].replace('""', '"'))
+        if kind == "ref":
+            return ("ref",) + _parse_ref(text)
+        if kind == "range":
+            first, last = text.split(":")
+            r1, c1 = _parse_ref(first)
+            r2, c2 = _parse_ref(last)
+            return ("range", min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2))
+        if kind == "func":
+            name = text.upper()
+            self.take("(")
+            args = []
+            if self.peek()[1] != ")":
+                args.append(self.comparison())
+                while self.peek()[1] == ",":
+                    self.take()
+                    args.append(self.comparison())
+            self.take(")")
+            return ("func", name, args)
+        if text == "(":
+            node = self.comparison()
+            self.take(")")
+            return node
+        raise UnsupportedFormula(f"Unexpected token {text!r}")
+
+
+def parse_formula(formula):
+    """Parse '=...' formula text into an expression tree."""
+    text = formula[1:] if formula.startswith("=") else formula
+    return _Parser(_tokenize(text)).parse()
+
+
+# --- value helpers ------------------------------------------------------------
+
+def plain_value(value):
+    """Normalise a stored cell value (NumPy numbers, NaN, rich text) for evaluation."""
+    if value is None or isinstance(value, (bool, str)):
+        if isinstance(value, str) and not isinstance(value, ExcelError) and value == "":
+            return None
+        return value
+    if isinstance(value, CellRichText):
+        return str(value) or None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    if math.isnan(number) or math.isinf(number):
+        return None
+    return number
+
+
+def to_number(value):
+    """Scalar coercion used by arithmetic and ROUND (blank -> 0, text -> #VALUE!)."""
+    if isinstance(value, ExcelError):
+        return value
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return VALUE
+    return VALUE
+
+
+def _to_bool(value):
+    if isinstance(value, ExcelError):
+        return value
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        return VALUE
+    return VALUE
+
+
+def excel_round(number, digits):
+    """ROUND with Excel's half-away-from-zero rule on 15 significant digits."""
+    digits = int(digits)
+    exact = Decimal("%.15g" % number)
+    quantum = Decimal(1).scaleb(-digits)
+    rounded = exact.quantize(quantum, rounding=ROUND_HALF_UP)
+    return float(rounded)
+
+
+def _compare(op, left, right):
+    def rank(v):
+        if isinstance(v, bool):
+            return 2
+        if isinstance(v, str):
+            return 1
+        return 0
+
+    # blanks compare as 0 against numbers and "" against text
+    if left is None:
+        left = "" if isinstance(right, str) else (False if isinstance(right, bool) else 0.0)
+    if right is None:
+        right = "" if isinstance(left, str) else (False if isinstance(left, bool) else 0.0)
+    if rank(left) != rank(right):
+        a, b = rank(left), rank(right)
+    elif isinstance(left, str):
+        a, b = left.lower(), right.lower()
+    else:
+        a, b = left, right
+    return {
+        "=": a == b, "<>": a != b, "<": a < b,
+        ">": a > b, "<=": a <= b, ">=": a >= b,
+    }[op]
+
+
+class FormulaEvaluator:
+    """
+    Evaluates formula cells of one worksheet on demand.
+
+    Referenced cells that hold formulas are evaluated recursively; every
+    result is memoised in `values` keyed by (row, column).
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.values = {}
+        self._in_progress = set()
+
+    def cell_value(self, row, column):
+        """Calculated value of a cell (None for blanks)."""
+        key = (row, column)
+        if key in self.values:
+            return self.values[key]
+        # look the cell up without ws.cell(), which would create empty cells
+        # (and grow max_row) for references just past the data
+        cell = self.ws._cells.get(key)
+        if cell is None:
+            return None
+        if cell.data_type == "e" and isinstance(cell.value, str):
+            return ExcelError(cell.value)  # an error value stored in the cell, e.g. #N/A
+        if cell.data_type != "f" or not isinstance(cell.value, str):
+            return plain_value(cell.value)
+        if key in self._in_progress:
+            return REF  # circular reference
+        self._in_progress.add(key)
+        try:
+            tree = parse_formula(cell.value)
+            result = self._eval(tree)
+            if isinstance(result, list):
+                result = VALUE
+            elif result is None:
+                result = 0.0  # a bare reference to a blank cell shows 0
+        finally:
+            self._in_progress.discard(key)
+        self.values[key] = result
+        return result
+
+    def evaluate(self, cells):
+        """Evaluate an iterable of (row, column) pairs; returns {(row, column): value}."""
+        return {key: self.cell_value(*key) for key in cells}
+
+    # --- expression tree ---
+
+    def _eval(self, node):
+        kind = node[0]
+        if kind == "const":
+            return node[1]
+        if kind == "ref":
+            return self.cell_value(node[1], node[2])
+        if kind == "range":
+            return self._range(node)
+        if kind == "neg":
+            value = to_number(self._scalar(node[1]))
+            return value if isinstance(value, ExcelError) else -value
+        if kind == "arith":
+            return self._arith(node[1], self._scalar(node[2]), self._scalar(node[3]))
+        if kind == "concat":
+            parts = [self._scalar(node[1]), self._scalar(node[2])]
+            for p in parts:
+                if isinstance(p, ExcelError):
+                    return p
+            return "".join(self._text(p) for p in parts)
+        if kind == "cmp":
+            left, right = self._scalar(node[2]), self._scalar(node[3])
+            for v in (left, right):
+                if isinstance(v, ExcelError):
+                    return v
+            return _compare(node[1], left, right)
+        if kind == "func":
+            handler = getattr(self, f"_fn_{node[1].replace('.', '_')}", None)
+            if handler is None:
+                return NAME
+            return handler(node[2])
+        raise UnsupportedFormula(f"Unknown node {kind!r}")
+
+    def _range(self, node):
+        _, r1, c1, r2, c2 = node
+        return [self.cell_value(r, c) for r in range(r1, r2 + 1) for c in range(c1, c2 + 1)]
+
+    def _scalar(self, node):
+        value = self._eval(node)
+        if isinstance(value, list):
+            return value[0] if len(value) == 1 else VALUE
+        if node[0] == "ref" and value is None:
+            return None
+        return value
+
+    @staticmethod
+    def _text(value):
+        if value is None:
+            return ""
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    @staticmethod
+    def _arith(op, left, right):
+        a, b = to_number(left), to_number(right)
+        for v in (a, b):
+            if isinstance(v, ExcelError):
+                return v
+        if op == "+":
+            return a + b
+        if op == "-":
+            return a - b
+        if op == "*":
+            return a * b
+        if op == "/":
+            return DIV0 if b == 0 else a / b
+        try:
+            return a ** b
+        except (OverflowError, ZeroDivisionError):
+            return DIV0
+
+    def _numbers(self, args):
+        """
+        Numbers taken by SUM/AVERAGE/STDEV/COUNT-style functions: from
+        references only real numbers count (text, blanks and booleans are
+        skipped); direct arguments are coerced. Returns a list or an error.
+        """
+        numbers = []
+        for arg in args:
+            value = self._eval(arg)
+            if arg[0] in ("ref", "range"):
+                values = value if isinstance(value, list) else [value]
+                for v in values:
+                    if isinstance(v, ExcelError):
+                        return v
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        numbers.append(float(v))
+            else:
+                if isinstance(value, list):
+                    return VALUE
+                number = to_number(value)
+                if isinstance(number, ExcelError):
+                    return number
+                numbers.append(number)
+        return numbers
+
+    # --- functions ---
+
+    def _fn_SUM(self, args):
+        numbers = self._numbers(args)
+        return numbers if isinstance(numbers, ExcelError) else sum(numbers)
+
+    def _fn_AVERAGE(self, args):
+        numbers = self._numbers(args)
+        if isinstance(numbers, ExcelError):
+            return numbers
+        return sum(numbers) / len(numbers) if numbers else DIV0
+
+    def _fn_STDEV(self, args):
+        numbers = self._numbers(args)
+        if isinstance(numbers, ExcelError):
+            return numbers
+        n = len(numbers)
+        if n < 2:
+            return DIV0
+        mean = sum(numbers) / n
+        return math.sqrt(sum((x - mean) ** 2 for x in numbers) / (n - 1))
+
+    def _fn_COUNT(self, args):
+        count = 0
+        for arg in args:
+            value = self._eval(arg)
+            values = value if isinstance(value, list) else [value]
+            for v in values:
+                if isinstance(v, ExcelError) or isinstance(v, bool) or v is None:
+                    continue
+                if isinstance(v, (int, float)):
+                    count += 1
+                elif arg[0] not in ("ref", "range") and not isinstance(to_number(v), ExcelError):
+                    count += 1
+        return float(count)
+
+    def _fn_ROUND(self, args):
+        if len(args) != 2:
+            return VALUE
+        number = to_number(self._scalar(args[0]))
+        digits = to_number(self._scalar(args[1]))
+        for v in (number, digits):
+            if isinstance(v, ExcelError):
+                return v
+        return excel_round(number, digits)
+
+    def _fn_IF(self, args):
+        if len(args) not in (2, 3):
+            return VALUE
+        condition = _to_bool(self._scalar(args[0]))
+        if isinstance(condition, ExcelError):
+            return condition
+        if condition:
+            return self._eval(args[1])
+        return self._eval(args[2]) if len(args) == 3 else False
+
+    def _fn_IFERROR(self, args):
+        if len(args) != 2:
+            return VALUE
+        value = self._eval(args[0])
+        if isinstance(value, list):
+            value = value[0] if len(value) == 1 else VALUE
+        return self._eval(args[1]) if isinstance(value, ExcelError) else value
+
+    def _pairs(self, args):
+        if len(args) != 2:
+            return VALUE
+        ys, xs = self._eval(args[0]), self._eval(args[1])
+        ys = ys if isinstance(ys, list) else [ys]
+        xs = xs if isinstance(xs, list) else [xs]
+        if len(ys) != len(xs):
+            return NA
+        pairs = []
+        for y, x in zip(ys, xs):
+            for v in (y, x):
+                if isinstance(v, ExcelError):
+                    return v
+            if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (y, x)):
+                pairs.append((float(y), float(x)))
+        return pairs
+
+    def _regression(self, args):
+        pairs = self._pairs(args)
+        if isinstance(pairs, ExcelError):
+            return pairs
+        if not pairs:
+            return DIV0
+        n = len(pairs)
+        mean_y = sum(y for y, _ in pairs) / n
+        mean_x = sum(x for _, x in pairs) / n
+        sxx = sum((x - mean_x) ** 2 for _, x in pairs)
+        if sxx == 0:
+            return DIV0
+        sxy = sum((x - mean_x) * (y - mean_y) for y, x in pairs)
+        slope = sxy / sxx
+        return slope, mean_y - slope * mean_x
+
+    def _fn_SLOPE(self, args):
+        result = self._regression(args)
+        return result if isinstance(result, ExcelError) else result[0]
+
+    def _fn_INTERCEPT(self, args):
+        result = self._regression(args)
+        return result if isinstance(result, ExcelError) else result[1]
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+from utils import cache_dir, normalize_name
+
+# Raw export columns step 1 copies into the Data sheet
+SOURCE_HEADERS = [
+    'Line', 'Time Code', 'Identifier 1', 'Comment', 'Identifier 2', 'Analysis',
+    'Preparation', 'Peak Nr', 'Rt', 'Ampl 44', 'Area All',
+    'd 13C/12C', 'd 18O/16O',
+]
+
+# Spellings of the source columns per instrument / export version. Names are
+# compared normalized (case and repeated spaces ignored), so only real
+# differences need listing. Add a profile when a new export layout shows up.
+EXPORT_PROFILES = {
+    "isodat_gas_bench": {
+        'Line': ['Line'],
+        'Time Code': ['Time Code'],
+        'Identifier 1': ['Identifier 1'],
+        'Comment': ['Comment'],
+        'Identifier 2': ['Identifier 2'],
+        'Analysis': ['Analysis'],
+        'Preparation': ['Preparation'],
+        'Peak Nr': ['Peak Nr', 'Peak Nr.'],
+        'Rt': ['Rt'],
+        'Ampl 44': ['Ampl 44', 'Ampl. 44'],
+        'Area All': ['Area All'],
+        'd 13C/12C': ['d 13C/12C'],
+        'd 18O/16O': ['d 18O/16O'],
+    },
+}
+
+# Changes whenever the rules above change, so stale compiled schemas are not reused
+SCHEMA_VERSION = hashlib.sha256(
+    json.dumps([1, SOURCE_HEADERS, EXPORT_PROFILES], sort_keys=True).encode()
+).hexdigest()[:16]
+
+
+class AmbiguousHeaderWarning(UserWarning):
+    """A source column was resolved by a loose match with more than one candidate."""
+
+
+# header signature -> compiled schema, for this process
+_compiled = {}
+
+
+def schema_dir():
+    """MRSI_HEADER_SCHEMA_DIR, else header_schemas in the tool's cache directory."""
+    return os.environ.get("MRSI_HEADER_SCHEMA_DIR") or cache_dir("header_schemas")
+
+
+def header_signature(columns):
+    """Key of a raw header row: the exact column names, in order."""
+    names = json.dumps([str(c) for c in columns])
+    return hashlib.sha256(f"{SCHEMA_VERSION}\0{names}".encode()).hexdigest()
+
+
+def compile_schema(columns):
+    """
+    Work out which raw column each source header reads from.
+
+    Per header, in order: an alias of the best matching export profile, the
+    name without spaces, then a column containing the header (or contained
+    in it). A loose match with several candidates keeps the first one, as
+    before, and is listed under "ambiguous". Returns a JSON-able dict with
+    "profile", "columns" ({header: column position or None}) and "ambiguous"
+    ({header: [candidate names]}).
+    """
+    norm = [normalize_name(c) for c in columns]
+
+    # profile whose aliases cover the most columns
+    def hits(profile):
+        aliases = {normalize_name(a) for names in EXPORT_PROFILES[profile].values() for a in names}
+        return sum(n in aliases for n in norm)
+    profile = max(EXPORT_PROFILES, key=hits)
+    aliases = EXPORT_PROFILES[profile]
+
+    positions = {}
+    ambiguous = {}
+    for h in SOURCE_HEADERS:
+        wanted = {normalize_name(a) for a in aliases.get(h, [])} | {normalize_name(h)}
+        exact = [i for i, n in enumerate(norm) if n in wanted]
+        if exact:
+            if len(exact) > 1:
+                ambiguous[h] = [str(columns[i]) for i in exact]
+            positions[h] = exact[0]
+            continue
+        # try a join-without-space match
+        nh = normalize_name(h)
+        nh_join = nh.replace(' ', '')
+        joined = [i for i, n in enumerate(norm) if n.replace(' ', '') == nh_join]
+        if joined:
+            if len(joined) > 1:
+                ambiguous[h] = [str(columns[i]) for i in joined]
+            positions[h] = joined[0]
+            continue
+        # fallback: one name contains the other
+        loose = [i for i, n in enumerate(norm)
+                 if nh in n or n in nh or nh_join in n.replace(' ', '')]
+        if len(loose) > 1:
+            ambiguous[h] = [str(columns[i]) for i in loose]
+        positions[h] = loose[0] if loose else None  # may be None if nothing matched
+    return {"profile": profile, "columns": positions, "ambiguous": ambiguous}
+
+
+def _load(signature):
+    path = os.path.join(schema_dir(), f"{signature}.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store(signature, schema):
+    directory = schema_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".json", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+        os.replace(tmp, os.path.join(directory, f"{signature}.json"))
+    except OSError:
+        pass  # caching is best effort
+
+
+def get_schema(columns):
+    """Compiled schema of a raw header row: from memory, from disk, or compiled now."""
+    signature = header_signature(columns)
+    schema = _compiled.get(signature)
+    if schema is None:
+        schema = _load(signature)
+        if schema is None:
+            schema = compile_schema(list(columns))
+            _store(signature, schema)
+        _compiled[signature] = schema
+    return schema
+
+
+def resolve_headers(headers, columns):
+    """
+    Map each of `headers` to the raw column it reads from (None for headers
+    that are not source columns or have no match). Ambiguous matches are
+    reported with an AmbiguousHeaderWarning.
+    """
+    columns = list(columns)
+    schema = get_schema(columns)
+    for h, candidates in schema["ambiguous"].items():
+        warnings.warn(
+            f"Column for '{h}' is ambiguous, using '{candidates[0]}' of {candidates}",
+            AmbiguousHeaderWarning, stacklevel=2)
+    positions = schema["columns"]
+    return {h: columns[positions[h]] if positions.get(h) is not None else None for h in headers}
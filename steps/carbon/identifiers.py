@@ -0,0 +1,72 @@
+"""
+What an `Identifier 1` value says about its row. classify parses each
+distinct identifier once and returns the same record for it afterwards,
+so grouping, sorting and the reference/aragonite checks of step 4 cost a
+cache lookup per row.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+from steps.carbon.normalization import REFERENCE_ROWS
+
+# "<base> r<major>[.<minor>]" at the end of an identifier
+_RUN_SUFFIX_RE = re.compile(r"\s*r\d+(\.\d+)?$", flags=re.IGNORECASE)
+# first r<major>[.<minor>] anywhere in it
+_RUN_RE = re.compile(r"r(\d+)(?:\.(\d+))?", flags=re.IGNORECASE)
+_NOT_ALNUM_RE = re.compile(r"[^A-Za-z0-9]+")
+
+# "N Arag" or "N. Arag" (optional dot, optional spaces) marks aragonite samples
+N_ARAG_RE = re.compile(r"\bn\.?\s*arag\b", flags=re.IGNORECASE)
+
+# Run number of identifiers without one (sorted last)
+NO_RUN = (9999, 0)
+
+
+def normalize_text(text):
+    """Letters and digits of text, lowercased ("NBS 18" -> "nbs18")."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    return _NOT_ALNUM_RE.sub("", text).lower().strip()
+
+
+# normalized name -> reference material key ("nbs18" -> "nbs 18")
+REFERENCE_KEYS = {normalize_text(key): key for key in REFERENCE_ROWS}
+
+
+class Identifier:
+    """
+    Parsed Identifier 1: `base` (the name without its run suffix), `key`
+    (normalized base, the group it belongs to), `run` ((major, minor),
+    NO_RUN without one), `reference` (reference material key of the
+    group, e.g. "nbs 18", or None) and `aragonite` (an "N Arag" sample).
+    """
+
+    __slots__ = ("base", "key", "run", "reference", "aragonite")
+
+    def __init__(self, base, key, run, reference, aragonite):
+        self.base = base
+        self.key = key
+        self.run = run
+        self.reference = reference
+        self.aragonite = aragonite
+
+    def __repr__(self):
+        return (f"Identifier(base={self.base!r}, key={self.key!r}, run={self.run!r}, "
+                f"reference={self.reference!r}, aragonite={self.aragonite!r})")
+
+
+@lru_cache(maxsize=1 << 16, typed=True)
+def classify(identifier):
+    """The Identifier record of an Identifier 1 cell value (any type, None too)."""
+    if not identifier or not isinstance(identifier, str):
+        base = ""
+        run = NO_RUN
+    else:
+        base = _RUN_SUFFIX_RE.sub("", identifier.strip()).strip()
+        m = _RUN_RE.search(identifier)
+        run = (int(m.group(1)), int(m.group(2)) if m.group(2) else 0) if m else NO_RUN
+    key = normalize_text(base)
+    aragonite = bool(N_ARAG_RE.search(str(identifier or "")))
+    return Identifier(base, key, run, REFERENCE_KEYS.get(key), aragonite)
@@ -0,0 +1,75 @@
+import contextlib
+import os
+import sys
+import time
+
+from steps.carbon.pipeline import run_pipeline
+from steps.carbon.profiling import RunProfile
+from steps.carbon.text_import import is_text_export, workbook_path_for
+
+
+def run_job(file_path, steps, sheet_name='Default_Gas_Bench.wke', filter_choice="Last 6",
+            engine="openpyxl", events=None, cancel=None, incremental=True, views=(),
+            views_layout="sheets", profile=False, trace_memory=False, cprofile_path=None,
+            streaming=False):
+    """
+    Run the Carbonate steps on one file, meant to be called in a worker process.
+
+    events: optional queue receiving (file_path, step, status, detail) for
+    every pipeline event (see run_pipeline; detail is the error text).
+    cancel: optional event; once set, the job stops before its next step.
+    incremental: skip steps whose inputs did not change (see run_pipeline).
+    views / views_layout: extra step 2 filter views (see run_pipeline).
+    streaming: step 1 replaces the workbook with Data and the raw values
+    only (see run_pipeline).
+    profile: time the run per step and phase; trace_memory adds peak memory
+    and cprofile_path a cProfile dump of the run (see profiling.RunProfile).
+
+    Never raises, so one bad file only fails its own job. Returns
+    {"file", "output", "ok", "cancelled", "steps", "error", "seconds"}, with
+    "steps" mapping each step ("1".."5") to "ok", "skipped" or the error text,
+    plus "profile" (RunProfile.report()) when profiling.
+    """
+    result = {"file": file_path, "output": None, "ok": False, "cancelled": False,
+              "steps": {}, "error": None}
+    start = time.perf_counter()
+    run_profile = None
+    if profile or trace_memory or cprofile_path:
+        run_profile = RunProfile(file_path, memory=trace_memory, cprofile_path=cprofile_path)
+
+    skipped = []
+
+    def on_event(step, status, detail):
+        if status == "cancelled":
+            result["cancelled"] = True
+        elif status == "skipped":
+            skipped.append(step)
+        if events is not None:
+            events.put((file_path, step, status, None if detail is None else str(detail)))
+
+    try:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        # keep stdout free for the caller (the CLI prints its summary there)
+        with contextlib.redirect_stdout(sys.stderr):
+            outcome = run_pipeline(file_path, steps, sheet_name, filter_choice, on_event=on_event,
+                                   stop_on_error=False, engine=engine,
+                                   should_stop=cancel.is_set if cancel is not None else None,
+                                   incremental=incremental, views=views,
+                                   views_layout=views_layout, profile=run_profile,
+                                   streaming=streaming)
+        result["steps"] = {str(step): "skipped" for step in skipped}
+        result["steps"].update(
+            (str(step), "ok" if err is None else f"{type(err).__name__}: {err}")
+            for step, err in outcome.items()
+        )
+        result["steps"] = dict(sorted(result["steps"].items()))
+        result["ok"] = not result["cancelled"] and all(err is None for err in outcome.values())
+        if any(err is None for err in outcome.values()) or (skipped and not outcome):
+            result["output"] = workbook_path_for(file_path) if is_text_export(file_path) else file_path
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    if run_profile is not None:
+        result["profile"] = run_profile.report()
+    return result
@@ -0,0 +1,107 @@
+"""
+Where step 4 put things in the Group sheet, kept in the workbook as hidden
+defined names scoped to the sheet:
+
+    Carbon.Divider             'Group'!$120:$121      the 2-row dark gray divider
+    Carbon.Group.<name>        'Group'!$A$19:$X$24    rows of each group (normalized name)
+    Carbon.Average.<material>  'Group'!$R$26:$W$26    Average row the blue box reads
+    Carbon.Normalized.<column> 'Group'!$Z:$Z          column of each NORMALIZED_COLUMNS value
+
+Step 5 and the blue box look positions up here instead of scanning the
+sheet. Excel moves the names along when rows or columns are inserted, and
+a name whose cells were deleted (#REF!) is simply not there; callers fall
+back to scanning for anything missing, as for files from older versions.
+"""
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.workbook.defined_name import DefinedName
+
+PREFIX = "Carbon."
+
+
+def _slug(text):
+    """Part of a defined name for text ("nbs 18" -> "nbs18", "d13C VPDB" -> "d13C_VPDB")."""
+    return "_".join(str(text).split()) or "_"
+
+
+def _bounds(defined_name, sheet_title):
+    """(min_col, min_row, max_col, max_row) a name points at in the sheet, or None."""
+    try:
+        destinations = list(defined_name.destinations)
+        if len(destinations) != 1 or destinations[0][0] != sheet_title:
+            return None
+        return range_boundaries(destinations[0][1])
+    except Exception:
+        return None
+
+
+class GroupLayout:
+    """
+    Layout of a Group sheet: `divider_row` (first row of the divider, or
+    None), `groups` ({normalized name: (first row, last row)} in sheet
+    order), `average_rows` ({reference key: Average values row}) and
+    `normalized_columns` ({NORMALIZED_COLUMNS name: column index}).
+    """
+
+    def __init__(self, divider_row=None, groups=None, average_rows=None, normalized_columns=None):
+        self.divider_row = divider_row
+        self.groups = dict(groups or {})
+        self.average_rows = dict(average_rows or {})
+        self.normalized_columns = dict(normalized_columns or {})
+
+    def save(self, ws):
+        """Record the layout in ws's defined names, replacing any earlier one."""
+        for name in [n for n in ws.defined_names if n.startswith(PREFIX)]:
+            del ws.defined_names[name]
+        sheet = "'{}'!".format(ws.title.replace("'", "''"))
+
+        def add(name, ref):
+            ws.defined_names.add(DefinedName(PREFIX + name, attr_text=sheet + ref, hidden=True))
+
+        if self.divider_row is not None:
+            add("Divider", f"${self.divider_row}:${self.divider_row + 1}")
+        for norm, (first, last) in self.groups.items():
+            add(f"Group.{_slug(norm)}", f"$A${first}:$X${last}")
+        for key, row in self.average_rows.items():
+            add(f"Average.{_slug(key)}", f"$R${row}:$W${row}")
+        for column_name, column in self.normalized_columns.items():
+            letter = get_column_letter(column)
+            add(f"Normalized.{_slug(column_name)}", f"${letter}:${letter}")
+
+    @classmethod
+    def load(cls, ws, reference_keys=(), column_names=()):
+        """
+        Layout recorded in ws, or None when it has none. Average rows and
+        normalized columns are only looked up for the given reference keys
+        and NORMALIZED_COLUMNS names (the names have no spaces).
+        """
+        names = {n: d for n, d in ws.defined_names.items() if n.startswith(PREFIX)}
+        if not names:
+            return None
+        layout = cls()
+
+        divider = names.get(PREFIX + "Divider")
+        bounds = _bounds(divider, ws.title) if divider is not None else None
+        if bounds is not None and bounds[1] is not None:
+            layout.divider_row = bounds[1]
+
+        groups = []
+        for name, defined_name in names.items():
+            if name.startswith(PREFIX + "Group."):
+                bounds = _bounds(defined_name, ws.title)
+                if bounds is not None and bounds[1] is not None:
+                    groups.append((bounds[1], bounds[3], name[len(PREFIX + "Group."):]))
+        layout.groups = {norm: (first, last) for first, last, norm in sorted(groups)}
+
+        for key in reference_keys:
+            defined_name = names.get(f"{PREFIX}Average.{_slug(key)}")
+            bounds = _bounds(defined_name, ws.title) if defined_name is not None else None
+            if bounds is not None and bounds[1] is not None:
+                layout.average_rows[key] = bounds[1]
+
+        for column_name in column_names:
+            defined_name = names.get(f"{PREFIX}Normalized.{_slug(column_name)}")
+            bounds = _bounds(defined_name, ws.title) if defined_name is not None else None
+            if bounds is not None and bounds[0] is not None:
+                layout.normalized_columns[column_name] = bounds[0]
+        return layout
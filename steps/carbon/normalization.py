@@ -0,0 +1,206 @@
+"""
+Reference normalization of the Group sheet, computed with NumPy.
+
+Step 4 writes the normalization as formulas: averages of each reference
+group, the measured averages of the reference materials (K/N 5-8), the
+SLOPE/INTERCEPT of published against measured values (K/N 10-11) and the
+normalized values of every sample row (Z, AC, AE, AG, AH). The functions
+here compute the same numbers with Excel's rules (blanks, text, IFERROR,
+ROUND half away from zero), so they can be cached with the formulas.
+"""
+import numpy as np
+from openpyxl.cell.cell import ERROR_CODES
+
+from steps.carbon.formulas import DIV0, ExcelError, excel_round, plain_value, to_number
+
+# Reference materials of the normalization box, in box order: row of the
+# box (C/F/G/K/N 5-8) and published values vs. VPDB (δ13C, δ18O). LSVEC
+# has no published VPDB values in F/G, so it does not enter the regression.
+REFERENCE_ROWS = {
+    "iaea 603": 5,
+    "lsvec": 6,
+    "nbs 18": 7,
+    "nbs 19": 8,
+}
+PUBLISHED_VPDB = {
+    "iaea 603": (2.46, -2.37),
+    "lsvec": (None, None),
+    "nbs 18": (-5.01, -23.01),
+    "nbs 19": (1.95, -2.2),
+}
+
+# δ18O aragonite correction (Kim et al. 2015): slope, intercept (O10/O11)
+ARAGONITE = (0.992, -16.893)
+
+# δ18O VPDB -> VSMOW: factor, offset
+VSMOW = (1.03092, 30.92)
+
+# Columns of normalized_frame
+NORMALIZED_COLUMNS = [
+    "d13C VPDB", "d18O VPDB", "d18O VPDB aragonite", "d18O VSMOW", "d18O VSMOW aragonite",
+]
+
+
+def _sum(values):
+    # running sum, left to right like Excel's (np.sum adds in pairs)
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+def _numbers(values):
+    """
+    Numbers AVERAGE/STDEV/COUNT take from referenced cells: real numbers
+    only; blanks, text and booleans are skipped. Returns (numbers, the
+    first error value or None): an error in the range is the result of
+    AVERAGE and STDEV, while COUNT skips it. openpyxl keeps any error code
+    written to a cell as an error cell, so error codes count as errors.
+    """
+    numbers = []
+    error = None
+    for v in values:
+        if isinstance(v, str) and v in ERROR_CODES:
+            error = error or ExcelError(v)
+            continue
+        v = plain_value(v)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            numbers.append(v)
+    return np.array(numbers, dtype=np.float64), error
+
+
+def group_statistics(values):
+    """
+    (ROUND(AVERAGE), ROUND(STDEV), ROUND(COUNT)) to 3 digits of the cell
+    values of one reference group column, as its Average row shows them.
+    """
+    numbers, error = _numbers(values)
+    n = len(numbers)
+    if error is not None:
+        return error, error, excel_round(float(n), 3)
+    if n == 0:
+        return DIV0, DIV0, 0.0
+    mean = _sum(numbers) / n
+    if n < 2:
+        stdev = DIV0
+    else:
+        deviations = numbers - mean
+        stdev = excel_round(float(np.sqrt(_sum(deviations * deviations) / (n - 1))), 3)
+    return excel_round(mean, 3), stdev, excel_round(float(n), 3)
+
+
+def measured_values(references):
+    """
+    Measured δ13C/δ18O of each reference material: `references` are
+    (reference key, C average, O average) of the reference groups in sheet
+    order, the key None for groups of no material (CO2); the first group of
+    each material is used. Returns {reference
+    key: (K value, N value)}, "" where the average is an error.
+    """
+    measured = {}
+    for key, c_avg, o_avg in references:
+        if key is None or key in measured:
+            continue
+        values = []
+        for avg in (c_avg, o_avg):
+            avg = to_number(plain_value(avg))
+            values.append("" if isinstance(avg, ExcelError) else excel_round(avg, 3))
+        measured[key] = tuple(values)
+    return measured
+
+
+def regression(measured, isotope):
+    """
+    (slope, intercept) of published against measured values of `isotope`
+    (0 = δ13C, 1 = δ18O) over the reference materials in `measured`.
+    None for both when fewer than two materials were measured (the cells
+    stay empty), "" when Excel's SLOPE/INTERCEPT would fail.
+    """
+    if len(measured) < 2:
+        return None, None
+    pairs = [
+        (PUBLISHED_VPDB[key][isotope], measured[key][isotope])
+        for key in REFERENCE_ROWS
+        if key in measured
+    ]
+    pairs = np.array([
+        (y, x) for y, x in pairs
+        if isinstance(y, float) and isinstance(x, float)
+    ], dtype=np.float64).reshape(-1, 2)
+    n = len(pairs)
+    if n == 0:
+        return "", ""
+    ys, xs = pairs[:, 0], pairs[:, 1]
+    mean_y = _sum(ys) / n
+    mean_x = _sum(xs) / n
+    dx = xs - mean_x
+    sxx = _sum(dx * dx)
+    if sxx == 0:
+        return "", ""
+    slope = _sum(dx * (ys - mean_y)) / sxx
+    return slope, mean_y - slope * mean_x
+
+
+def _as_numbers(values):
+    """Values as arithmetic takes them (blank -> 0, numeric text -> number), NaN for errors."""
+    numbers = [to_number(v) for v in values]
+    return np.array([np.nan if isinstance(v, ExcelError) else v for v in numbers], dtype=np.float64)
+
+
+def normalize(values, slope, intercept):
+    """
+    IFERROR(ROUND(slope * value + intercept, 2), "") for each of `values`,
+    slope and intercept as returned by regression. Cell values must be
+    passed through formulas.plain_value first; "" (the result of an
+    IFERROR) is text, not a blank, and makes the result "".
+    """
+    factors = [to_number(v) for v in (slope, intercept)]
+    if any(isinstance(f, ExcelError) for f in factors):
+        return [""] * len(values)
+    with np.errstate(invalid="ignore", over="ignore"):
+        results = factors[0] * _as_numbers(values) + factors[1]
+    return ["" if not np.isfinite(v) else excel_round(v, 2) for v in results.tolist()]
+
+
+def normalize_references(references, samples, aragonite):
+    """
+    Run the whole normalization. `references` are (reference key, C values,
+    O values) of the reference groups in sheet order, `samples` the C and O
+    values (R/U) of the sample rows and `aragonite` a flag per sample row.
+
+    Returns a dict: "statistics" (per reference group, the group_statistics
+    of C and O), "measured" (see measured_values), "carbon" and "oxygen"
+    (slope, intercept) and "normalized" ({column of NORMALIZED_COLUMNS:
+    list of values, None where the sheet has no formula}).
+    """
+    statistics = [(group_statistics(c), group_statistics(o)) for _, c, o in references]
+    measured = measured_values(
+        (key, c_stats[0], o_stats[0])
+        for (key, _, _), (c_stats, o_stats) in zip(references, statistics)
+    )
+    carbon = regression(measured, 0)
+    oxygen = regression(measured, 1)
+
+    c_values = [plain_value(c) for c, _ in samples]
+    o_values = [plain_value(o) for _, o in samples]
+    aragonite = np.asarray(aragonite, dtype=bool).reshape(-1)
+    vpdb_c = normalize(c_values, *carbon)
+    vpdb_o = normalize(o_values, *oxygen)
+    vpdb_arag = normalize(o_values, *ARAGONITE)
+    vsmow = normalize(vpdb_o, *VSMOW)
+    vsmow_arag = normalize(vpdb_arag, *VSMOW)
+
+    def only(values, rows):
+        return [v if keep else None for v, keep in zip(values, rows)]
+
+    normalized = {
+        "d13C VPDB": vpdb_c,
+        "d18O VPDB": vpdb_o,
+        "d18O VPDB aragonite": only(vpdb_arag, aragonite),
+        "d18O VSMOW": only(vsmow, ~aragonite),
+        "d18O VSMOW aragonite": only(vsmow_arag, aragonite),
+    }
+    return {
+        "statistics": statistics,
+        "measured": measured,
+        "carbon": carbon,
+        "oxygen": oxygen,
+        "normalized": normalized,
+    }
@@ -0,0 +1,180 @@
+from contextlib import nullcontext
+
+from steps.carbon.fingerprints import INPUT_STEP, OUTPUT_SHEETS, StepRecords, remember_source
+from steps.carbon.profiling import file_size, sheet_cells
+from steps.carbon.session import CarbonSession
+from steps.carbon.step1_data import build_data_from_text, build_data_sheet, write_data_workbook
+from steps.carbon.step2_tosort import build_to_sort
+from steps.carbon.step3_last6 import build_last6
+from steps.carbon.step4_group import build_group
+from steps.carbon.step5_summary import build_summary
+from steps.carbon.text_import import is_text_export, open_text_export
+
+# step number -> display name used in logs
+STEP_NAMES = {
+    1: "DATA",
+    2: "TO SORT",
+    3: "LAST 6",
+    4: "GROUP",
+    5: "SUMMARY",
+}
+
+
+def run_pipeline(file_path, steps=(1, 2, 3, 4, 5), sheet_name='Default_Gas_Bench.wke',
+                 filter_choice="Last 6", on_event=None, stop_on_error=True, engine="openpyxl",
+                 should_stop=None, incremental=True, views=(), views_layout="sheets", profile=None,
+                 streaming=False):
+    """
+    Runs the selected Carbonate steps on one workbook with a single load and a
+    single save. The live workbook and the tables each step produces are handed
+    from step to step through a CarbonSession.
+
+    on_event(step, status, detail) is called with status "start", "done" or
+    "error" (detail is the exception). With stop_on_error=True the first
+    failing step ends the run: the steps finished before it are saved with
+    their records, then its exception is re-raised. With stop_on_error=False
+    a failing step is reported and the remaining steps still run, like the
+    GUI always did.
+
+    should_stop() is asked before each step; once it returns True the
+    remaining steps are not run (on_event gets status "cancelled" for the
+    first of them) and the steps already finished are still saved.
+
+    With incremental=True a step is skipped (status "skipped") when the
+    workbook records that its sheet was built from the same inputs: the raw
+    sheet and sheet_name for step 1, the previous step's output plus the
+    filter for step 2 (see fingerprints.StepRecords). Records are only
+    written for steps that finished, so re-running after a failure resumes
+    from the first step that did not.
+
+    views / views_layout make step 2 build further filter views in the same
+    pass (see step2_tosort.build_to_sort).
+
+    profile: optional profiling.RunProfile; the run is timed into it per step
+    and phase (load, transform, style, recalc, save), with the cells each
+    step read and wrote and the size of the saved file.
+
+    engine selects how step 1 reads the raw sheet (see step1_data.ENGINES).
+    A .csv/.txt instrument export is parsed directly and the result is saved
+    as a new workbook next to it, '<name>.carbon.xlsx'
+    (text_import.workbook_path_for), never over an existing '<name>.xlsx'.
+
+    streaming=True runs step 1 as step1_data.write_data_workbook before the
+    workbook is loaded: the file is REPLACED by a new workbook holding only
+    Data and the raw sheet's values. Its other sheets, formatting and step
+    records are gone, so step 1 is never skipped and later steps rebuild
+    from scratch. It does not apply to .csv/.txt exports.
+
+    Returns {step: None or exception} for every step that was run (skipped
+    steps are not included).
+    """
+    runners = {
+        1: lambda s: build_data_sheet(s, sheet_name, engine),
+        2: lambda s: build_to_sort(s, filter_choice, views, views_layout),
+        3: build_last6,
+        4: build_group,
+        5: build_summary,
+    }
+
+    def notify(step, status, detail=None):
+        if profile is not None:
+            profile.status(step, status)
+        if on_event is not None:
+            on_event(step, status, detail)
+
+    def phase(name):
+        return profile.phase(name) if profile is not None else nullcontext()
+
+    if profile is not None:
+        profile.start()
+    try:
+        steps = sorted(set(steps))
+        if streaming and 1 in steps and not is_text_export(file_path):
+            steps.remove(1)
+            if should_stop is not None and should_stop():
+                notify(1, "cancelled")
+                return {}
+            notify(1, "start")
+            try:
+                if profile is None:
+                    write_data_workbook(file_path, sheet_name, engine=engine)
+                else:
+                    with profile.step(1, STEP_NAMES[1]), profile.phase("transform"):
+                        write_data_workbook(file_path, sheet_name, engine=engine)
+            except Exception as e:
+                notify(1, "error", e)
+                if stop_on_error:
+                    raise
+                # the file was left as it was: nothing for the other steps to build on
+                return {1: e}
+            notify(1, "done")
+            streamed = {1: None}
+            if not steps:
+                # already saved; loading it again would only rewrite it
+                if profile is not None:
+                    profile.bytes_saved = file_size(file_path)
+                print(f"Carbonate steps 1 completed on {file_path}")
+                return streamed
+        else:
+            streamed = {}
+
+        with phase("load"):
+            if is_text_export(file_path):
+                session, raw_df = open_text_export(file_path, sheet_name)
+                runners[1] = lambda s: build_data_from_text(s, raw_df, sheet_name)
+                loaded_from = None  # built in memory
+            else:
+                session = CarbonSession(file_path)
+                loaded_from = file_path
+        session.profile = profile
+        records = StepRecords(session.wb, loaded_from)
+        results = dict(streamed)
+        failure = None
+        for step in steps:
+            if should_stop is not None and should_stop():
+                notify(step, "cancelled")
+                break
+            expected = records.expected(step, sheet_name, filter_choice, views, views_layout)
+            if incremental and records.is_current(step, expected):
+                notify(step, "skipped")
+                continue
+            notify(step, "start")
+            records.forget(step)
+            try:
+                if profile is None:
+                    runners[step](session)
+                else:
+                    input_sheet = sheet_name if step == 1 else OUTPUT_SHEETS[INPUT_STEP[step]]
+                    cells_read = sheet_cells(session.wb, input_sheet)
+                    with profile.step(step, STEP_NAMES[step]), profile.phase("transform"):
+                        runners[step](session)
+                    profile.cells(step, read=cells_read, written=sheet_cells(session.wb, OUTPUT_SHEETS[step]))
+            except Exception as e:
+                results[step] = e
+                notify(step, "error", e)
+                if stop_on_error:
+                    failure = e
+                    break
+                continue
+            records.record(step, expected)
+            results[step] = None
+            notify(step, "done")
+
+        if any(err is None for err in results.values()):
+            # the save rewrites the raw sheet's part too: map the new file to its digest
+            source = records.source_digest(sheet_name, compute=False)
+            with phase("save"):
+                session.save()
+            if source is not None:
+                remember_source(session.file_path, sheet_name, source)
+            if profile is not None:
+                profile.bytes_saved = file_size(session.file_path)
+            written = f" (written from {file_path})" if session.file_path != file_path else ""
+            print(f"Carbonate steps {', '.join(str(s) for s in sorted(results))} completed on {session.file_path}{written}")
+        if failure is not None:
+            # raised only now, so the steps before it are not lost
+            raise failure
+        return results
+    finally:
+        if profile is not None:
+            profile.stop()
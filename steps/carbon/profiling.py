@@ -0,0 +1,184 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Phases a run is split into; "transform" is a step's own work, the others
+# are timed separately even when they happen inside a step
+PHASES = ("load", "transform", "style", "recalc", "save")
+
+
+def _new_totals():
+    return {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": None}
+
+
+class RunProfile:
+    """
+    Wall time, CPU time and peak memory of one Carbonate run, per step and
+    per phase (see PHASES), plus the cells each step read and wrote and the
+    size of the saved file. report() returns it all as a JSON-able dict.
+
+    Phases nest: time spent in a phase opened inside another one (e.g. a
+    "recalc" inside a step's "transform") only counts for the inner one.
+    Peak memory is only measured with memory=True, which traces every
+    allocation with tracemalloc and slows the run down noticeably.
+    With cprofile_path set, the run is also profiled with cProfile and the
+    stats are written there (readable with pstats or snakeviz).
+    """
+
+    def __init__(self, file_path, memory=False, cprofile_path=None):
+        self.file_path = file_path
+        self.memory = memory
+        self.cprofile_path = cprofile_path
+        self.wall = None
+        self.cpu = None
+        self.peak_bytes = None
+        self.bytes_saved = None
+        self.run_phases = {}  # phases outside any step
+        self.steps = {}
+        self._step = None
+        self._stack = []
+        self._started = None
+        self._clock = None
+        self._profiler = None
+        self._tracing = False
+
+    # --- run -----------------------------------------------------------------
+
+    def start(self):
+        self._started = datetime.now()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.cprofile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._clock = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        self.wall = time.perf_counter() - self._clock[0]
+        self.cpu = time.process_time() - self._clock[1]
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.cprofile_path)
+            self._profiler = None
+        if self.memory and tracemalloc.is_tracing():
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    # --- steps and phases ----------------------------------------------------
+
+    def _record(self, step):
+        return self.steps.setdefault(step, {
+            "step": step, "name": None, "status": None,
+            "cells_read": None, "cells_written": None, "phases": {},
+        })
+
+    @contextmanager
+    def step(self, step, name):
+        """Attribute the phases opened inside to `step`."""
+        self._record(step)["name"] = name
+        self._step = step
+        try:
+            yield
+        finally:
+            self._step = None
+
+    def status(self, step, status):
+        """Record the pipeline status of a step ("done", "error", "skipped", ...)."""
+        self._record(step)["status"] = status
+
+    def cells(self, step, read=None, written=None):
+        """Record how many cells step read and wrote."""
+        record = self._record(step)
+        record["cells_read"] = read
+        record["cells_written"] = written
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase of the current step (or of the run, outside steps)."""
+        if self._stack:
+            self._collect_peak(self._stack[-1])
+        frame = {"child_wall": 0.0, "child_cpu": 0.0, "peak": 0}
+        self._stack.append(frame)
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+            self._stack.pop()
+            self._collect_peak(frame)
+            phases = self._record(self._step)["phases"] if self._step is not None else self.run_phases
+            totals = phases.setdefault(name, _new_totals())
+            totals["calls"] += 1
+            totals["wall"] += wall - frame["child_wall"]
+            totals["cpu"] += cpu - frame["child_cpu"]
+            if tracemalloc.is_tracing():
+                totals["peak_bytes"] = max(totals["peak_bytes"] or 0, frame["peak"])
+            if self._stack:
+                parent = self._stack[-1]
+                parent["child_wall"] += wall
+                parent["child_cpu"] += cpu
+                parent["peak"] = max(parent["peak"], frame["peak"])
+
+    def _collect_peak(self, frame):
+        # fold the peak since the last reset into `frame`, then start over
+        if tracemalloc.is_tracing():
+            frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+    # --- output --------------------------------------------------------------
+
+    def report(self):
+        """The profile as a JSON-able dict."""
+        def rounded(totals):
+            return dict(totals, wall=round(totals["wall"], 4), cpu=round(totals["cpu"], 4))
+
+        steps = []
+        for step in sorted(self.steps):
+            record = self.steps[step]
+            phases = record["phases"]
+            peaks = [p["peak_bytes"] for p in phases.values() if p["peak_bytes"] is not None]
+            steps.append(dict(
+                record,
+                wall=round(sum(p["wall"] for p in phases.values()), 4),
+                cpu=round(sum(p["cpu"] for p in phases.values()), 4),
+                peak_bytes=max(peaks) if peaks else None,
+                phases={name: rounded(p) for name, p in phases.items()},
+            ))
+        return {
+            "file": self.file_path,
+            "started": self._started.isoformat(timespec="seconds") if self._started else None,
+            "wall": round(self.wall, 4) if self.wall is not None else None,
+            "cpu": round(self.cpu, 4) if self.cpu is not None else None,
+            "peak_bytes": self.peak_bytes,
+            "bytes_saved": self.bytes_saved,
+            "phases": {name: rounded(p) for name, p in self.run_phases.items()},
+            "steps": steps,
+            "cprofile": self.cprofile_path,
+        }
+
+    def write(self, path):
+        """Write report() as JSON to path."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+
+def sheet_cells(wb, sheet_name):
+    """Number of cells a worksheet holds (0 when it does not exist)."""
+    if sheet_name not in wb.sheetnames:
+        return 0
+    return len(wb[sheet_name]._cells)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from steps.carbon.xlsx_reader import sheet_xml_path
+from utils import cache_dir
+
+# Bump when the on-disk layout or the parsed result changes
+CACHE_VERSION = 1
+
+# Size cap of the default cache; MRSI_RAW_CACHE_MB overrides it (0 disables the cache)
+DEFAULT_MAX_MB = 512
+
+# Parts besides the sheet XML that its cell values depend on
+_SHARED_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml")
+
+# value kinds of object columns
+_NA, _STR, _INT, _FLOAT, _BOOL, _DATETIME = range(6)
+
+
+def default_cache_dir():
+    """MRSI_RAW_CACHE_DIR, else raw_cache in the tool's cache directory."""
+    return os.environ.get("MRSI_RAW_CACHE_DIR") or cache_dir("raw_cache")
+
+
+def default_cache():
+    """The cache step 1 uses, or None when MRSI_RAW_CACHE_MB is 0."""
+    max_mb = float(os.environ.get("MRSI_RAW_CACHE_MB", DEFAULT_MAX_MB))
+    if max_mb <= 0:
+        return None
+    return RawTableCache(default_cache_dir(), max_bytes=int(max_mb * 1024 * 1024))
+
+
+def sheet_key(file_path, sheet_name, *extra):
+    """
+    Content hash of `sheet_name` in an xlsx: SHA-256 over its worksheet XML
+    part plus the shared strings and styles it refers to, and `extra`
+    (anything else the parsed result depends on, e.g. the reader used).
+    Only decompresses the parts; nothing is parsed.
+    """
+    digest = hashlib.sha256(f"{CACHE_VERSION}\0{sheet_name}\0{extra!r}".encode())
+    with zipfile.ZipFile(file_path) as zf:
+        names = set(zf.namelist())
+        for part in (sheet_xml_path(zf, sheet_name),) + _SHARED_PARTS:
+            digest.update(f"\0{part}\0".encode())
+            if part not in names:
+                continue
+            with zf.open(part) as src:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RawTableCache:
+    """
+    Parsed raw tables on disk, one directory per key with one file per
+    column: numeric, boolean and datetime columns as uncompressed .npy, so
+    they load memory-mapped, and text/mixed columns as .npz of each value's
+    kind and value, so every value comes back with its Python type. Entries
+    are evicted least recently used first once the cache grows past
+    max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """The cached DataFrame for `key`, or None."""
+        entry = self._entry(key)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            data = {}
+            for i, column in enumerate(meta["columns"]):
+                data[column["name"]] = _load_column(entry, i, column)
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            # a hit counts as a use for the LRU order
+            os.utime(meta_path)
+        except OSError:
+            pass  # evicted meanwhile by another process, or a read-only cache
+        return pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]))
+
+    def put(self, key, df):
+        """
+        Store `df` under `key` (columns must have unique names), then evict.
+        Never raises for the cache's own sake: a table that cannot be stored
+        is simply not cached.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        except OSError:
+            return  # the cache directory cannot be created or written to
+        try:
+            columns = []
+            for i, name in enumerate(df.columns):
+                columns.append(_save_column(tmp, i, name, df[name]))
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"rows": len(df), "columns": columns}, f)
+            os.replace(tmp, self._entry(key))
+        except (OSError, TypeError):
+            # another process stored the same key first, the disk is full or a
+            # value has no cached representation: just don't cache this table
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+        Entries that disappear meanwhile (another process evicting the same
+        cache) are skipped.
+        """
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith("."):
+                continue
+            entry = self._entry(name)
+            try:
+                mtime = os.path.getmtime(os.path.join(entry, "meta.json"))
+                size = sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+            except OSError:
+                continue
+            entries.append((mtime, size, entry))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def _save_column(entry, i, name, series):
+    """Write one column as <i>.npy (text/mixed columns as <i>.npz of kinds/text/numbers); returns its metadata."""
+    column = {"name": name, "dtype": str(series.dtype)}
+    values = series.to_numpy()
+    if values.dtype != object and series.dtype.kind in "iufbM":
+        column["layout"] = "array"
+        np.save(os.path.join(entry, f"{i}.npy"), values)
+        return column
+
+    # mixed/text column: keep every value's Python type
+    values = series.to_numpy(dtype=object)
+    kinds = np.zeros(len(values), dtype=np.uint8)
+    text = np.zeros(len(values), dtype=object)
+    ints = np.zeros(len(values), dtype=np.int64)
+    floats = np.zeros(len(values), dtype=np.float64)
+    for j, value in enumerate(values):
+        if isinstance(value, str):
+            kinds[j], text[j] = _STR, value
+        elif isinstance(value, (bool, np.bool_)):
+            kinds[j], ints[j] = _BOOL, int(value)
+        elif isinstance(value, (int, np.integer)):
+            kinds[j], ints[j] = _INT, int(value)
+        elif isinstance(value, (float, np.floating)):
+            if np.isnan(value):
+                kinds[j] = _NA
+            else:
+                kinds[j], floats[j] = _FLOAT, float(value)
+        elif isinstance(value, datetime):
+            kinds[j], text[j] = _DATETIME, value.isoformat()
+        elif value is None or value is pd.NA or value is pd.NaT:
+            kinds[j] = _NA
+        else:
+            raise TypeError(f"Cannot cache value {value!r} of column {name!r}")
+    text = np.array(["" if t == 0 else t for t in text], dtype=str)
+    column["layout"] = "mixed"
+    np.savez(os.path.join(entry, f"{i}.npz"), kinds=kinds, text=text, ints=ints, floats=floats)
+    return column
+
+
+def _load_column(entry, i, column):
+    if column["layout"] == "array":
+        return np.load(os.path.join(entry, f"{i}.npy"), mmap_mode="r")
+    with np.load(os.path.join(entry, f"{i}.npz")) as parts:
+        kinds, text, ints, floats = parts["kinds"], parts["text"], parts["ints"], parts["floats"]
+        decode = {
+            _NA: lambda j: np.nan,
+            _STR: lambda j: str(text[j]),
+            _INT: lambda j: int(ints[j]),
+            _FLOAT: lambda j: float(floats[j]),
+            _BOOL: lambda j: bool(ints[j]),
+            _DATETIME: lambda j: datetime.fromisoformat(str(text[j])),
+        }
+        values = np.empty(len(kinds), dtype=object)
+        values[:] = [decode[kind](j) for j, kind in enumerate(kinds)]
+    # an explicit object dtype, else pandas would infer str for text values
+    series = pd.Series(values, dtype=object, copy=False)
+    if column["dtype"] != "object":
+        series = series.astype(column["dtype"])
+    return series
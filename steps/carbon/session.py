@@ -0,0 +1,316 @@
+import math
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import openpyxl.worksheet._writer as _ws_writer
+from openpyxl import load_workbook
+from openpyxl.cell.rich_text import CellRichText
+from openpyxl.compat import safe_string
+from openpyxl.utils import get_column_letter
+from openpyxl.xml.functions import Element, SubElement
+
+from steps.carbon.cells import strip_empty_cells
+from steps.carbon.formulas import ExcelError, FormulaEvaluator
+
+
+def _as_saved(value):
+    """
+    Return `value` the way openpyxl would read it back after a save/load
+    round-trip: numbers go through Excel's 16 significant digits, NaN and
+    empty strings become empty cells and rich text becomes plain text.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, CellRichText):
+        return str(value) or None
+    if isinstance(value, str):
+        return value if value != "" else None
+    if isinstance(value, datetime):
+        return value
+    try:
+        as_float = float(value)
+    except (TypeError, ValueError):
+        return value
+    if math.isnan(as_float) or math.isinf(as_float):
+        return None
+    text = "%.16g" % value
+    if "." in text or "e" in text or "E" in text:
+        return float(text)
+    return int(text)
+
+
+class SharedFormulas:
+    """
+    Formula cells of one sheet to write as Excel shared formulas: a run of
+    cells in a column holding the same formula relative to their row is
+    stored once, in its first cell (<f t="shared" ref="Z5:Z11" si="0">),
+    and the other cells only point at it (<f t="shared" si="0"/>). Excel
+    and openpyxl rebuild each cell's formula from it when loading.
+
+    The cells keep their own formula in memory. When written, a cell that no
+    longer holds the formula it was added with is written plain, and so is
+    its whole run if it is the first cell.
+    """
+
+    def __init__(self):
+        self.cells = {}  # (row, col) -> (run, formula)
+        self.runs = {}  # run -> (range it covers, its first row, its last row)
+        self._next_run = 0
+        self._si = {}  # run -> si, for the runs whose first cell was written shared
+        self._next_si = 0
+
+    def add(self, column, cells):
+        """
+        Share the formulas of `cells`, (row, formula) pairs of one column in
+        row order, each the same formula translated to its row. Every run of
+        consecutive rows becomes one shared formula; single cells stay plain.
+        """
+        letter = get_column_letter(column)
+        runs = []
+        for row, formula in cells:
+            if runs and row == runs[-1][-1][0] + 1:
+                runs[-1].append((row, formula))
+            else:
+                runs.append([(row, formula)])
+        for run in runs:
+            if len(run) < 2:
+                continue
+            index = self._next_run
+            self._next_run += 1
+            self.runs[index] = (f"{letter}{run[0][0]}:{letter}{run[-1][0]}", run[0][0], run[-1][0])
+            for row, formula in run:
+                self.cells[(row, column)] = (index, formula)
+
+    def formula(self, cell):
+        """(attributes, text) of the <f> element of a cell, None to write it plain."""
+        entry = self.cells.get((cell.row, cell.column))
+        if entry is None:
+            return None
+        run, formula = entry
+        if cell._value != formula:
+            return None
+        ref, first_row, _ = self.runs[run]
+        if cell.row == first_row:
+            si = self._si[run] = self._next_si
+            self._next_si += 1
+            return {"t": "shared", "ref": ref, "si": str(si)}, formula[1:]
+        if run not in self._si:
+            return None  # the first cell was written plain
+        return {"t": "shared", "si": str(self._si[run])}, None
+
+    def reset(self):
+        """Forget the si numbers of a previous save."""
+        self._si = {}
+        self._next_si = 0
+
+    def forget(self, row, column):
+        """
+        Drop a cell that was written and will not be written again (write-only
+        sheets), and its run with its last cell, so they do not pile up.
+        """
+        entry = self.cells.pop((row, column), None)
+        if entry is not None and row == self.runs[entry[0]][2]:
+            del self.runs[entry[0]]
+            self._si.pop(entry[0], None)
+
+
+@contextmanager
+def _writing_cached_values(computed, shared=None):
+    """
+    While active, formula cells with a value in `computed` ({sheet title:
+    {(row, col): value}}) are written with that value cached in <v>, so a
+    later data_only load (or Excel before recalculating) sees real numbers.
+    openpyxl itself always writes formulas without a cached value.
+    The cells of `shared` ({sheet title: SharedFormulas}) are written as
+    shared formulas.
+    """
+    original = _ws_writer.write_cell
+    shared = shared or {}
+    for formulas in shared.values():
+        formulas.reset()
+
+    def write_cell(xf, worksheet, cell, styled=None):
+        if cell.data_type != "f" or not isinstance(cell._value, str):
+            return original(xf, worksheet, cell, styled)
+        values = computed.get(worksheet.title)
+        key = (cell.row, cell.column)
+        cached = bool(values) and key in values
+        sheet_shared = shared.get(worksheet.title)
+        formula = sheet_shared.formula(cell) if sheet_shared is not None else None
+        if not cached and formula is None:
+            return original(xf, worksheet, cell, styled)
+        value = values[key] if cached else None
+        attrs = {"r": cell.coordinate}
+        if styled:
+            attrs["s"] = f"{cell.style_id}"
+        if isinstance(value, ExcelError):
+            attrs["t"] = "e"
+        elif isinstance(value, bool):
+            attrs["t"] = "b"
+            value = int(value)
+        elif isinstance(value, str):
+            attrs["t"] = "str"
+        el = Element("c", attrs)
+        f_attrs, text = formula if formula is not None else ({}, cell._value[1:])
+        f = SubElement(el, "f", f_attrs)
+        if text is not None:
+            f.text = text
+        if isinstance(value, float):
+            # shortest text that reads back as the same double, as Excel
+            # writes it; safe_string keeps only 16 significant digits
+            SubElement(el, "v").text = repr(value)
+        elif value is not None:
+            SubElement(el, "v").text = value if isinstance(value, str) else safe_string(value)
+        xf.write(el)
+
+    _ws_writer.write_cell = write_cell
+    try:
+        yield
+    finally:
+        _ws_writer.write_cell = original
+
+
+class CarbonSession:
+    """
+    One loaded Carbonate workbook shared by the steps of a run.
+
+    Steps read and write `wb` directly and leave the rows they produced in
+    `tables`, so the next step can pick them up without the file being saved
+    and re-opened in between. Sheets built during the run are tracked in
+    `fresh`; formula values are filled in by `calculate` (recorded in
+    `computed`) and written into the file as cached values on save. Runs
+    of per-row formulas a step registers in `shared_formulas(sheet)` are
+    written as Excel shared formulas.
+
+    With a profiling.RunProfile in `profile`, the phases steps open with
+    `phase` are timed; without one `phase` does nothing.
+    """
+
+    def __init__(self, file_path, wb=None):
+        self.file_path = file_path
+        self.wb = wb if wb is not None else load_workbook(file_path)
+        self.tables = {}
+        self.computed = {}
+        self.fresh = set()
+        self.shared = {}
+        self.profile = None
+        self._wb_values = None
+
+    # --- bookkeeping -------------------------------------------------------
+
+    def mark_fresh(self, sheet_name, rows=None):
+        """Record that `sheet_name` was (re)built in this run."""
+        self.fresh.add(sheet_name)
+        self.computed.pop(sheet_name, None)
+        if rows is not None:
+            self.tables[sheet_name] = rows
+        else:
+            self.tables.pop(sheet_name, None)
+
+    def phase(self, name):
+        """Context manager timing `name` (see profiling.PHASES) when profiling."""
+        if self.profile is None:
+            return nullcontext()
+        return self.profile.phase(name)
+
+    def drop_sheet(self, sheet_name):
+        """Delete `sheet_name` from the workbook (if present) and forget its state."""
+        if sheet_name in self.wb.sheetnames:
+            del self.wb[sheet_name]
+        self.fresh.discard(sheet_name)
+        self.tables.pop(sheet_name, None)
+        self.computed.pop(sheet_name, None)
+        self.shared.pop(sheet_name, None)
+
+    def shared_formulas(self, sheet_name):
+        """The SharedFormulas of `sheet_name` (formulas a step built in this run)."""
+        return self.shared.setdefault(sheet_name, SharedFormulas())
+
+    def calculate(self, sheet_name, columns, min_row=1):
+        """
+        Evaluate the formula cells of `sheet_name` in `columns` (1-based
+        indexes) from `min_row` down, plus whatever they reference, with the
+        built-in evaluator. Values already in `computed` are reused, not
+        evaluated again. Returns {(row, col): value} of everything known.
+        """
+        with self.phase("recalc"):
+            return self._calculate(sheet_name, columns, min_row)
+
+    def _calculate(self, sheet_name, columns, min_row):
+        ws = self.wb[sheet_name]
+        columns = set(columns)
+        known = self.computed.get(sheet_name, {})
+        # only existing cells can hold a formula: walk those, row by row
+        targets = sorted(
+            key for key, cell in ws._cells.items()
+            if key[0] >= min_row and key[1] in columns and cell.data_type == "f" and key not in known
+        )
+        evaluator = FormulaEvaluator(ws)
+        evaluator.values.update(known)
+        evaluator.evaluate(targets)
+        self.computed.setdefault(sheet_name, {}).update(evaluator.values)
+        return evaluator.values
+
+    # --- value access (same semantics as a data_only load) -------------------
+
+    def _values_sheet(self, sheet_name):
+        if self._wb_values is None:
+            with self.phase("load"):
+                self._wb_values = load_workbook(self.file_path, data_only=True)
+        return self._wb_values[sheet_name]
+
+    def _formula_value(self, sheet_name, row, column):
+        computed = self.computed.get(sheet_name, {})
+        if (row, column) in computed:
+            return _as_saved(computed[(row, column)])
+        if sheet_name in self.fresh:
+            return None
+        # not calculated in this run: fall back to the value cached in the file
+        return self._values_sheet(sheet_name).cell(row=row, column=column).value
+
+    def value(self, sheet_name, row, column):
+        """Calculated value of one cell, as `load_workbook(data_only=True)` would return it."""
+        if sheet_name not in self.fresh and sheet_name not in self.computed:
+            return self._values_sheet(sheet_name).cell(row=row, column=column).value
+        cell = self.wb[sheet_name]._cells.get((row, column))
+        if cell is None:
+            return None
+        if cell.data_type == "f":
+            return self._formula_value(sheet_name, row, column)
+        return _as_saved(cell.value)
+
+    def iter_values(self, sheet_name):
+        """Yield each row of `sheet_name` as a tuple of calculated values."""
+        if sheet_name not in self.fresh and sheet_name not in self.computed:
+            yield from self._values_sheet(sheet_name).iter_rows(values_only=True)
+            return
+        ws = self.wb[sheet_name]
+        if ws._current_row == 0:
+            return
+        # the rectangle ws.iter_rows() covers, without creating its missing cells
+        get = ws._cells.get
+        columns = range(1, ws.max_column + 1)
+        for r in range(1, ws.max_row + 1):
+            row = []
+            for c in columns:
+                cell = get((r, c))
+                if cell is None:
+                    row.append(None)
+                elif cell.data_type == "f":
+                    row.append(self._formula_value(sheet_name, r, c))
+                else:
+                    row.append(_as_saved(cell.value))
+            yield tuple(row)
+
+    # --- saving --------------------------------------------------------------
+
+    def save(self):
+        """
+        Write the workbook, caching every value computed in this run. Cells
+        that hold nothing are dropped first, so they do not pad the sheets.
+        """
+        for ws in self.wb.worksheets:
+            if hasattr(ws, "_cells"):
+                strip_empty_cells(ws)
+        with _writing_cached_values(self.computed, self.shared):
+            self.wb.save(self.file_path)
@@ -1,34 +1,320 @@
+import os
+import tempfile
+import zipfile
+
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import PatternFill
 from openpyxl.worksheet.views import Selection
 
-def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
+from steps.carbon.formulas import DIV0, excel_round
+from steps.carbon.header_schema import resolve_headers
+from steps.carbon.raw_cache import default_cache, sheet_key
+from steps.carbon.session import CarbonSession, SharedFormulas, _writing_cached_values
+from steps.carbon.styles import band
+from steps.carbon.text_import import is_text_export, open_text_export
+from steps.carbon.xlsx_reader import read_gas_bench_sheet
+
+BLOCK_ROWS = 11  # peaks per Line in the Data sheet
+LINES_PER_CHUNK = 1024  # Lines padded and summarized together (see _iter_block_chunks)
+
+# Headers of the Data sheet
+HEADERS = [
+    'Line', 'Time Code', 'Identifier 1', 'Comment', 'Identifier 2', 'Analysis',
+    'Preparation', 'Peak Nr', 'Rt', 'Ampl 44', 'Area All',
+    'd 13C/12C', 'd 18O/16O',
+    '', '', '', '',  # spacer columns
+    'C avg', 'C stdev', '', 'O avg', 'O stdev', '',
+    'Sum area all', 'area peaks', 'funny peaks', 'min intensity'
+]
+
+# Summary rows of each Line: (label in column Q, blank rows before it)
+SUMMARY_LAYOUT = [
+    ("ref avg", 0),
+    ("all", 3),
+    ("last 6", 0),
+    ("start", 2),
+    ("end", 0),
+    ("delta", 0),
+]
+
+# Colors
+FILL_LABEL = PatternFill(start_color="cdffcc", end_color="cdffcc", fill_type="solid")  # green
+FILL_FUNNY_MIN = PatternFill(start_color="cdfeff", end_color="cdfeff", fill_type="solid")  # blue
+
+# Column Q (labels) is green, Z & AA (funny peaks / min intensity) blue, on every
+# row except the blank row below each Line's delta (see _add_column_bands)
+FILL_COLUMNS = {17: FILL_LABEL, 26: FILL_FUNNY_MIN, 27: FILL_FUNNY_MIN}
+
+# Readers for the raw sheet: "openpyxl" (pd.read_excel) or "iterparse"
+# (steps.carbon.xlsx_reader, only the columns step 1 uses)
+ENGINES = ("openpyxl", "iterparse")
+
+
+def _pad_blocks(df, columns, block_rows=BLOCK_ROWS):
+    """
+    Reshape the raw rows into one object array of shape (lines, block_rows,
+    len(columns)), one block per Line in order of first appearance.
+    Lines with fewer peaks get padding rows that repeat Line / Time Code /
+    Identifier 1 of the first peak and carry their own Peak Nr; every other
+    padded value is None. Peaks beyond block_rows are dropped.
+    """
+    codes, uniques = pd.factorize(df['Line'], sort=False)
+    keep = codes >= 0  # rows without a Line are not part of any block
+    codes = codes[keep]
+    values = df.loc[keep, columns].to_numpy(dtype=object)
+    n_lines = len(uniques)
+
+    blocks = np.full((n_lines, block_rows, len(columns)), None, dtype=object)
+    peak_pos = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    inside = peak_pos < block_rows
+    blocks[codes[inside], peak_pos[inside]] = values[inside]
+
+    # padding rows: positions past the number of real peaks of each Line
+    counts = np.bincount(codes, minlength=n_lines)
+    padding = np.arange(block_rows)[None, :] >= counts[:, None]
+    for name in ['Line', 'Time Code', 'Identifier 1']:
+        if name in columns:
+            j = columns.index(name)
+            blocks[:, :, j] = np.where(padding, blocks[:, :1, j], blocks[:, :, j])
+    if 'Peak Nr' in columns:
+        j = columns.index('Peak Nr')
+        peak_nr = np.arange(1, block_rows + 1).astype(object)[None, :]
+        blocks[:, :, j] = np.where(padding, peak_nr, blocks[:, :, j])
+    return blocks
+
+
+def _iter_block_chunks(df, columns, lines_per_chunk=LINES_PER_CHUNK):
+    """
+    _pad_blocks(df, columns) in pieces of at most lines_per_chunk Lines, in
+    the same order, so only one piece of the block array exists at a time.
+    """
+    codes, uniques = pd.factorize(df['Line'], sort=False)
+    # row positions grouped by Line (in order of first appearance), rows
+    # without a Line first; each Line keeps its rows in sheet order
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(0, len(uniques) + lines_per_chunk, lines_per_chunk))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if lo < hi:
+            yield _pad_blocks(df.iloc[order[lo:hi]], columns)
+
+
+# True for the cell values the vectorized summary handles: blanks and real numbers
+_is_plain_number = np.frompyfunc(
+    lambda v: v is None or (isinstance(v, (int, float, np.integer, np.floating))
+                            and not isinstance(v, (bool, np.bool_))),
+    1, 1)
+
+
+def _numeric(blocks, pos):
+    """
+    Column `pos` of the block array as floats of shape (lines, BLOCK_ROWS),
+    blanks (and NaN/inf, which are saved as blanks) as NaN, plus a per-Line
+    flag that is False where the column holds text, booleans or other values.
+    """
+    lines = len(blocks)
+    if pos is None:
+        return np.full((lines, BLOCK_ROWS), np.nan), np.ones(lines, dtype=bool)
+    column = blocks[:, :, pos]
+    plain = _is_plain_number(column).astype(bool)
+    values = np.where(plain & ~np.equal(column, None), column, np.nan).astype(np.float64)
+    values[~np.isfinite(values)] = np.nan
+    return values, plain.all(axis=1)
+
+
+def _sequential_sum(values):
+    # left to right per Line, like Excel and the formula evaluator, so the
+    # results match bit for bit (np.sum may pair terms differently)
+    total = np.zeros(len(values))
+    for k in range(values.shape[1]):
+        total = total + values[:, k]
+    return total
+
+
+def _average_stdev(values):
+    """AVERAGE and sample STDEV of each row of `values` over its non-NaN cells; NaN for #DIV/0!."""
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = _sequential_sum(np.where(valid, values, 0.0)) / count
+        deviations = np.where(valid, values - mean[:, None], 0.0)
+        stdev = np.sqrt(_sequential_sum(deviations * deviations) / (count - 1))
+    mean[count == 0] = np.nan
+    stdev[count < 2] = np.nan
+    return mean, stdev
+
+
+def _rounded(values, digits):
+    """ROUND(values, digits) per Line as a list, #DIV/0! where values is NaN."""
+    return [DIV0 if np.isnan(v) else excel_round(v, digits) for v in values.tolist()]
+
+
+def _summary_values(blocks, pos_c, pos_o, pos_area, pos_ampl):
+    """
+    Values of the formulas step 1 writes for each Line (summary statistics,
+    funny peaks, min intensity), computed for all Lines at once with the
+    block array instead of cell by cell. Returns (eligible, values): values
+    maps (row offset in the block, Data header) to a list with one value per
+    Line; Lines whose C/O/Area/Ampl cells hold anything but numbers and
+    blanks are not eligible and are left to the formula evaluator.
+    """
+    c, c_ok = _numeric(blocks, pos_c)
+    o, o_ok = _numeric(blocks, pos_o)
+    area, area_ok = _numeric(blocks, pos_area)
+    ampl, ampl_ok = _numeric(blocks, pos_ampl)
+    eligible = c_ok & o_ok & area_ok & ampl_ok
+
+    offsets = {}
+    row = 0
+    for label, spacing in SUMMARY_LAYOUT:
+        row += spacing
+        offsets[label] = row
+        row += 1
+
+    values = {}
+    # ref avg: peaks 1, 2 and 4; all: the last 7 peaks; last 6: the last 6
+    for label, peaks in (("ref avg", [0, 1, 3]), ("all", slice(4, None)), ("last 6", slice(5, None))):
+        for name, column in (("C", c), ("O", o)):
+            mean, stdev = _average_stdev(column[:, peaks])
+            values[(offsets[label], f"{name} avg")] = _rounded(mean, 3)
+            values[(offsets[label], f"{name} stdev")] = _rounded(stdev, 3)
+        if label != "ref avg":
+            # SUM of only blanks is 0
+            area_sum = _sequential_sum(np.nan_to_num(area[:, peaks], nan=0.0))
+            values[(offsets[label], "Sum area all")] = _rounded(area_sum, 2)
+
+    # start / end: ROUND of a single cell (blank -> 0); O's end is its
+    # second to last peak, as in the formulas
+    start_c = _rounded(np.nan_to_num(c[:, 5], nan=0.0), 3)
+    start_o = _rounded(np.nan_to_num(o[:, 5], nan=0.0), 3)
+    end_c = _rounded(np.nan_to_num(c[:, 10], nan=0.0), 3)
+    end_o = _rounded(np.nan_to_num(o[:, 9], nan=0.0), 3)
+    values[(offsets["start"], "C avg")] = start_c
+    values[(offsets["start"], "O avg")] = start_o
+    values[(offsets["end"], "C avg")] = end_c
+    values[(offsets["end"], "O avg")] = end_o
+    values[(offsets["delta"], "C avg")] = [excel_round(e - s, 3) for s, e in zip(start_c, end_c)]
+    values[(offsets["delta"], "O avg")] = [excel_round(e - s, 3) for s, e in zip(start_o, end_o)]
+
+    # funny peaks / min intensity of peaks 5-11; the row after the last peak is blank
+    amplitude = np.nan_to_num(ampl, nan=0.0)
+    following = np.concatenate([amplitude[:, 1:], np.zeros((len(amplitude), 1))], axis=1)
+    funny = np.where(amplitude > following, "ok", "check")
+    low = np.where(amplitude < 400, "check", "ok")
+    for i in range(4, BLOCK_ROWS):
+        values[(i, "funny peaks")] = funny[:, i].tolist()
+        values[(i, "min intensity")] = low[:, i].tolist()
+    return eligible, values
+
+
+def _iter_blocks(df, columns, summary_positions=None):
+    """
+    Yields (block, line_values) for every Line in order: its padded rows
+    (see _pad_blocks) and, when summary_positions (pos_c, pos_o, pos_area,
+    pos_ampl) are given, {(row offset, header): value} of its formulas
+    (see _summary_values), None for Lines that are not eligible. The Lines
+    are prepared a chunk at a time (_iter_block_chunks).
+    """
+    for blocks in _iter_block_chunks(df, columns):
+        if summary_positions is None:
+            for block in blocks:
+                yield block, None
+            continue
+        eligible, values = _summary_values(blocks, *summary_positions)
+        keys = list(values)
+        for line, (block, rows) in enumerate(zip(blocks, zip(*values.values()))):
+            yield block, dict(zip(keys, rows)) if eligible[line] else None
+
+
+def _read_raw_sheet(source, file_path, sheet_name, engine):
+    """
+    DataFrame of the raw sheet; `source` is what pd.read_excel reads (path or
+    workbook). Parsed tables are cached by the content of the sheet in the
+    file (see raw_cache), so an unchanged sheet is not parsed again.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    cache = default_cache()
+    if cache is not None:
+        try:
+            key = sheet_key(file_path, sheet_name, engine, HEADERS if engine == "iterparse" else None)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # not a readable xlsx: let the reader report the problem
+            cache = None
+    if cache is not None:
+        df = cache.get(key)
+        if df is not None:
+            return df
+    if engine == "iterparse":
+        df = read_gas_bench_sheet(file_path, sheet_name, HEADERS)
+    else:
+        df = pd.read_excel(source, sheet_name=sheet_name, engine='openpyxl')
+    if cache is not None:
+        cache.put(key, df)
+    return df
+
+
+def step1_data(file_path, sheet_name='Default_Gas_Bench.wke', streaming=False, engine="openpyxl"):
     """
     Step 1: DATA
     Reads the Excel file, transforms it (padded rows, formulas, rounding),
     and saves the file.
+
+    streaming=True rewrites the file with write_data_workbook instead, for
+    very large exports: the file is replaced by a new workbook holding only
+    Data and the raw sheet's values (see there for what memory it bounds).
+
+    A .csv/.txt instrument export is read directly and written to a new
+    workbook next to it (see text_import.workbook_path_for); the path of the
+    workbook that was saved is returned.
+    """
+    if is_text_export(file_path):
+        session, df = open_text_export(file_path, sheet_name)
+        build_data_from_text(session, df, sheet_name)
+        session.save()
+        print(f"Step 1: DATA completed on {session.file_path}")
+        return session.file_path
+    if streaming:
+        write_data_workbook(file_path, sheet_name, engine=engine)
+        print(f"Step 1: DATA completed on {file_path}")
+        return file_path
+    session = CarbonSession(file_path)
+    build_data_sheet(session, sheet_name, engine)
+    session.save()
+    print(f"Step 1: DATA completed on {file_path}")
+    return file_path
+
+
+def build_data_from_text(session, df, sheet_name='Default_Gas_Bench.wke'):
+    """
+    Step 1 for a session opened with text_import.open_text_export: builds
+    'Data' from the already parsed table and keeps the raw table as the
+    first sheet, with 'Data' after it.
+    """
+    build_data_sheet(session, sheet_name, df=df)
+    session.wb.move_sheet('Data', offset=1)
+
+
+def build_data_sheet(session, sheet_name='Default_Gas_Bench.wke', engine="openpyxl", df=None):
+    """
+    Builds the 'Data' sheet inside the session workbook (no load/save).
+    engine picks the raw sheet reader (see ENGINES); a raw table that was
+    already parsed can be passed as df instead.
     """
     new_sheet_name = 'Data'
 
-    # Read original data into a DataFrame
-    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
-
-    # Build headers for the new sheet
-    headers = [
-        'Line', 'Time Code', 'Identifier 1', 'Comment', 'Identifier 2', 'Analysis',
-        'Preparation', 'Peak Nr', 'Rt', 'Ampl 44', 'Area All',
-        'd 13C/12C', 'd 18O/16O',
-        '', '', '', '',  # spacer columns
-        'C avg', 'C stdev', '', 'O avg', 'O stdev', '',
-        'Sum area all', 'area peaks', 'funny peaks', 'min intensity'
-    ]
-
-    # Load workbook and remove old sheet if exists
-    wb = load_workbook(file_path)
-    if new_sheet_name in wb.sheetnames:
-        del wb[new_sheet_name]
+    # Read original data into a DataFrame, from the workbook the session already
+    # parsed (instrument exports hold plain values, so no data_only load needed)
+    if df is None:
+        with session.phase("load"):
+            df = _read_raw_sheet(session.wb, session.file_path, sheet_name, engine)
+
+    # Remove old sheet if exists
+    wb = session.wb
+    session.drop_sheet(new_sheet_name)
 
     # Create new sheet before the original sheet
     first_index = wb.index(wb[sheet_name])
@@ -45,9 +331,138 @@ def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
     # set a default selection using the Selection object (fixes the TypeError)
     ws.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
 
-    # Write header row
-    for col_idx, h in enumerate(headers, start=1):
-        ws.cell(row=1, column=col_idx, value=h)
+    cached = {}
+    for row_num, cells in _iter_data_rows(df, cached, session.shared_formulas(new_sheet_name)):
+        for col, value, number_format in cells:
+            cell = ws.cell(row=row_num, column=col, value=value)
+            if number_format:
+                cell.number_format = number_format
+    _add_column_bands(ws, ws.max_row)
+
+    session.mark_fresh(new_sheet_name)
+    # formula values are known from the block array; the evaluator only
+    # fills in Lines holding text where numbers are expected
+    session.computed[new_sheet_name] = cached
+    session.calculate(new_sheet_name, columns=range(17, 28))
+
+
+def write_data_workbook(file_path, sheet_name='Default_Gas_Bench.wke', out_path=None, engine="openpyxl"):
+    """
+    Streaming variant of step 1: writes a new workbook to out_path (default:
+    file_path) holding the 'Data' sheet followed by a copy of the source sheet.
+
+    Only the source sheet's values are copied (not its formatting); any other
+    sheets of the original file and its step records (fingerprints) are not
+    carried over, so later steps and incremental runs start from scratch.
+    Formula values are cached for Lines holding only numbers in the
+    C/O/Area/Ampl columns.
+
+    The raw table is still read into memory whole (one DataFrame, as in
+    step 1). Everything built from it is bounded: both sheets are write-only,
+    so rows go to disk as they are appended, and the Data rows, their cached
+    formula values and shared formulas are generated LINES_PER_CHUNK Lines at
+    a time and dropped once written.
+    """
+    out_path = out_path or file_path
+
+    # Read original data into a DataFrame
+    df = _read_raw_sheet(file_path, file_path, sheet_name, engine)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Data')
+    ws.sheet_view.tabSelected = True
+    ws.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
+
+    next_row = 1
+    cached = {}
+    shared = SharedFormulas()
+    # rows are written as they are appended, so the cached formula values
+    # (and shared formulas) have to be in place while appending
+    with _writing_cached_values({'Data': cached}, {'Data': shared}):
+        for row_num, cells in _iter_data_rows(df, cached, shared):
+            # spacer rows between Lines are not generated: emit them empty
+            while next_row < row_num:
+                ws.append([])
+                next_row += 1
+            row = [None] * len(HEADERS)
+            for col, value, number_format in cells:
+                cell = WriteOnlyCell(ws, value=value)
+                if number_format:
+                    cell.number_format = number_format
+                row[col - 1] = cell
+            ws.append(row)
+            next_row += 1
+            # written for good: forget what the writer needed for the row
+            for col, _, _ in cells:
+                cached.pop((row_num, col), None)
+                shared.forget(row_num, col)
+    _add_column_bands(ws, next_row - 1)
+
+    src_wb = load_workbook(file_path, read_only=True)
+    try:
+        ws_raw = wb.create_sheet(sheet_name)
+        for values in src_wb[sheet_name].iter_rows(values_only=True):
+            ws_raw.append(values)
+    finally:
+        src_wb.close()
+
+    # write next to the target and swap in, so a failed save never truncates the source
+    fd, tmp_path = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(out_path)))
+    os.close(fd)
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, out_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _add_column_bands(ws, last_row):
+    """
+    Fill columns Q, Z and AA (FILL_COLUMNS) from the header row down to
+    `last_row`, skipping the spacer row after every Line, with conditional
+    formatting rules rather than a fill on each cell.
+    """
+    if last_row < 1:
+        return
+    # rows 1-2 are the headers and the blank row below them, then every
+    # Line takes BLOCK_ROWS rows followed by one spacer row
+    formula = f"OR(ROW()<3,MOD(ROW()-2,{BLOCK_ROWS + 1})<>0)"
+    by_fill = {}
+    for col, fill in sorted(FILL_COLUMNS.items()):
+        by_fill.setdefault(id(fill), (fill, []))[1].append(col)
+    for fill, cols in by_fill.values():
+        # adjacent columns share one range (Z1:AA100)
+        runs = []
+        for c in cols:
+            if runs and runs[-1][1] == c - 1:
+                runs[-1][1] = c
+            else:
+                runs.append([c, c])
+        ranges = " ".join(f"{get_column_letter(first)}1:{get_column_letter(last)}{last_row}" for first, last in runs)
+        band(ws, ranges, fill, formula)
+
+
+def _iter_data_rows(df, cached=None, shared=None):
+    """
+    Generates the Data sheet from top to bottom. Yields (row number, cells),
+    cells being [(column, value, number_format)] in column order, empty
+    cells left out. Rows without values (the blank row below the headers, the spacer row between
+    two Lines) are not yielded. A consumer never has to revisit a row, which
+    lets the Data sheet be streamed; the column fills are added afterwards
+    for the whole sheet (_add_column_bands).
+
+    If `cached` is a dict, the values of the formulas written are added to
+    it as {(row, column): value} (see _summary_values; formulas of Lines it
+    cannot handle are left out). If `shared` is a session.SharedFormulas,
+    the funny peaks / min intensity formulas of each Line are added to it
+    before the Line is yielded.
+    """
+    headers = HEADERS
+
+    # Header row
+    yield 1, [(col_idx, h, None) for col_idx, h in enumerate(headers, start=1)]
 
     # Add one blank row after headers
     cur_row = 3
@@ -56,42 +471,8 @@ def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
     # col_map: header (non-empty) -> excel column index
     col_map = {h: i + 1 for i, h in enumerate(headers) if h}
 
-    # Helper: normalize function (collapse whitespace, lower)
-    def normalize_name(s):
-        if s is None:
-            return ''
-        return ' '.join(str(s).split()).lower()
-
-    # Map dataframe columns (normalized) -> original df column name
-    df_cols_norm = {normalize_name(c): c for c in df.columns}
-
     # Map header -> matching df column name (if any)
-    header_to_dfcol = {}
-    for h in headers:
-        if not h:
-            header_to_dfcol[h] = None
-            continue
-        nh = normalize_name(h)
-        if nh in df_cols_norm:
-            header_to_dfcol[h] = df_cols_norm[nh]
-            continue
-        # try a join-without-space match
-        nh_join = nh.replace(' ', '')
-        match = None
-        for dc_norm, dc in df_cols_norm.items():
-            if dc_norm.replace(' ', '') == nh_join:
-                match = dc
-                break
-        if match:
-            header_to_dfcol[h] = match
-            continue
-        # fallback: contains 'ampl' or common tokens
-        match = None
-        for dc_norm, dc in df_cols_norm.items():
-            if nh in dc_norm or dc_norm in nh or nh_join in dc_norm.replace(' ', '') or dc_norm.replace(' ', '').find(nh_join) >= 0:
-                match = dc
-                break
-        header_to_dfcol[h] = match  # may be None if nothing matched
+    header_to_dfcol = resolve_headers(headers, df.columns)
 
     # locate important excel column indexes (these use the new-sheet headers)
     col_area = col_map.get('Area All')
@@ -107,16 +488,6 @@ def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
     col_letter_o = get_column_letter(col_o) if col_o else None
     col_letter_ampl = get_column_letter(col_ampl) if col_ampl else None
 
-    # Row labels + spacing rules
-    summary_layout = [
-        ("ref avg", 0),
-        ("all", 3),
-        ("last 6", 0),
-        ("start", 2),
-        ("end", 0),
-        ("delta", 0),
-    ]
-
     # Summary column starting positions (with blanks accounted for)
     col_label = 17  # Q
     col_c_avg = col_label + 1
@@ -125,62 +496,49 @@ def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
     col_o_stdev = col_label + 5
     col_sum_area = col_label + 7  # skip blank after O stdev
 
-    # Colors
-    fill_label = PatternFill(start_color="cdffcc", end_color="cdffcc", fill_type="solid")  # green
-    fill_funny_min = PatternFill(start_color="cdfeff", end_color="cdfeff", fill_type="solid")  # blue
-
-    # Track delta rows (to leave the blank row below each delta uncolored)
-    all_delta_rows = []
-
-    # Group by Line (preserve order)
-    grouped = df.groupby('Line', sort=False)
-
-    for line, group in grouped:
+    # Data columns written per row: (excel column, header, position in the block array)
+    # "Sum area all" is skipped during data row writing
+    write_headers = [h for h in headers if h and h != "Sum area all"]
+    source_cols = []
+    for h in write_headers:
+        source_col = header_to_dfcol.get(h)
+        if source_col and source_col in df.columns and source_col not in source_cols:
+            source_cols.append(source_col)
+    write_plan = []
+    for h in write_headers:
+        source_col = header_to_dfcol.get(h)
+        pos = source_cols.index(source_col) if source_col in source_cols else None
+        write_plan.append((col_map[h], pos, h in ["Identifier 2", "Analysis"]))
+
+    # The Lines as (lines × 11 × columns) arrays, short blocks already padded,
+    # with the values of their formulas when they are wanted
+    pos_of = {excel_col: pos for excel_col, pos, _ in write_plan}
+    summary_positions = (pos_of.get(col_c), pos_of.get(col_o), pos_of.get(col_area), pos_of.get(col_ampl))
+
+    for block, line_values in _iter_blocks(df, source_cols, summary_positions if cached is not None else None):
         # insert a spacer row between groups (except before first)
         if cur_row != 3:
             cur_row += 1
 
         first_data_row = cur_row
 
-        # Build padded_rows: 11 rows — use actual rows when present, otherwise create synthetic rows
-        padded_rows = []
-        for i in range(11):
-            if i < len(group):
-                padded_rows.append(group.iloc[i].to_dict())  # keys are df column names
-            else:
-                # synthetic row: copy A/B/C from first real row (if exists) and set Peak Nr; other df-column keys None
-                base_vals = group.iloc[0].to_dict() if len(group) > 0 else {}
-                blank_row = {col: None for col in df.columns}
-                # copy Line, Time Code, Identifier 1 if present in original df columns
-                for name in ['Line', 'Time Code', 'Identifier 1']:
-                    if name in blank_row:
-                        blank_row[name] = base_vals.get(name)
-                # set Peak Nr if 'Peak Nr' exists as a df column
-                if 'Peak Nr' in blank_row:
-                    blank_row['Peak Nr'] = i + 1
-                padded_rows.append(blank_row)
+        # cells of this block: row -> {column: value}, plus number formats
+        block_values = {}
+        block_formats = {}
+
+        def put(row, col, value, number_format=None):
+            if value is None:
+                return  # an empty cell is simply not created
+            block_values.setdefault(row, {})[col] = value
+            if number_format:
+                block_formats[(row, col)] = number_format
 
         # Write each padded row into the new sheet
-        for row_dict in padded_rows:
+        for row_vals in block:
             # iterate headers for consistent column placement in new sheet
-            for h in headers:
-                if not h:
-                    continue
-
-                # Skip writing into "Sum area all" during data row writing
-                if h == "Sum area all":
-                    continue
-
-                excel_col = col_map[h]
-                source_col = header_to_dfcol.get(h)
-                val = None
-                if source_col and source_col in row_dict:
-                    val = row_dict.get(source_col)
-
-                cell = ws.cell(row=cur_row, column=excel_col, value=val)
-
-                if h in ["Identifier 2", "Analysis"] and val is not None:
-                    cell.number_format = '@'
+            for excel_col, pos, as_text in write_plan:
+                val = row_vals[pos] if pos is not None else None
+                put(cur_row, excel_col, val, '@' if as_text and val is not None else None)
 
             cur_row += 1
 
@@ -194,103 +552,79 @@ def step1_data(file_path, sheet_name='Default_Gas_Bench.wke'):
         summary_row = first_data_row
         row_positions = {}
 
-        for label, spacing in summary_layout:
+        for label, spacing in SUMMARY_LAYOUT:
             summary_row += spacing
             row_positions[label] = summary_row
 
-            ws.cell(row=summary_row, column=col_label, value=label)
+            put(summary_row, col_label, label)
 
             # only create formulas if relevant columns exist
             if label == "ref avg" and col_letter_c and col_letter_o:
                 idx1, idx2, idx4 = first_data_row, first_data_row + 1, first_data_row + 3
-                ws.cell(row=summary_row, column=col_c_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_c}{idx1},{col_letter_c}{idx2},{col_letter_c}{idx4}),3)")
-                ws.cell(row=summary_row, column=col_c_stdev,
-                        value=f"=ROUND(STDEV({col_letter_c}{idx1},{col_letter_c}{idx2},{col_letter_c}{idx4}),3)")
-                ws.cell(row=summary_row, column=col_o_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_o}{idx1},{col_letter_o}{idx2},{col_letter_o}{idx4}),3)")
-                ws.cell(row=summary_row, column=col_o_stdev,
-                        value=f"=ROUND(STDEV({col_letter_o}{idx1},{col_letter_o}{idx2},{col_letter_o}{idx4}),3)")
+                put(summary_row, col_c_avg, f"=ROUND(AVERAGE({col_letter_c}{idx1},{col_letter_c}{idx2},{col_letter_c}{idx4}),3)")
+                put(summary_row, col_c_stdev, f"=ROUND(STDEV({col_letter_c}{idx1},{col_letter_c}{idx2},{col_letter_c}{idx4}),3)")
+                put(summary_row, col_o_avg, f"=ROUND(AVERAGE({col_letter_o}{idx1},{col_letter_o}{idx2},{col_letter_o}{idx4}),3)")
+                put(summary_row, col_o_stdev, f"=ROUND(STDEV({col_letter_o}{idx1},{col_letter_o}{idx2},{col_letter_o}{idx4}),3)")
 
             elif label == "all" and col_letter_c and col_letter_o:
-                ws.cell(row=summary_row, column=col_c_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_c}{last7_start}:{col_letter_c}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_c_stdev,
-                        value=f"=ROUND(STDEV({col_letter_c}{last7_start}:{col_letter_c}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_o_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_o}{last7_start}:{col_letter_o}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_o_stdev,
-                        value=f"=ROUND(STDEV({col_letter_o}{last7_start}:{col_letter_o}{last_data_row}),3)")
+                put(summary_row, col_c_avg, f"=ROUND(AVERAGE({col_letter_c}{last7_start}:{col_letter_c}{last_data_row}),3)")
+                put(summary_row, col_c_stdev, f"=ROUND(STDEV({col_letter_c}{last7_start}:{col_letter_c}{last_data_row}),3)")
+                put(summary_row, col_o_avg, f"=ROUND(AVERAGE({col_letter_o}{last7_start}:{col_letter_o}{last_data_row}),3)")
+                put(summary_row, col_o_stdev, f"=ROUND(STDEV({col_letter_o}{last7_start}:{col_letter_o}{last_data_row}),3)")
                 if col_letter_area:
-                    ws.cell(row=summary_row, column=col_sum_area,
-                            value=f"=ROUND(SUM({col_letter_area}{last7_start}:{col_letter_area}{last_data_row}),2)")
+                    put(summary_row, col_sum_area, f"=ROUND(SUM({col_letter_area}{last7_start}:{col_letter_area}{last_data_row}),2)")
 
             elif label == "last 6" and col_letter_c and col_letter_o:
-                ws.cell(row=summary_row, column=col_c_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_c}{last6_start}:{col_letter_c}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_c_stdev,
-                        value=f"=ROUND(STDEV({col_letter_c}{last6_start}:{col_letter_c}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_o_avg,
-                        value=f"=ROUND(AVERAGE({col_letter_o}{last6_start}:{col_letter_o}{last_data_row}),3)")
-                ws.cell(row=summary_row, column=col_o_stdev,
-                        value=f"=ROUND(STDEV({col_letter_o}{last6_start}:{col_letter_o}{last_data_row}),3)")
+                put(summary_row, col_c_avg, f"=ROUND(AVERAGE({col_letter_c}{last6_start}:{col_letter_c}{last_data_row}),3)")
+                put(summary_row, col_c_stdev, f"=ROUND(STDEV({col_letter_c}{last6_start}:{col_letter_c}{last_data_row}),3)")
+                put(summary_row, col_o_avg, f"=ROUND(AVERAGE({col_letter_o}{last6_start}:{col_letter_o}{last_data_row}),3)")
+                put(summary_row, col_o_stdev, f"=ROUND(STDEV({col_letter_o}{last6_start}:{col_letter_o}{last_data_row}),3)")
                 if col_letter_area:
-                    ws.cell(row=summary_row, column=col_sum_area,
-                            value=f"=ROUND(SUM({col_letter_area}{last6_start}:{col_letter_area}{last_data_row}),2)")
+                    put(summary_row, col_sum_area, f"=ROUND(SUM({col_letter_area}{last6_start}:{col_letter_area}{last_data_row}),2)")
 
             elif label == "start" and col_letter_c and col_letter_o:
-                ws.cell(row=summary_row, column=col_c_avg, value=f"=ROUND({col_letter_c}{start_of_last6},3)")
-                ws.cell(row=summary_row, column=col_o_avg, value=f"=ROUND({col_letter_o}{start_of_last6},3)")
+                put(summary_row, col_c_avg, f"=ROUND({col_letter_c}{start_of_last6},3)")
+                put(summary_row, col_o_avg, f"=ROUND({col_letter_o}{start_of_last6},3)")
 
             elif label == "end" and col_letter_c and col_letter_o:
-                ws.cell(row=summary_row, column=col_c_avg, value=f"=ROUND({col_letter_c}{last_data_row},3)")
+                put(summary_row, col_c_avg, f"=ROUND({col_letter_c}{last_data_row},3)")
                 second_last_row = last_data_row - 1 if last_data_row > first_data_row else last_data_row
-                ws.cell(row=summary_row, column=col_o_avg, value=f"=ROUND({col_letter_o}{second_last_row},3)")
+                put(summary_row, col_o_avg, f"=ROUND({col_letter_o}{second_last_row},3)")
 
             elif label == "delta" and col_letter_c and col_letter_o:
                 start_row = row_positions["start"]
                 end_row = row_positions["end"]
-                ws.cell(row=summary_row, column=col_c_avg,
-                        value=f"=ROUND({get_column_letter(col_c_avg)}{end_row}-{get_column_letter(col_c_avg)}{start_row},3)")
-                ws.cell(row=summary_row, column=col_o_avg,
-                        value=f"=ROUND({get_column_letter(col_o_avg)}{end_row}-{get_column_letter(col_o_avg)}{start_row},3)")
+                put(summary_row, col_c_avg, f"=ROUND({get_column_letter(col_c_avg)}{end_row}-{get_column_letter(col_c_avg)}{start_row},3)")
+                put(summary_row, col_o_avg, f"=ROUND({get_column_letter(col_o_avg)}{end_row}-{get_column_letter(col_o_avg)}{start_row},3)")
 
             summary_row += 1
 
-
-        all_delta_rows.append(row_positions["delta"])
-
         # --- Funny peaks & min intensity formulas for this 11-row block ---
         # Only proceed if Ampl column exists and target columns exist
         if col_letter_ampl and col_funny and col_minint:
+            funny, minint = [], []
             for i in range(11):
                 row_num = first_data_row + i
                 if i < 4:
-                    ws.cell(row=row_num, column=col_funny, value="ref")
-                    ws.cell(row=row_num, column=col_minint, value=None)
+                    put(row_num, col_funny, "ref")
                 else:
-                    ws.cell(row=row_num, column=col_funny,
-                            value=f'=IF({col_letter_ampl}{row_num}>{col_letter_ampl}{row_num+1},IF({col_letter_ampl}{row_num+1}<{col_letter_ampl}{row_num},"ok","check"),"check")')
-                    ws.cell(row=row_num, column=col_minint,
-                            value=f'=IF({col_letter_ampl}{row_num}<400,"check","ok")')
-
-    # --- Apply coloring patterns ---
-
-    # Column Q (green) — color every cell in column Q except the row immediately after each delta
-    skip_rows = {d + 1 for d in all_delta_rows}
-    for r in range(1, ws.max_row + 1):
-        if r in skip_rows:
-            continue
-        ws.cell(row=r, column=col_label).fill = fill_label
-
-    # Columns Z & AA (blue) — follow same pattern as column Q
-    if col_funny and col_minint:
-        for r in range(1, ws.max_row + 1):
-            if r in skip_rows:
-                continue
-            ws.cell(row=r, column=col_funny).fill = fill_funny_min
-            ws.cell(row=r, column=col_minint).fill = fill_funny_min
-
-    # Example at the end:
-    wb.save(file_path)
-    print(f"Step 1: DATA completed on {file_path}")
+                    funny.append((row_num, f'=IF({col_letter_ampl}{row_num}>{col_letter_ampl}{row_num+1},IF({col_letter_ampl}{row_num+1}<{col_letter_ampl}{row_num},"ok","check"),"check")'))
+                    minint.append((row_num, f'=IF({col_letter_ampl}{row_num}<400,"check","ok")'))
+                    put(row_num, col_funny, funny[-1][1])
+                    put(row_num, col_minint, minint[-1][1])
+            if shared is not None:
+                # the same formula on every row: stored once per Line in the file
+                shared.add(col_funny, funny)
+                shared.add(col_minint, minint)
+
+        if line_values is not None:
+            for (offset, header), value in line_values.items():
+                row, col = first_data_row + offset, col_map[header]
+                formula = block_values.get(row, {}).get(col)
+                if isinstance(formula, str) and formula.startswith("="):
+                    cached[(row, col)] = value
+
+        # Emit the block row by row
+        for row in range(first_data_row, last_data_row + 1):
+            values = block_values.get(row, {})
+            yield row, [(col, values[col], block_formats.get((row, col))) for col in sorted(values)]
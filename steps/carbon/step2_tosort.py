@@ -1,40 +1,38 @@
-import os
-import time
-import traceback
-from openpyxl import load_workbook
+import numpy as np
+import pandas as pd
+from openpyxl.worksheet.filters import AutoFilter, FilterColumn, Filters
+from openpyxl.worksheet.table import Table, TableStyleInfo
 from openpyxl.worksheet.views import Selection
 from openpyxl.utils import get_column_letter
 
-def _try_force_excel_recalc(file_path, timeout=5.0):
-    """
-    Try to open the workbook in Excel via xlwings, calculate, save and close.
-    Returns True on success, False on failure (e.g. xlwings not installed or Excel not available).
-    """
-    try:
-        import xlwings as xw
-    except Exception:
-        return False
+from steps.carbon.cells import append_row
+from steps.carbon.session import CarbonSession
+
+# Values of the Data labels column (Q) To Sort can be filtered on
+FILTER_CHOICES = ["All", "Last 6", "Ref Avg", "Start", "End", "Delta"]
+
+# How build_to_sort lays out extra filter views: one sheet per view, or
+# one sheet holding an Excel table filtered on all requested views
+VIEW_LAYOUTS = ("sheets", "table")
+
+# Sheet of the "table" layout
+VIEWS_TABLE_SHEET = "To Sort Views"
+
+COL_Q = 17  # labels column the filters apply to
+
+
+def _filter_choice(name):
+    """The FILTER_CHOICES entry `name` stands for (any case, spaces around); ValueError if none."""
+    wanted = (name or "").strip().lower()
+    for choice in FILTER_CHOICES:
+        if choice.lower() == wanted:
+            return choice
+    raise ValueError(f"Unknown filter view {name!r}, expected one of {FILTER_CHOICES}")
 
-    try:
-        app = xw.App(visible=False)
-        # Give Excel a moment to start
-        time.sleep(0.2)
-        book = app.books.open(os.path.abspath(file_path))
-        # Force a full recalculation
-        book.app.calculate()
-        # Wait a little for Excel to finish
-        time.sleep(min(1.0, timeout))
-        book.save()
-        book.close()
-        app.quit()
-        return True
-    except Exception:
-        try:
-            # Best-effort cleanup
-            app.quit()
-        except Exception:
-            pass
-        return False
+
+def view_sheet_name(filter_choice):
+    """Sheet of one extra filter view in the "sheets" layout, e.g. 'To Sort Start'."""
+    return f"To Sort {_filter_choice(filter_choice)}"
 
 
 def step2_tosort(file_path, filter_choice="Last 6"):
@@ -42,102 +40,198 @@ def step2_tosort(file_path, filter_choice="Last 6"):
     Step 2: TO SORT
     Copies rows from 'Data' into 'To Sort' but converts formulas into raw values in To Sort.
     Data sheet keeps its formulas.
-    Attempts to force Excel recalc (via xlwings) so cached values exist; if recalculation fails,
-    the code will still copy whatever cached values exist (may be None for some formula cells).
+    The Data formulas (columns Q–AA) are calculated by the built-in evaluator, so
+    no Excel round-trip is needed; their values are also cached in the saved file.
     Finally: applies autofilter on column Q and hides rows not matching "last 6".
     """
+    session = CarbonSession(file_path)
+    build_to_sort(session, filter_choice)
+
+    # Save the workbook (this writes To Sort into the same workbook that still has Data formulas)
+    session.save()
+    print(f"Step 2: TO SORT completed on {file_path}")
+
+
+def build_to_sort(session, filter_choice="Last 6", views=(), views_layout="sheets"):
+    """
+    Builds the 'To Sort' sheet inside the session workbook (no load/save).
+
+    views: further filter choices to build from the same pass over Data,
+    laid out per views_layout (see VIEW_LAYOUTS): "sheets" adds one sheet
+    per view (view_sheet_name), "table" one VIEWS_TABLE_SHEET sheet with an
+    Excel table whose saved filter shows the rows of all views. 'To Sort'
+    itself always uses filter_choice, so the later steps do not change.
+    """
+    if views_layout not in VIEW_LAYOUTS:
+        raise ValueError(f"Unknown views layout {views_layout!r}, expected one of {VIEW_LAYOUTS}")
+    # views name sheets and table filters, so only the known labels are taken
+    views = [_filter_choice(v) for v in views]
 
     source_sheet = "Data"
     new_sheet_name = "To Sort"
 
-    # First: try to force Excel to recalc & save (so workbook will have cached values)
-    recalc_ok = _try_force_excel_recalc(file_path)
-    if not recalc_ok:
-        # Not fatal — we'll continue, but warn the user in the logs (print).
-        print("Warning: unable to force Excel recalculation (xlwings missing or failed).")
-        print("If Data contains formulas without cached values, To Sort may have empty cells for those formulas.")
-        # You can optionally call GUI's refresh routine manually if desired.
-
-    # Load two workbook views:
-    # wb (data_only=False) is used as the target workbook we will write the "To Sort" sheet into
-    # wb_values (data_only=True) used to read *calculated values* (not formulas)
-    wb = load_workbook(file_path, data_only=False)
-    wb_values = load_workbook(file_path, data_only=True)
-
-    if source_sheet not in wb.sheetnames:
+    if source_sheet not in session.wb.sheetnames:
         raise ValueError(f"Sheet '{source_sheet}' not found in workbook. Run Step 1 first.")
-    if source_sheet not in wb_values.sheetnames:
-        raise ValueError(f"Sheet '{source_sheet}' not found in values workbook. Run Step 1 first.")
 
-    # Remove old To Sort if present (from the formula workbook)
-    if new_sheet_name in wb.sheetnames:
-        del wb[new_sheet_name]
+    # Calculate the summary / check formulas in Data columns Q–AA
+    session.calculate(source_sheet, columns=range(17, 28))
+
+    # wb (formulas preserved) is the target workbook we will write the "To Sort" sheet into;
+    # calculated values (not formulas) are read through session.iter_values
+    wb = session.wb
+
+    # Remove old To Sort if present (from the formula workbook), and the
+    # views of a previous run, which would be stale now
+    session.drop_sheet(new_sheet_name)
+    for name in [view_sheet_name(c) for c in FILTER_CHOICES] + [VIEWS_TABLE_SHEET]:
+        session.drop_sheet(name)
 
-    # Source worksheets
-    ws_source = wb[source_sheet]            # has formulas preserved
-    ws_source_values = wb_values[source_sheet]  # values_only view (cached values)
+    # Source worksheet (has formulas preserved)
+    ws_source = wb[source_sheet]
 
     # Create To Sort sheet to the LEFT of Data sheet
     ws_new = wb.create_sheet(new_sheet_name, index=wb.index(ws_source))
 
+    max_col_idx = ws_source.max_column
+    rows = _to_sort_rows(session, source_sheet, max_col_idx)
+    for row in rows:
+        append_row(ws_new, row)
+
+    # Data rows per label of column Q, for every filter at once
+    label_rows = _label_index(rows)
+
+    _apply_filter(ws_new, len(rows) if rows else ws_source.max_row, max_col_idx, filter_choice, label_rows)
+
+    index = wb.index(ws_new)
+    if views_layout == "sheets":
+        for choice in views:
+            index += 1
+            ws_view = wb.create_sheet(view_sheet_name(choice), index=index)
+            for row in rows:
+                append_row(ws_view, row)
+            _apply_filter(ws_view, len(rows) if rows else ws_source.max_row, max_col_idx, choice, label_rows)
+            session.mark_fresh(ws_view.title)
+    elif views:
+        ws_view = wb.create_sheet(VIEWS_TABLE_SHEET, index=index + 1)
+        _write_views_table(ws_view, rows, max_col_idx, views, label_rows)
+        session.mark_fresh(ws_view.title)
+
+    # Activate new sheet and set selection
+    for s in wb.worksheets:
+        try:
+            s.sheet_view.tabSelected = False
+        except Exception:
+            pass
+    ws_new.sheet_view.tabSelected = True
+    wb.active = wb.index(ws_new)
+    ws_new.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
+
+    session.mark_fresh(new_sheet_name, rows)
+
+
+def _to_sort_rows(session, source_sheet, max_col_idx):
+    """
+    Calculated values of Data, row by row, padded to max_col_idx columns
+    (the sheet's width), with Comment / Identifier 2 / Analysis as text.
+    """
     # Columns D, E, F = 4,5,6 (1-based)
     text_cols = {4, 5, 6}
 
-    # Copy *values only* from ws_source_values into ws_new
-    # Use iter_rows(values_only=True) for robust value extraction.
-    max_col_idx = ws_source.max_column
-    max_row_idx = ws_source_values.max_row if ws_source_values.max_row > 0 else ws_source.max_row
-
-    for r_idx, row in enumerate(ws_source_values.iter_rows(values_only=True), start=1):
-        # row is a tuple of values (length may be <= max_col_idx)
+    rows = []
+    for row in session.iter_values(source_sheet):
+        out_row = []
         for c_idx, val in enumerate(row, start=1):
             if c_idx in text_cols and val is not None:
                 # Convert to string to trigger Excel green triangle
                 val = str(val)
-            ws_new.cell(row=r_idx, column=c_idx, value=val)
-        # if a row is shorter than max_col_idx, fill remaining columns with None explicitly
-        if len(row) < max_col_idx:
-            for c_idx in range(len(row) + 1, max_col_idx + 1):
-                ws_new.cell(row=r_idx, column=c_idx, value=None)
-
+            out_row.append(val)
+        # rows shorter than max_col_idx are padded in the table (the sheet skips the Nones)
+        out_row.extend([None] * (max_col_idx - len(out_row)))
+        rows.append(tuple(out_row))
+    return rows
+
+
+def _label_index(rows):
+    """{lower-cased label of column Q: sheet row numbers}, for the data rows (row 2 on)."""
+    labels = pd.Series([
+        row[COL_Q - 1].lower() if len(row) >= COL_Q and isinstance(row[COL_Q - 1], str) else ""
+        for row in rows[1:]
+    ], dtype=object)
+    return {label: positions + 2 for label, positions in labels.groupby(labels, sort=False).indices.items()}
+
+
+def _hidden_rows(last_row, filter_choices, label_rows):
+    """Rows 2..last_row a filter on filter_choices hides (none for "all")."""
+    choices = {(c or "").strip().lower() for c in filter_choices}
+    if "all" in choices:
+        return []
+    hidden = np.ones(last_row + 1, dtype=bool)
+    hidden[:2] = False
+    for choice in choices:
+        shown = label_rows.get(choice)
+        if choice and shown is not None:
+            hidden[shown[shown <= last_row]] = False
+    return np.flatnonzero(hidden).tolist()
+
+
+def _apply_filter(ws, last_row, max_col_idx, filter_choice, label_rows):
+    """Autofilter over the used range, filtered on column Q, with the other rows hidden."""
     # Apply autofilter across full used range (based on source's max row/col)
     last_col_letter = get_column_letter(max_col_idx)
-    last_row = max_row_idx
-    ws_new.auto_filter.ref = f"A1:{last_col_letter}{last_row}"
+    ws.auto_filter.ref = f"A1:{last_col_letter}{last_row}"
 
     # Apply filter specifically to column Q based on selected option
     filter_choice = (filter_choice or "Last 6").strip().lower()
 
-    target_filter_index = 16  # column Q
+    target_filter_index = COL_Q - 1  # column Q
     try:
-        ws_new.auto_filter.add_filter_column(target_filter_index, [filter_choice])
-        ws_new.auto_filter.add_sort_condition(f"Q2:Q{last_row}")
+        ws.auto_filter.add_filter_column(target_filter_index, [filter_choice])
+        ws.auto_filter.add_sort_condition(f"Q2:Q{last_row}")
     except Exception:
         pass
 
     # Hide rows not matching filter (unless "All")
-    if filter_choice != "all":
-        for r in range(2, last_row + 1):
-            val = ws_new.cell(row=r, column=17).value
-            if not val or val.lower() != filter_choice:
-                ws_new.row_dimensions[r].hidden = True
-
-    # Activate new sheet and set selection
-    for s in wb.worksheets:
-        try:
-            s.sheet_view.tabSelected = False
-        except Exception:
-            pass
-    ws_new.sheet_view.tabSelected = True
-    wb.active = wb.index(ws_new)
-    ws_new.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
-
-    # Save the workbook (this writes To Sort into the same workbook that still has Data formulas)
-    wb.save(file_path)
-    print(f"Step 2: TO SORT completed on {file_path}")
-    if not recalc_ok:
-        print("Note: xlwings recalculation was not run. If To Sort contains blanks in R–AA,")
-        print("open the workbook in Excel and save once (or enable auto-calc), then re-run Step 2.")
+    for r in _hidden_rows(last_row, [filter_choice], label_rows):
+        ws.row_dimensions[r].hidden = True
+
+
+def _table_headers(header_row):
+    """Header row with the unique, non-empty names an Excel table requires ('Column14' for blanks)."""
+    headers = []
+    for col_idx, value in enumerate(header_row, start=1):
+        name = str(value).strip() if value is not None and str(value).strip() else f"Column{col_idx}"
+        base, n = name, 2
+        while name.lower() in {h.lower() for h in headers}:
+            name = f"{base}{n}"
+            n += 1
+        headers.append(name)
+    return headers
+
+
+def _write_views_table(ws, rows, max_col_idx, views, label_rows):
+    """The "table" layout: all rows as an Excel table filtered on every view in `views`."""
+    if not rows:
+        return
+    ws.append(_table_headers(rows[0]))
+    for row in rows[1:]:
+        append_row(ws, row)
+    last_row = max(len(rows), 2)  # a table needs a data row, even an empty one
+    ref = f"A1:{get_column_letter(max_col_idx)}{last_row}"
+
+    table = Table(displayName="ToSortViews", ref=ref)
+    table.tableStyleInfo = TableStyleInfo(name="TableStyleLight9", showRowStripes=True)
+    table.autoFilter = AutoFilter(ref=ref)
+    wanted = [v.strip().lower() for v in views if v and v.strip()]
+    if max_col_idx < COL_Q:
+        # no labels column to filter on (Data narrower than Q): show every row
+        wanted = ["all"]
+    if "all" not in wanted:
+        table.autoFilter.filterColumn.append(
+            FilterColumn(colId=COL_Q - 1, filters=Filters(filter=sorted(set(wanted)))))
+    ws.add_table(table)
+
+    for r in _hidden_rows(last_row, wanted, label_rows):
+        ws.row_dimensions[r].hidden = True
 
 
 # End of step2_tosort
@@ -1,6 +1,14 @@
-from openpyxl import load_workbook
+import numpy as np
 from openpyxl.worksheet.views import Selection
 
+from steps.carbon.cells import append_row, iter_values
+from steps.carbon.session import CarbonSession
+
+# Applied to whole columns: the row filter on Q and the conversion of the special columns to text
+_is_last6 = np.frompyfunc(lambda v: str(v).strip().lower() == "last 6", 1, 1)
+_to_text = np.frompyfunc(str, 1, 1)
+
+
 def step3_last6(file_path):
     """
     Step 3: LAST 6
@@ -12,29 +20,48 @@ def step3_last6(file_path):
         are forced to text (string) to trigger Excel's green flag.
     """
 
+    session = CarbonSession(file_path)
+    build_last6(session)
+
+    # Save workbook
+    session.save()
+    print(f"Step 3: LAST 6 completed on {file_path}")
+
+
+def build_last6(session):
+    """
+    Builds the 'Last 6' sheet inside the session workbook (no load/save).
+    """
+
     source_sheet = "To Sort"
     new_sheet_name = "Last 6"
 
-    # Load workbook (values only)
-    wb = load_workbook(file_path, data_only=False)
+    wb = session.wb
     if source_sheet not in wb.sheetnames:
         raise ValueError(f"Sheet '{source_sheet}' not found. Run Step 2 first.")
 
     # Remove old sheet if it exists
-    if new_sheet_name in wb.sheetnames:
-        del wb[new_sheet_name]
+    session.drop_sheet(new_sheet_name)
 
     ws_source = wb[source_sheet]
 
     # Insert new sheet immediately to the left of To Sort
     ws_new = wb.create_sheet(new_sheet_name, index=wb.index(ws_source))
 
+    # Rows of To Sort: the table step 2 left in the session, or the sheet itself
+    source_rows = session.tables.get(source_sheet)
+    if source_rows is None:
+        source_rows = list(iter_values(ws_source))
+
     # Copy headers (always row 1)
     header_map = {}  # map header names → column indices
-    for col_idx, cell in enumerate(ws_source[1], start=1):
-        header_val = str(cell.value).strip() if cell.value else ""
-        ws_new.cell(row=1, column=col_idx, value=header_val)
+    header_row = []
+    for col_idx, value in enumerate(source_rows[0] if source_rows else (), start=1):
+        header_val = str(value).strip() if value else ""
         header_map[header_val.lower()] = col_idx
+        header_row.append(header_val)
+    append_row(ws_new, header_row)
+    rows = [tuple(h or None for h in header_row)]
 
     # Identify special columns for text conversion
     special_headers = {"comment", "identifier 2", "analysis"}
@@ -43,21 +70,29 @@ def step3_last6(file_path):
     # Column Q index (1-based)
     col_q = 17
 
-    # Copy rows where Q == "last 6"
-    new_row_num = 2
-    for r in range(2, ws_source.max_row + 1):
-        val_q = ws_source.cell(row=r, column=col_q).value
-        if str(val_q).strip().lower() != "last 6":
-            continue  # skip rows that are not "last 6"
-
-        row = ws_source[r]
-        for col_idx, cell in enumerate(row, start=1):
-            val = cell.value
-            if col_idx in special_cols and val is not None:
-                ws_new.cell(row=new_row_num, column=col_idx, value=str(val))
-            else:
-                ws_new.cell(row=new_row_num, column=col_idx, value=val)
-        new_row_num += 1
+    # All data rows as one object array (short rows padded with None)
+    body = source_rows[1:]
+    lengths = np.array([len(row) for row in body], dtype=np.int64)
+    table = np.full((len(body), int(lengths.max(initial=0))), None, dtype=object)
+    for i, row in enumerate(body):
+        table[i, :len(row)] = row
+
+    # Keep rows where Q == "last 6"
+    if table.shape[1] >= col_q:
+        keep = _is_last6(table[:, col_q - 1]).astype(bool)
+    else:
+        keep = np.zeros(len(body), dtype=bool)
+    selected = table[keep]
+
+    for col_idx in special_cols:
+        column = selected[:, col_idx - 1]
+        present = ~np.equal(column, None)
+        column[present] = _to_text(column[present])
+
+    for row, length in zip(selected.tolist(), lengths[keep].tolist()):
+        row = row[:length]
+        append_row(ws_new, row)
+        rows.append(tuple(row))
 
     # Ensure sheet opens at A1 and is active
     for s in wb.worksheets:
@@ -69,6 +104,4 @@ def step3_last6(file_path):
     wb.active = wb.index(ws_new)
     ws_new.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
 
-    # Save workbook
-    wb.save(file_path)
-    print(f"Step 3: LAST 6 completed on {file_path}")
+    session.mark_fresh(new_sheet_name, rows)
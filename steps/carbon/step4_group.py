@@ -1,20 +1,33 @@
-import openpyxl
-from openpyxl.styles import PatternFill, Alignment, Font
-import re
-import unicodedata
-from openpyxl.styles import PatternFill, Border, Side, Font, Alignment
+from openpyxl.styles import Alignment
 from openpyxl.cell.rich_text import CellRichText, TextBlock
 from openpyxl.cell.text import InlineFont
-from openpyxl.utils import get_column_letter
 from datetime import datetime
 
-def _normalize_text(text):
-    if not text:
-        return ""
-    text = str(text)
-    text = unicodedata.normalize("NFKD", text)
-    text = re.sub(r"[^A-Za-z0-9]+", "", text)
-    return text.lower().strip()
+import pandas as pd
+
+from steps.carbon.normalization import (
+    ARAGONITE, NORMALIZED_COLUMNS, PUBLISHED_VPDB, REFERENCE_ROWS, VSMOW,
+    normalize_references,
+)
+from steps.carbon.identifiers import classify, normalize_text
+from steps.carbon.cells import append_row, cell_value, iter_values
+from steps.carbon.layout import GroupLayout
+from steps.carbon.session import CarbonSession
+from steps.carbon.styles import CENTER, RIGHT, StyleCache, band, box_border, font, solid_fill
+
+# Groups written above the divider, with Average/Stdev/Count rows
+REFERENCE_NAMES = ["CO2", "NBS 18", "NBS 19", "IAEA 603", "LSVEC"]
+
+# Identifier color of each reference material (groups, box labels, K/N values)
+REFERENCE_FONTS = {
+    "nbs 18": font("FF0000", bold=False),
+    "nbs 19": font("000080", bold=False),
+    "iaea 603": font("008000", bold=False),
+    "lsvec": font("3399FF", bold=False),
+}
+
+# Group columns of the normalized values (Z, AC, AE, AG, AH)
+NORMALIZED_COLUMN_INDEXES = dict(zip(NORMALIZED_COLUMNS, (26, 29, 31, 33, 34)))
 
 def create_rich_text(parts):
     """
@@ -28,65 +41,74 @@ def create_rich_text(parts):
 
 
 def extract_sample_base(identifier):
-    if not identifier or not isinstance(identifier, str):
-        return ""
-    identifier = identifier.strip()
-    base = re.sub(r"\s*r\d+(\.\d+)?$", "", identifier, flags=re.IGNORECASE)
-    return base.strip()
+    return classify(identifier).base
 
 
 def extract_run_number(identifier):
-    if not identifier or not isinstance(identifier, str):
-        return (9999, 0)
-    m = re.search(r"r(\d+)(?:\.(\d+))?", identifier, flags=re.IGNORECASE)
-    if m:
-        major = int(m.group(1))
-        minor = int(m.group(2)) if m.group(2) else 0
-        return (major, minor)
-    return (9999, 0)
+    return classify(identifier).run
 
 
 def _make_fill(hex_color):
-    c = hex_color.replace("#", "").upper()
-    return PatternFill(start_color=c, end_color=c, fill_type="solid")
-
-
-def _get_valid_co2_rows(rows, col_identifier1):
-    valid_indices = []
-    seen = {}
-    for i, r in enumerate(rows):
-        ident = r[col_identifier1 - 1]
-        major, minor = extract_run_number(ident)
-        if major == 1:
-            continue
-        if major not in seen:
-            seen[major] = (minor, i)
-        else:
-            prev_minor, prev_i = seen[major]
-            if minor < prev_minor:
-                seen[major] = (minor, i)
-    for _, (_, idx) in seen.items():
-        valid_indices.append(idx)
-    return sorted(valid_indices)
+    return solid_fill(hex_color)
+
+
+def _fill_box(ws, styles, top, bottom, left, right, fill, border_style, color="000000"):
+    """Fill and center the cells of a box (rows top..bottom, columns left..right) and draw its outline."""
+    for r in range(top, bottom + 1):
+        for c in range(left, right + 1):
+            styles.apply(ws.cell(row=r, column=c), fill=fill, alignment=CENTER, border=box_border(
+                border_style, top=r == top, bottom=r == bottom, left=c == left, right=c == right, color=color))
 
 
-def add_blue_box(ws):
+def _scan_average_rows(ws):
+    """
+    {reference key: Average values row} of the first group of each reference
+    material, found from the "Average" labels write_group puts in column R.
+    Only for sheets without a recorded GroupLayout.
+    """
+    average_rows = {}
+    identifier_col = 3   # column C
+    c_avg_col = 18       # column R (C avg stored here)
+
+    max_row = ws.max_row
+    for r in range(1, max_row + 1):
+        val = cell_value(ws, r, c_avg_col)
+        if val and str(val).strip().lower() == "average":
+            # find the identifier that belongs to this group: look at the last non-empty identifier above the label
+            id_row = r - 1
+            ident = ""
+            # walk upwards until we find a non-empty identifier (limit search to 20 rows to be safe)
+            scan_top = max(1, id_row - 20)
+            for t in range(id_row, scan_top - 1, -1):
+                cellv = cell_value(ws, t, identifier_col)
+                if cellv and str(cellv).strip():
+                    ident = str(cellv).strip()
+                    break
+
+            ref_key = classify(ident).reference
+            # the values are one row below the label; the first group of a material wins
+            if ref_key in REFERENCE_ROWS and ref_key not in average_rows:
+                average_rows[ref_key] = r + 1
+    return average_rows
+
+
+def add_blue_box(ws, layout=None):
     """
     Adds the two blue boxes at the lower right (existing) and also formats the
     top big blue area A1:W15 with the requested sub-boxes and values and the
     additional J2:N3 / J4:N8 measured boxes and calculated slope/intercept formulas.
+    layout: the sheet's GroupLayout; read from the sheet when not given.
     """
 
     # Styles
-    thick = Side(border_style="thick", color="000000")
-    medium = Side(border_style="medium", color="000000")
-    blue_fill = PatternFill(start_color="DAE9F8", end_color="DAE9F8", fill_type="solid")
-    black_bold = Font(color="000000", bold=True)
-    green_bold = Font(color="008000", bold=True)
-    red_bold = Font(color="FF0000", bold=True)
-    darkblue_bold = Font(color="000080", bold=True)
-    lightblue_bold = Font(color="3399FF", bold=True)
-    center = Alignment(horizontal="center", vertical="center")
+    styles = StyleCache(ws.parent)
+    blue_fill = solid_fill("DAE9F8")
+    black_bold = font("000000", bold=True)
+    green_bold = font("008000", bold=True)
+    red_bold = font("FF0000", bold=True)
+    darkblue_bold = font("000080", bold=True)
+    lightblue_bold = font("3399FF", bold=True)
+    center = CENTER
 
     # --- TOP BIG BLUE AREA is assumed filled elsewhere A1:W15 in your script.
     # We'll now put the requested content & boxes inside that area.
@@ -107,46 +129,31 @@ def add_blue_box(ws):
 
     # --- Box around C2:C3 (medium border on outer edges) ---
     c_col = 3
-    for r in range(2, 4):  # rows 2-3 inclusive
-        cell = ws.cell(row=r, column=c_col)
-        cell.fill = blue_fill
-        cell.alignment = center
-    # apply outer border only
-    for r in range(2, 4):
-        top = medium if r == 2 else None
-        bottom = medium if r == 3 else None
-        left = medium
-        right = medium
-        ws.cell(row=r, column=c_col).border = Border(top=top, bottom=bottom, left=left, right=right)
+    for r in range(2, 4):  # rows 2-3 inclusive, outer border only
+        styles.apply(ws.cell(row=r, column=c_col), fill=blue_fill, alignment=center,
+                     border=box_border("medium", top=r == 2, bottom=r == 3, left=True, right=True))
 
     # C2: Reference Materials in Bold
     ws.cell(row=2, column=c_col, value="Reference Materials").font = black_bold
     ws.cell(row=2, column=c_col).alignment = center
 
     # --- Box C4:C8 (outer border) with entries ---
+    # (outer border only)
     for r in range(4, 9):
-        ws.cell(row=r, column=c_col).fill = blue_fill
-        ws.cell(row=r, column=c_col).alignment = center
-
-    # outer border for C4:C8
-    for r in range(4, 9):
-        top = medium if r == 4 else None
-        bottom = medium if r == 8 else None
-        left = medium
-        right = medium
-        ws.cell(row=r, column=c_col).border = Border(top=top, bottom=bottom, left=left, right=right)
+        styles.apply(ws.cell(row=r, column=c_col), fill=blue_fill, alignment=center,
+                     border=box_border("medium", top=r == 4, bottom=r == 8, left=True, right=True))
 
     # Fill C5-C8 values (centered, colored) — note: you specified non-bold here
-    ws.cell(row=5, column=c_col, value="IAEA 603").font = Font(color="008000", bold=False)
+    ws.cell(row=5, column=c_col, value="IAEA 603").font = REFERENCE_FONTS["iaea 603"]
     ws.cell(row=5, column=c_col).alignment = center
 
-    ws.cell(row=6, column=c_col, value="LSVEC").font = Font(color="3399FF", bold=False)
+    ws.cell(row=6, column=c_col, value="LSVEC").font = REFERENCE_FONTS["lsvec"]
     ws.cell(row=6, column=c_col).alignment = center
 
-    ws.cell(row=7, column=c_col, value="NBS 18").font = Font(color="FF0000", bold=False)
+    ws.cell(row=7, column=c_col, value="NBS 18").font = REFERENCE_FONTS["nbs 18"]
     ws.cell(row=7, column=c_col).alignment = center
 
-    ws.cell(row=8, column=c_col, value="NBS 19").font = Font(color="000080", bold=False)
+    ws.cell(row=8, column=c_col, value="NBS 19").font = REFERENCE_FONTS["nbs 19"]
     ws.cell(row=8, column=c_col).alignment = center
 
     # --- Box D2:H3 (D=4 .. H=8) outer border; also merge F2:G2 ---
@@ -155,21 +162,8 @@ def add_blue_box(ws):
     row_top = 2
     row_bot = 3
 
-    # fill & center the area
-    for r in range(row_top, row_bot + 1):
-        for c in range(col_left, col_right + 1):
-            cell = ws.cell(row=r, column=c)
-            cell.fill = blue_fill
-            cell.alignment = center
-
-    # draw outer border for D2:H3
-    for r in range(row_top, row_bot + 1):
-        for c in range(col_left, col_right + 1):
-            top = thick if r == row_top else None
-            bottom = thick if r == row_bot else None
-            left = thick if c == col_left else None
-            right = thick if c == col_right else None
-            ws.cell(row=r, column=c).border = Border(top=top, bottom=bottom, left=left, right=right)
+    # fill & center the area, draw its outer border
+    _fill_box(ws, styles, row_top, row_bot, col_left, col_right, blue_fill, "thick")
 
     # Merge F2:G2 (F=6, G=7) and write "Published (vs. VPDB)" centered bold
     ws.merge_cells(start_row=2, start_column=6, end_row=2, end_column=7)
@@ -185,18 +179,7 @@ def add_blue_box(ws):
     rbot = 8
     cleft = 4
     cright = 8
-    for r in range(rtop, rbot + 1):
-        for c in range(cleft, cright + 1):
-            ws.cell(row=r, column=c).fill = blue_fill
-            ws.cell(row=r, column=c).alignment = center
-    # outer border
-    for r in range(rtop, rbot + 1):
-        for c in range(cleft, cright + 1):
-            top = thick if r == rtop else None
-            bottom = thick if r == rbot else None
-            left = thick if c == cleft else None
-            right = thick if c == cright else None
-            ws.cell(row=r, column=c).border = Border(top=top, bottom=bottom, left=left, right=right)
+    _fill_box(ws, styles, rtop, rbot, cleft, cright, blue_fill, "thick")
 
     # Insert the requested numeric values (with colors & bold)
     # E6: -46.6 in light blue bold (E=5, row=6)
@@ -204,11 +187,11 @@ def add_blue_box(ws):
     ws.cell(row=6, column=5).alignment = center
 
     # F5: 2.46 in green bold. (F=6, row=5)
-    ws.cell(row=5, column=6, value=2.46).font = green_bold
+    ws.cell(row=5, column=6, value=PUBLISHED_VPDB["iaea 603"][0]).font = green_bold
     ws.cell(row=5, column=6).alignment = center
 
     # G5: -2.37 green bold (G=7,row=5)
-    ws.cell(row=5, column=7, value=-2.37).font = green_bold
+    ws.cell(row=5, column=7, value=PUBLISHED_VPDB["iaea 603"][1]).font = green_bold
     ws.cell(row=5, column=7).alignment = center
 
     # H6: -26.7 light blue bold (H=8,row=6)
@@ -216,19 +199,19 @@ def add_blue_box(ws):
     ws.cell(row=6, column=8).alignment = center
 
     # F7: red -5.01 (F=6,row=7)
-    ws.cell(row=7, column=6, value=-5.01).font = red_bold
+    ws.cell(row=7, column=6, value=PUBLISHED_VPDB["nbs 18"][0]).font = red_bold
     ws.cell(row=7, column=6).alignment = center
 
     # G7: red -23.01
-    ws.cell(row=7, column=7, value=-23.01).font = red_bold
+    ws.cell(row=7, column=7, value=PUBLISHED_VPDB["nbs 18"][1]).font = red_bold
     ws.cell(row=7, column=7).alignment = center
 
     # F8: dark blue bold 1.95
-    ws.cell(row=8, column=6, value=1.95).font = darkblue_bold
+    ws.cell(row=8, column=6, value=PUBLISHED_VPDB["nbs 19"][0]).font = darkblue_bold
     ws.cell(row=8, column=6).alignment = center
 
     # G8: dark blue bold -2.2
-    ws.cell(row=8, column=7, value=-2.2).font = darkblue_bold
+    ws.cell(row=8, column=7, value=PUBLISHED_VPDB["nbs 19"][1]).font = darkblue_bold
     ws.cell(row=8, column=7).alignment = center
 
     # --- NEW REQUESTED CELLS & FORMATTING OUTSIDE/ADJACENT TO THE ABOVE ---
@@ -262,10 +245,10 @@ def add_blue_box(ws):
     ws.cell(row=3, column=23).alignment = center
 
     # 5) R5..R8 labels: R=18
-    ws.cell(row=5, column=18, value="IAEA 603").font = Font(color="008000", bold=False)
-    ws.cell(row=6, column=18, value="LSVEC").font = Font(color="3399FF", bold=False)
-    ws.cell(row=7, column=18, value="NBS 18").font = Font(color="FF0000", bold=False)
-    ws.cell(row=8, column=18, value="NBS 19").font = Font(color="000080", bold=False)
+    ws.cell(row=5, column=18, value="IAEA 603").font = REFERENCE_FONTS["iaea 603"]
+    ws.cell(row=6, column=18, value="LSVEC").font = REFERENCE_FONTS["lsvec"]
+    ws.cell(row=7, column=18, value="NBS 18").font = REFERENCE_FONTS["nbs 18"]
+    ws.cell(row=8, column=18, value="NBS 19").font = REFERENCE_FONTS["nbs 19"]
 
     # 6) I10 and I13 content (I=9)
     # I10: "18 19" (18 red bold, 19 dark blue bold)
@@ -287,19 +270,7 @@ def add_blue_box(ws):
     # J=10, K=11, L=12, M=13, N=14
 
     # Fill & border for J2:N3
-    for r in range(2, 4):
-        for c in range(10, 15):
-            cell = ws.cell(row=r, column=c)
-            cell.fill = blue_fill
-            cell.alignment = center
-
-    for r in range(2, 4):
-        for c in range(10, 15):
-            top = thick if r == 2 else None
-            bottom = thick if r == 3 else None
-            left = thick if c == 10 else None
-            right = thick if c == 14 else None
-            ws.cell(row=r, column=c).border = Border(top=top, bottom=bottom, left=left, right=right)
+    _fill_box(ws, styles, 2, 3, 10, 14, blue_fill, "thick")
 
     # Merge J2:N2 and set text "Measured (vs. Working Standard)" centered black bold
     ws.merge_cells(start_row=2, start_column=10, end_row=2, end_column=14)
@@ -313,94 +284,37 @@ def add_blue_box(ws):
     ws.cell(row=3, column=14, value="δ¹⁸O").alignment = center
 
     # Fill & border for J4:N8
-    for r in range(4, 9):
-        for c in range(10, 15):
-            cell = ws.cell(row=r, column=c)
-            cell.fill = blue_fill
-            cell.alignment = center
-
-    for r in range(4, 9):
-        for c in range(10, 15):
-            top = thick if r == 4 else None
-            bottom = thick if r == 8 else None
-            left = thick if c == 10 else None
-            right = thick if c == 14 else None
-            ws.cell(row=r, column=c).border = Border(top=top, bottom=bottom, left=left, right=right)
+    _fill_box(ws, styles, 4, 8, 10, 14, blue_fill, "thick")
 
     # --- Fill K5..K8 (C-avg) and N5..N8 (O-avg) from the precomputed "Average" rows in the sheet ---
     # mapping: reference name (lowercase) -> target row in the J/N box
-    ref_to_target_row = {
-        "iaea 603": 5,
-        "lsvec": 6,
-        "nbs 18": 7,
-        "nbs 19": 8,
-    }
-
-    # initialize found flags to avoid overwriting if multiple average blocks exist
-    found_ref = {k: False for k in ref_to_target_row}
+    ref_to_target_row = REFERENCE_ROWS
+
+    # Average rows of the reference groups: from the layout step 4 recorded,
+    # or found by scanning the sheet when it has none (older files)
+    if layout is None:
+        layout = GroupLayout.load(ws, reference_keys=ref_to_target_row)
+    if layout is not None and layout.average_rows:
+        average_rows = layout.average_rows
+    else:
+        average_rows = _scan_average_rows(ws)
 
-    # Scan for the "Average" label that your write_group placed in column R (col 18).
-    # The corresponding average values are written one row below that label (avg_row = label_row + 1).
-    identifier_col = 3   # column C
-    c_avg_col = 18       # column R (C avg stored here)
-    o_avg_col = 21       # column U (O avg stored here)
+    for ref_key, avg_row in average_rows.items():
+        if ref_key in ref_to_target_row:
+            target_row = ref_to_target_row[ref_key]
+            # Write formulas that reference the avg cells (R{avg_row} and U{avg_row}) and round them
+            ws.cell(row=target_row, column=11, value=f'=IFERROR(ROUND(R{avg_row},3),"")')  # K = C-avg from R{avg_row}
+            ws.cell(row=target_row, column=14, value=f'=IFERROR(ROUND(U{avg_row},3),"")')  # N = O-avg from U{avg_row}
 
-    max_row = ws.max_row
-    for r in range(1, max_row + 1):
-        val = ws.cell(row=r, column=c_avg_col).value
-        if val and str(val).strip().lower() == "average":
-            avg_row = r + 1
-            # find the identifier that belongs to this group: look at the last non-empty identifier above the label
-            id_row = r - 1
-            ident = ""
-            # walk upwards until we find a non-empty identifier (limit search to 20 rows to be safe)
-            scan_top = max(1, id_row - 20)
-            for t in range(id_row, scan_top - 1, -1):
-                cellv = ws.cell(row=t, column=identifier_col).value
-                if cellv and str(cellv).strip():
-                    ident = str(cellv).strip()
-                    break
-
-            ident_l = ident.lower()
-            ref_key = None
-            if "iaea" in ident_l or "603" in ident_l:
-                ref_key = "iaea 603"
-            elif "lsvec" in ident_l:
-                ref_key = "lsvec"
-            elif "nbs" in ident_l and "18" in ident_l:
-                ref_key = "nbs 18"
-            elif "nbs" in ident_l and "19" in ident_l:
-                ref_key = "nbs 19"
-
-            # if we detected a reference and haven't filled it yet, write formulas into K/N target cells
-            if ref_key and ref_key in ref_to_target_row and not found_ref[ref_key]:
-                target_row = ref_to_target_row[ref_key]
-                # Write formulas that reference the avg cells (R{avg_row} and U{avg_row}) and round them
-                ws.cell(row=target_row, column=11, value=f'=IFERROR(ROUND(R{avg_row},3),"")')  # K = C-avg from R{avg_row}
-                ws.cell(row=target_row, column=14, value=f'=IFERROR(ROUND(U{avg_row},3),"")')  # N = O-avg from U{avg_row}
-
-                # apply colors consistent with your sheet styling (not bold)
-                if ref_key == "nbs 18":
-                    ws.cell(row=target_row, column=11).font = Font(color="FF0000", bold=False)
-                    ws.cell(row=target_row, column=14).font = Font(color="FF0000", bold=False)
-                elif ref_key == "nbs 19":
-                    ws.cell(row=target_row, column=11).font = Font(color="000080", bold=False)
-                    ws.cell(row=target_row, column=14).font = Font(color="000080", bold=False)
-                elif ref_key == "iaea 603":
-                    ws.cell(row=target_row, column=11).font = Font(color="008000", bold=False)
-                    ws.cell(row=target_row, column=14).font = Font(color="008000", bold=False)
-                elif ref_key == "lsvec":
-                    ws.cell(row=target_row, column=11).font = Font(color="3399FF", bold=False)
-                    ws.cell(row=target_row, column=14).font = Font(color="3399FF", bold=False)
-
-                found_ref[ref_key] = True
+            # apply colors consistent with your sheet styling (not bold)
+            ws.cell(row=target_row, column=11).font = REFERENCE_FONTS[ref_key]
+            ws.cell(row=target_row, column=14).font = REFERENCE_FONTS[ref_key]
 
     # --- Determine numeric rows for columns K and N (5–8) ---
     def get_numeric_rows(ws, col, start=5, end=8):
         rows = []
         for r in range(start, end + 1):
-            cell = ws.cell(row=r, column=col)
-            val = cell.value
+            val = cell_value(ws, r, col)
             # Handle numbers, numeric strings, or formulas with cached numeric results
             if isinstance(val, (int, float)):
                 rows.append(r)
@@ -467,9 +381,9 @@ def add_blue_box(ws):
     # O = 15
     ws.cell(row=9, column=15, value="Aragonite (Kim et al. 2015)").font = green_bold
     ws.cell(row=9, column=15).alignment = center
-    ws.cell(row=10, column=15, value=0.992).font = green_bold
+    ws.cell(row=10, column=15, value=ARAGONITE[0]).font = green_bold
     ws.cell(row=10, column=15).alignment = center
-    ws.cell(row=11, column=15, value=-16.893).font = green_bold
+    ws.cell(row=11, column=15, value=ARAGONITE[1]).font = green_bold
     ws.cell(row=11, column=15).alignment = center
 
 
@@ -490,20 +404,10 @@ def draw_lower_boxes(ws, divider_top_row, blue_fill, black_bold, green_bold):
     box2_bottom = divider_top_row + 1
     box2_top = box2_bottom - 3  # total height 4
 
-    center = Alignment(horizontal="center", vertical="center")
-    thick = Side(style="thick")
+    styles = StyleCache(ws.parent)
 
     # --- Box 1: Z:AE (cols 26–31)
-    for r in range(box1_top, box1_bottom + 1):
-        for c in range(26, 32):
-            cell = ws.cell(r, c)
-            cell.fill = blue_fill
-            cell.alignment = center
-            top = thick if r == box1_top else None
-            bottom = thick if r == box1_bottom else None
-            left = thick if c == 26 else None
-            right = thick if c == 31 else None
-            cell.border = Border(top=top, bottom=bottom, left=left, right=right)
+    _fill_box(ws, styles, box1_top, box1_bottom, 26, 31, blue_fill, "thick", color=None)
 
     ws.cell(box1_top, 26, "Normalized").font = black_bold
     ws.cell(box1_top + 1, 26, "VPDB").font = black_bold
@@ -528,16 +432,7 @@ def draw_lower_boxes(ws, divider_top_row, blue_fill, black_bold, green_bold):
     ws.cell(box1_top + 4, 31).value = create_rich_text([(red_font, "18 "), (blue_font, "19")])
 
     # --- Box 2: AG:AH (cols 33–34)
-    for r in range(box2_top, box2_bottom + 1):
-        for c in range(33, 35):
-            cell = ws.cell(r, c)
-            cell.fill = blue_fill
-            cell.alignment = center
-            top = thick if r == box2_top else None
-            bottom = thick if r == box2_bottom else None
-            left = thick if c == 33 else None
-            right = thick if c == 34 else None
-            cell.border = Border(top=top, bottom=bottom, left=left, right=right)
+    _fill_box(ws, styles, box2_top, box2_bottom, 33, 34, blue_fill, "thick", color=None)
 
     ws.cell(box2_top, 33, "VSMOW").font = black_bold
     ws.cell(box2_top + 1, 33, "Calcite").font = black_bold
@@ -556,10 +451,178 @@ def draw_lower_boxes(ws, divider_top_row, blue_fill, black_bold, green_bold):
 
 
 def step4_group(file_path):
-    reference_names = ["CO2", "NBS 18", "NBS 19", "IAEA 603", "LSVEC"]
-    ref_set = {_normalize_text(r) for r in reference_names}
+    session = CarbonSession(file_path)
+    build_group(session)
+    session.save()
+    print(f"✅ Step 4: GROUP completed on {file_path}")
+
+
+def _last6_table(session):
+    """Headers (24 columns) and non-empty data rows of the 'Last 6' sheet."""
+    # Rows of Last 6: the table step 3 left in the session, or the sheet itself
+    last6_rows = session.tables.get("Last 6")
+    if last6_rows is None:
+        last6_rows = list(iter_values(session.wb["Last 6"], max_col=24))
+
+    first_row = list(last6_rows[0]) if last6_rows else []
+    headers = [first_row[col_idx] if col_idx < len(first_row) else None for col_idx in range(24)]
+
+    data_rows = []
+    for row in last6_rows[1:]:
+        row = row[:24]
+        if any(row):
+            row = list(row) + [None] * (24 - len(row))
+            data_rows.append(tuple(row[:24]))
+    return headers, data_rows
+
+
+# Sheet rows around the groups: the first group row, the Label/Average/
+# blank rows after each group, and from the last reference group to the
+# first sample group the gap above the divider, the divider and the headers
+FIRST_GROUP_ROW = 19
+GROUP_TAIL_ROWS = 3
+DIVIDER_GAP_ROWS = 8
+DIVIDER_ROWS = 2
 
-    wb = openpyxl.load_workbook(file_path)
+
+def _block_plan(data_rows, col_identifier1=3):
+    """
+    Where the rows of 'Last 6' go in the Group sheet: grouped by sample base
+    name (groups in first appearance order, reference groups first), each
+    group sorted by run number, and for CO2 the runs its Average is taken
+    over (the lowest minor run of every major run but r1).
+
+    Returns (blocks, divider_row). blocks are dicts in sheet order: "key"
+    (normalized name), "base", "reference" (above the divider), "rows"
+    (sorted), "first_row" (sheet row of rows[0]), "valid" (indices into
+    rows of the averaged CO2 runs, drawn gray; [] for other groups) and
+    "avg_row" (row of the Average values, None for sample groups).
+    divider_row is the first divider row, None without reference groups.
+    """
+    if not data_rows:
+        return [], None
+    ref_set = {normalize_text(r) for r in REFERENCE_NAMES}
+    records = [classify(r[col_identifier1 - 1]) for r in data_rows]
+    df = pd.DataFrame({
+        "key": [rec.key for rec in records],
+        "base": [rec.base for rec in records],
+        "major": [rec.run[0] for rec in records],
+        "minor": [rec.run[1] for rec in records],
+    })
+    df["group"] = df.groupby("key", sort=False).ngroup()
+    # a group is named after its first row in 'Last 6'
+    bases = df.groupby("group", sort=False)["base"].first()
+    df["sample"] = ~df["key"].isin(ref_set)
+    # a stable sort keeps rows with the same run number in their 'Last 6' order
+    df = df.sort_values(["sample", "group", "major", "minor"], kind="stable")
+    df["position"] = df.groupby("group", sort=False).cumcount()
+
+    groups = df.groupby("group", sort=False).agg(
+        key=("key", "first"), sample=("sample", "first"), size=("key", "size"))
+    has_references = not groups["sample"].all()
+    heights = groups["size"] + GROUP_TAIL_ROWS
+    first_rows = FIRST_GROUP_ROW + heights.cumsum().shift(fill_value=0)
+    if has_references:
+        first_rows += groups["sample"] * (DIVIDER_GAP_ROWS + DIVIDER_ROWS + 1)
+        divider_row = FIRST_GROUP_ROW + int(heights[~groups["sample"]].sum()) + DIVIDER_GAP_ROWS
+    else:
+        divider_row = None
+
+    co2 = df[(df["key"] == "co2") & (df["major"] != 1)]
+    valid = df.loc[co2.groupby("major", sort=False)["minor"].idxmin(), "position"]
+
+    blocks = []
+    ends = groups["size"].cumsum().tolist()
+    order = df.index.to_numpy()
+    for (_, group), end in zip(groups.iterrows(), ends):
+        indices = order[end - group["size"]:end]
+        first_row = int(first_rows[group.name])
+        blocks.append({
+            "key": group["key"],
+            "base": bases[group.name],
+            "reference": not group["sample"],
+            "rows": [data_rows[i] for i in indices],
+            "first_row": first_row,
+            "valid": sorted(valid.tolist()) if group["key"] == "co2" else [],
+            "avg_row": None if group["sample"] else first_row + group["size"] + 1,
+        })
+    return blocks, divider_row
+
+
+def _append_rows(ws, first_row, rows):
+    """
+    Write rows into ws from first_row down with ws.append, which builds the
+    cells directly. first_row must be below every row written so far.
+    """
+    for _ in range(first_row - ws._current_row - 1):
+        ws.append(())
+    for row in rows:
+        append_row(ws, row)
+
+
+def _group_rows(data_rows, col_identifier1=3):
+    """
+    (reference groups, other groups) of _block_plan as lists of
+    (normalized name, block).
+    """
+    blocks, _ = _block_plan(data_rows, col_identifier1)
+    ref_groups = [(b["key"], b) for b in blocks if b["reference"]]
+    other_groups = [(b["key"], b) for b in blocks if not b["reference"]]
+    return ref_groups, other_groups
+
+
+def _averaged_rows(g):
+    """Rows of a reference group its Average row is taken over (valid runs only for CO2)."""
+    if g["valid"]:
+        return [g["rows"][i] for i in g["valid"]]
+    return g["rows"]
+
+
+def _normalization_inputs(ref_groups, other_groups, col_identifier1=3):
+    """Arguments of normalization.normalize_references for the grouped rows."""
+    references = []
+    for _, g in ref_groups:
+        averaged = _averaged_rows(g)
+        references.append((
+            classify(g["rows"][-1][col_identifier1 - 1]).reference,
+            [r[17] for r in averaged],  # R: C avg
+            [r[20] for r in averaged],  # U: O avg
+        ))
+    sample_rows = [row for _, g in other_groups for row in g["rows"]]
+    samples = [(r[17], r[20]) for r in sample_rows]
+    aragonite = [classify(r[col_identifier1 - 1]).aragonite for r in sample_rows]
+    return references, samples, aragonite, sample_rows
+
+
+def normalized_frame(session):
+    """
+    Normalized values of the sample rows of a session's 'Last 6' table, as
+    step 4 would show them in the Group sheet, without building the sheet.
+    One row per sample row (Group order) with the 'Last 6' columns plus
+    "aragonite" and NORMALIZED_COLUMNS (NaN where the sheet shows nothing).
+    The slopes/intercepts are in df.attrs["carbon"] / df.attrs["oxygen"].
+    """
+    headers, data_rows = _last6_table(session)
+    ref_groups, other_groups = _group_rows(data_rows)
+    references, samples, aragonite, sample_rows = _normalization_inputs(ref_groups, other_groups)
+    result = normalize_references(references, samples, aragonite)
+
+    columns = [h if h else f"Unnamed: {i}" for i, h in enumerate(headers)]
+    df = pd.DataFrame(sample_rows, columns=columns)
+    df["aragonite"] = aragonite
+    for name in NORMALIZED_COLUMNS:
+        df[name] = pd.to_numeric(pd.Series(result["normalized"][name], dtype=object), errors="coerce")
+    df.attrs["carbon"] = result["carbon"]
+    df.attrs["oxygen"] = result["oxygen"]
+    return df
+
+
+def build_group(session):
+    """
+    Builds the 'Group' sheet inside the session workbook (no load/save).
+    The values of its formulas are computed with normalization and cached.
+    """
+    wb = session.wb
 
     if "Last 6" not in wb.sheetnames:
         raise ValueError("Sheet 'Last 6' not found!")
@@ -567,8 +630,7 @@ def step4_group(file_path):
     ws_last6 = wb["Last 6"]
 
     # Ensure Group sheet is recreated to the LEFT of "Last 6"
-    if "Group" in wb.sheetnames:
-        wb.remove(wb["Group"])
+    session.drop_sheet("Group")
     last6_index = wb.sheetnames.index("Last 6")
     ws_group = wb.create_sheet("Group", last6_index)
 
@@ -585,97 +647,76 @@ def step4_group(file_path):
     except Exception:
         pass
 
+    styles = StyleCache(wb)
     blue_fill = _make_fill("DAE9F8")
     dark_fill = _make_fill("808080")
     gray_fill = _make_fill("E7E7E7")
+    bold = font(bold=True)
+    green = font("008000")
+    green_bold = font("008000", bold=True)
 
     color_fonts = {
-        "nbs18": Font(color="FF0000"),
-        "nbs19": Font(color="000080"),
-        "iaea603": Font(color="008000"),
-        "lsvec": Font(color="3399FF"),
+        "nbs18": font("FF0000"),
+        "nbs19": font("000080"),
+        "iaea603": font("008000"),
+        "lsvec": font("3399FF"),
     }
 
     for row in ws_group.iter_rows(min_row=1, max_row=15, min_col=1, max_col=23):
         for cell in row:
-            cell.fill = blue_fill
-
-    headers = []
-    first_row = list(ws_last6[1]) if ws_last6.max_row >= 1 else []
-    for col_idx in range(24):
-        headers.append(first_row[col_idx].value if col_idx < len(first_row) else None)
-        ws_group.cell(row=18, column=col_idx + 1, value=headers[-1])
+            styles.apply(cell, fill=blue_fill)
 
-    data_rows = []
-    for row in ws_last6.iter_rows(min_row=2, max_col=24, values_only=True):
-        if any(row):
-            row = list(row) + [None] * (24 - len(row))
-            data_rows.append(tuple(row[:24]))
+    headers, data_rows = _last6_table(session)
+    for col_idx, h in enumerate(headers, start=1):
+        ws_group.cell(row=18, column=col_idx, value=h)
 
     col_identifier1 = 3
-    groups = {}
-    for r in data_rows:
-        ident = r[col_identifier1 - 1]
-        base = extract_sample_base(ident)
-        norm = _normalize_text(base)
-        if norm not in groups:
-            groups[norm] = {"base": base, "rows": []}
-        groups[norm]["rows"].append(r)
-
-    for g in groups.values():
-        g["rows"].sort(key=lambda r: extract_run_number(r[col_identifier1 - 1]))
-
-    ref_groups = []
-    other_groups = []
-    for norm, g in groups.items():
-        if norm in ref_set:
-            ref_groups.append((norm, g))
-        else:
-            other_groups.append((norm, g))
-
-    current_row = 19
-
-    # regex to detect "N Arag" or "N. Arag" (optional dot, optional spaces)
-    n_arag_re = re.compile(r"\bn\.?\s*arag\b", flags=re.IGNORECASE)
-
-    def write_group(norm, g, is_reference=True):
-        nonlocal current_row
-        base_name = _normalize_text(g["base"])
-        rows = g["rows"]
-        start_row = current_row
-
+    blocks, divider_top_row = _block_plan(data_rows, col_identifier1)
+    ref_groups = [(b["key"], b) for b in blocks if b["reference"]]
+    other_groups = [(b["key"], b) for b in blocks if not b["reference"]]
+
+    # where the values normalize_references computes go: the Average row of
+    # each reference group and the Excel row of each sample row
+    avg_rows = []
+    sample_excel_rows = []
+    # what the sheet's GroupLayout records
+    group_spans = {}
+    reference_avg_rows = {}
+    shared = session.shared_formulas("Group")
+
+    def write_group(block):
+        base_name = block["key"]
+        rows = block["rows"]
+        start_row = block["first_row"]
+        end_row = start_row + len(rows) - 1
+        _append_rows(ws_group, start_row, rows)
+        group_spans[base_name] = (start_row, end_row)
+
+        # the averaged CO2 runs are gray, reference identifiers in their color
+        row_map = [start_row + i for i in block["valid"]]
+        for r in row_map:
+            for col_idx in range(1, len(rows[0]) + 1):
+                styles.apply(ws_group.cell(row=r, column=col_idx), fill=gray_fill)
         font_color = color_fonts.get(base_name)
-        valid_indices = []
-        if base_name == "co2":
-            valid_indices = _get_valid_co2_rows(rows, col_identifier1)
-
-        row_map = []
-        for i, row in enumerate(rows):
-            excel_row = current_row
-            identifier_value = str(row[col_identifier1 - 1] or "")
-            for col_idx, val in enumerate(row, start=1):
-                cell = ws_group.cell(row=excel_row, column=col_idx, value=val)
-                if base_name == "co2" and i in valid_indices:
-                    for col in (18, 21):
-                        ws_group.cell(row=excel_row, column=col).fill = gray_fill
-                    cell.fill = gray_fill
-                if font_color and col_idx == col_identifier1:
-                    cell.font = font_color
-            if base_name == "co2" and i in valid_indices:
-                row_map.append(excel_row)
-            current_row += 1
-
-        end_row = current_row - 1
-
-        if is_reference:
+        if font_color:
+            for r in range(start_row, end_row + 1):
+                styles.apply(ws_group.cell(row=r, column=col_identifier1), font=font_color)
+
+        label_row = end_row + 1
+        if block["reference"]:
             # Reference group summary formulas
             for col_offset, label in enumerate(["Average", "Stdev", "Count"], start=0):
-                cell = ws_group.cell(row=current_row, column=18 + col_offset, value=label)
-                cell.alignment = Alignment(horizontal="right")
-                cell2 = ws_group.cell(row=current_row, column=21 + col_offset, value=label)
-                cell2.alignment = Alignment(horizontal="right")
-
-            avg_row = current_row + 1
+                cell = ws_group.cell(row=label_row, column=18 + col_offset, value=label)
+                styles.apply(cell, alignment=RIGHT)
+                cell2 = ws_group.cell(row=label_row, column=21 + col_offset, value=label)
+                styles.apply(cell2, alignment=RIGHT)
+
+            avg_row = block["avg_row"]
+            avg_rows.append(avg_row)
+            # the blue box reads the first group of each material
+            ref_key = classify(rows[-1][col_identifier1 - 1]).reference
+            if ref_key in REFERENCE_ROWS and ref_key not in reference_avg_rows:
+                reference_avg_rows[ref_key] = avg_row
             if base_name == "co2" and row_map:
                 r_ranges = ",".join([f"R{r}" for r in row_map])
                 u_ranges = ",".join([f"U{r}" for r in row_map])
@@ -695,92 +736,117 @@ def step4_group(file_path):
 
             if font_color:
                 for col in range(18, 24):
-                    ws_group.cell(row=current_row, column=col).font = font_color
-                    ws_group.cell(row=avg_row, column=col).font = font_color
-
-            current_row += 3
+                    styles.apply(ws_group.cell(row=label_row, column=col), font=font_color)
+                    styles.apply(ws_group.cell(row=avg_row, column=col), font=font_color)
 
         else:
             # Non-reference groups
-            for r in range(start_row, current_row):
-                ident_val = str(ws_group.cell(row=r, column=col_identifier1).value or "")
+            for r, row in enumerate(rows, start=start_row):
+                sample_excel_rows.append(r)
+                record = classify(row[col_identifier1 - 1])
 
                 # If N arag / N. arag → do Z, AC, AE, AH; skip AG; row text green
-                if n_arag_re.search(ident_val):
+                if record.aragonite:
                     # Z (col 26) and AC (col 29) — rounded to 2 dp
                     cell_z = ws_group.cell(row=r, column=26, value=f'=IFERROR(ROUND(($K$10*R{r})+$K$11,2),"")')
-                    cell_z.font = Font(bold=True)
+                    styles.apply(cell_z, font=bold)
 
                     cell_ac = ws_group.cell(row=r, column=29, value=f'=IFERROR(ROUND(($N$10*U{r})+$N$11,2),"")')
-                    cell_ac.font = Font(bold=True)
+                    styles.apply(cell_ac, font=bold)
 
                     # AE (col 31) and AH (col 34) — rounded to 2 dp
                     cell_ae = ws_group.cell(row=r, column=31, value=f'=IFERROR(ROUND(($O$10*U{r})+$O$11,2),"")')
-                    cell_ae.font = Font(bold=True)
+                    styles.apply(cell_ae, font=bold)
 
-                    cell_ah = ws_group.cell(row=r, column=34, value=f'=IFERROR(ROUND((1.03092*AE{r})+30.92,2),"")')
-                    cell_ah.font = Font(bold=True)
-
-                    # Clear AG (col 33) to avoid leftovers
-                    ws_group.cell(row=r, column=33, value=None)
+                    cell_ah = ws_group.cell(row=r, column=34, value=f'=IFERROR(ROUND(({VSMOW[0]}*AE{r})+{VSMOW[1]},2),"")')
+                    styles.apply(cell_ah, font=bold)
 
                     # Make entire row text green (preserve bolding on Z/AC/AE/AH by re-applying)
-                    green_font = Font(color="008000")
-                    green_bold = Font(color="008000", bold=True)
                     for c in range(1, 36):
-                        if c in (26, 29, 31, 34):
-                            ws_group.cell(row=r, column=c).font = green_bold
-                        else:
-                            ws_group.cell(row=r, column=c).font = green_font
+                        styles.apply(ws_group.cell(row=r, column=c),
+                                     font=green_bold if c in (26, 29, 31, 34) else green)
 
                 else:
                     # Normal ones: Z, AC, and AG — all rounded to 2 dp
                     cell_z = ws_group.cell(row=r, column=26, value=f'=IFERROR(ROUND(($K$10*R{r})+$K$11,2),"")')
-                    cell_z.font = Font(bold=True)
+                    styles.apply(cell_z, font=bold)
 
                     cell_ac = ws_group.cell(row=r, column=29, value=f'=IFERROR(ROUND(($N$10*U{r})+$N$11,2),"")')
-                    cell_ac.font = Font(bold=True)
+                    styles.apply(cell_ac, font=bold)
 
-                    cell_ag = ws_group.cell(row=r, column=33, value=f'=IFERROR(ROUND((1.03092*AC{r})+30.92,2),"")')
-                    cell_ag.font = Font(bold=True)
+                    cell_ag = ws_group.cell(row=r, column=33, value=f'=IFERROR(ROUND(({VSMOW[0]}*AC{r})+{VSMOW[1]},2),"")')
+                    styles.apply(cell_ag, font=bold)
 
-            current_row += 3
+            # the normalized columns repeat one formula per row: store each run once
+            for col in NORMALIZED_COLUMN_INDEXES.values():
+                formulas = []
+                for r in range(start_row, end_row + 1):
+                    value = cell_value(ws_group, r, col)
+                    if isinstance(value, str) and value.startswith("="):
+                        formulas.append((r, value))
+                shared.add(col, formulas)
 
     # Write reference groups first
-    for norm, g in ref_groups:
-        write_group(norm, g, is_reference=True)
+    for _, block in ref_groups:
+        write_group(block)
 
     # Divider
-    if ref_groups:
-        current_row += 8
-        divider_top_row = current_row  # store divider start row
-
-        for _ in range(2):
-            for col in range(1, 702):
-                ws_group.cell(row=current_row, column=col).fill = dark_fill
-            current_row += 1
+    if divider_top_row is not None:
+        # a row style paints the whole row; the boxes drawn over it keep their own fill
+        for r in range(divider_top_row, divider_top_row + DIVIDER_ROWS):
+            ws_group.row_dimensions[r].fill = dark_fill
 
+        header_row = divider_top_row + DIVIDER_ROWS
         for col_idx, h in enumerate(headers, start=1):
-            ws_group.cell(row=current_row, column=col_idx, value=h)
-        current_row += 1
-        draw_lower_boxes(ws_group, divider_top_row, blue_fill, Font(bold=True, color="000000"), Font(bold=True, color="008000"))
-
+            ws_group.cell(row=header_row, column=col_idx, value=h)
+        draw_lower_boxes(ws_group, divider_top_row, blue_fill, font("000000", bold=True), green_bold)
 
     # Write non-reference groups
-    for norm, g in other_groups:
-        write_group(norm, g, is_reference=False)
-
-    # Fill grey cells
-    max_row = ws_group.max_row + 50
-    for row in range(16, max_row + 1):
-        for col in (18, 21):
-            ws_group.cell(row=row, column=col).fill = gray_fill
-
-    ws_group.column_dimensions["C"].width = 22
-    ws_group.column_dimensions["R"].width = 22
-
-    # --- Call it after filling the groups ---
-    add_blue_box(ws_group)
-
-    wb.save(file_path)
-    print(f"✅ Step 4: GROUP completed on {file_path}")
+    for _, block in other_groups:
+        write_group(block)
+
+    with session.phase("style"):
+        # Fill grey cells (R and U), over the divider too
+        max_row = ws_group.max_row + 50
+        band(ws_group, f"R16:R{max_row} U16:U{max_row}", gray_fill)
+
+        ws_group.column_dimensions["C"].width = 22
+        ws_group.column_dimensions["R"].width = 22
+
+        layout = GroupLayout(divider_top_row, group_spans, reference_avg_rows, NORMALIZED_COLUMN_INDEXES)
+        layout.save(ws_group)
+
+        # --- Call it after filling the groups ---
+        add_blue_box(ws_group, layout)
+
+    session.mark_fresh("Group")
+    session.computed["Group"] = _cached_values(
+        ws_group, ref_groups, other_groups, avg_rows, sample_excel_rows, col_identifier1)
+    # anything the normalization does not cover is left to the evaluator
+    session.calculate("Group", columns=range(11, 35))
+
+
+def _cached_values(ws_group, ref_groups, other_groups, avg_rows, sample_excel_rows, col_identifier1=3):
+    """{(row, column): value} of the Group formulas, from normalize_references."""
+    references, samples, aragonite, _ = _normalization_inputs(ref_groups, other_groups, col_identifier1)
+    result = normalize_references(references, samples, aragonite)
+
+    values = {}
+    for avg_row, (c_stats, o_stats) in zip(avg_rows, result["statistics"]):
+        for offset, value in enumerate(c_stats + o_stats):
+            values[(avg_row, 18 + offset)] = value
+    for key, (k_value, n_value) in result["measured"].items():
+        values[(REFERENCE_ROWS[key], 11)] = k_value
+        values[(REFERENCE_ROWS[key], 14)] = n_value
+    for col, (slope, intercept) in ((11, result["carbon"]), (14, result["oxygen"])):
+        values[(10, col)] = slope
+        values[(11, col)] = intercept
+    for name, column in NORMALIZED_COLUMN_INDEXES.items():
+        for r, value in zip(sample_excel_rows, result["normalized"][name]):
+            values[(r, column)] = value
+
+    # only cells that really hold a formula get a cached value
+    return {
+        key: value for key, value in values.items()
+        if value is not None and getattr(ws_group._cells.get(key), "data_type", None) == "f"
+    }
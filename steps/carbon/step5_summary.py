@@ -1,10 +1,13 @@
 import os
-from copy import copy, deepcopy
-from openpyxl import load_workbook
+from copy import copy
 from openpyxl.worksheet.views import Selection
 from openpyxl.utils import get_column_letter, range_boundaries
 from openpyxl.cell.rich_text import CellRichText, TextBlock
 
+from steps.carbon.cells import existing_cell
+from steps.carbon.layout import GroupLayout
+from steps.carbon.session import CarbonSession
+
 def _is_formula_cell(cell):
     """Return True if the cell is a formula."""
     try:
@@ -15,68 +18,52 @@ def _is_formula_cell(cell):
     except Exception:
         return False
 
-def _try_refresh_with_xlwings(path):
-    try:
-        import xlwings as xw
-    except Exception:
-        return False
+def step5_summary(file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
 
-    app = None
-    book = None
-    try:
-        app = xw.App(visible=False, add_book=False)
-        book = app.books.open(os.path.abspath(path))
-        try:
-            book.app.api.Application.CalculateFull()
-        except Exception:
-            try:
-                book.app.api.Application.Calculate()
-            except Exception:
-                try:
-                    book.app.calculate()
-                except Exception:
-                    pass
-        book.save()
-        book.close()
-        app.quit()
-        return True
-    except Exception:
-        try:
-            if book is not None:
-                book.close()
-        except Exception:
-            pass
-        try:
-            if app is not None:
-                app.quit()
-        except Exception:
-            pass
-        return False
+    session = CarbonSession(file_path)
+    build_summary(session)
 
-def step5_summary(file_path):
+    # Save workbook (this does not modify Group cells' formulas — we only read from Group)
+    session.save()
+    print(f"Step 5: SUMMARY completed on {file_path}")
+
+
+def build_summary(session):
+    """
+    Builds the 'Summary' sheet inside the session workbook (no load/save).
+    Calculated Group values are read through the session.
+    """
     source_sheet = "Group"
     new_sheet_name = "Summary"
 
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-
-    wb_fmt = load_workbook(file_path, data_only=False)
-    wb_val = load_workbook(file_path, data_only=True)
+    wb_fmt = session.wb
 
     if source_sheet not in wb_fmt.sheetnames:
         raise ValueError(f"Sheet '{source_sheet}' not found.")
 
     ws_fmt = wb_fmt[source_sheet]
-    ws_val = wb_val[source_sheet]
 
-    def _cell_rgb_upper(cell):
+    # Styles of whole rows (step 4 paints the divider as a row style): an
+    # unstyled cell in such a row shows the row's style
+    row_styles = {r: rd._style for r, rd in ws_fmt.row_dimensions.items() if rd.has_style}
+
+    def _cell_rgb_upper(r, c):
+        cell = existing_cell(ws_fmt, r, c)
         try:
-            fg = getattr(cell.fill, "fgColor", None)
+            if (cell is None or not cell.has_style) and r in row_styles:
+                fill = ws_fmt.row_dimensions[r].fill
+            elif cell is None:
+                return None
+            else:
+                fill = cell.fill
+            fg = getattr(fill, "fgColor", None)
             if fg is not None:
                 rgb = getattr(fg, "rgb", None)
                 if rgb:
                     return str(rgb).upper()
-            sc = getattr(cell.fill, "start_color", None)
+            sc = getattr(fill, "start_color", None)
             if sc is not None:
                 rgb2 = getattr(sc, "rgb", None)
                 if rgb2:
@@ -85,24 +72,35 @@ def step5_summary(file_path):
             pass
         return None
 
-    def _is_gray808080(cell):
-        rgb = _cell_rgb_upper(cell)
+    def _is_gray808080(r, c):
+        rgb = _cell_rgb_upper(r, c)
         return bool(rgb and rgb.endswith("808080"))
 
     gray_band_start = None
-    check_start_col = 26
-    check_end_col = 34
-    range_width = check_end_col - check_start_col + 1
-    threshold = max(1, range_width // 2)
-
-    for r in range(1, ws_fmt.max_row):
-        count_r = sum(1 for c in range(check_start_col, check_end_col + 1)
-                      if _is_gray808080(ws_fmt.cell(row=r, column=c)))
-        count_r1 = sum(1 for c in range(check_start_col, check_end_col + 1)
-                       if _is_gray808080(ws_fmt.cell(row=r + 1, column=c)))
-        if count_r >= threshold and count_r1 >= threshold:
+
+    # The divider step 4 recorded, if its rows still look like one
+    layout = GroupLayout.load(ws_fmt)
+    if layout is not None and layout.divider_row is not None:
+        r = layout.divider_row
+        if all(any(_is_gray808080(row, c) for c in range(26, 35))
+               for row in (r, r + 1)):
             gray_band_start = r
-            break
+
+    # Otherwise scan for it (files from before the layout was recorded)
+    if gray_band_start is None:
+        check_start_col = 26
+        check_end_col = 34
+        range_width = check_end_col - check_start_col + 1
+        threshold = max(1, range_width // 2)
+
+        for r in range(1, ws_fmt.max_row):
+            count_r = sum(1 for c in range(check_start_col, check_end_col + 1)
+                          if _is_gray808080(r, c))
+            count_r1 = sum(1 for c in range(check_start_col, check_end_col + 1)
+                           if _is_gray808080(r + 1, c))
+            if count_r >= threshold and count_r1 >= threshold:
+                gray_band_start = r
+                break
 
     if gray_band_start is None:
         start_col_l = 12
@@ -111,17 +109,17 @@ def step5_summary(file_path):
         threshold2 = max(1, width2 // 2)
         for r in range(1, ws_fmt.max_row):
             count_r = sum(1 for c in range(start_col_l, end_col + 1)
-                          if _is_gray808080(ws_fmt.cell(row=r, column=c)))
+                          if _is_gray808080(r, c))
             count_r1 = sum(1 for c in range(start_col_l, end_col + 1)
-                           if _is_gray808080(ws_fmt.cell(row=r + 1, column=c)))
+                           if _is_gray808080(r + 1, c))
             if count_r >= threshold2 and count_r1 >= threshold2:
                 gray_band_start = r
                 break
 
     if gray_band_start is None:
         for r in range(1, ws_fmt.max_row):
-            any_r = any(_is_gray808080(ws_fmt.cell(row=r, column=c)) for c in range(1, ws_fmt.max_column + 1))
-            any_r1 = any(_is_gray808080(ws_fmt.cell(row=r + 1, column=c)) for c in range(1, ws_fmt.max_column + 1)) if r < ws_fmt.max_row else False
+            any_r = any(_is_gray808080(r, c) for c in range(1, ws_fmt.max_column + 1))
+            any_r1 = any(_is_gray808080(r + 1, c) for c in range(1, ws_fmt.max_column + 1)) if r < ws_fmt.max_row else False
             if any_r and any_r1:
                 gray_band_start = r
                 break
@@ -132,27 +130,11 @@ def step5_summary(file_path):
     start_row = max(1, gray_band_start - 3)
     source_cols = list(range(1, 4)) + list(range(26, 35))
 
-    needs_refresh = False
-    for r in range(start_row, min(start_row + 30, ws_fmt.max_row + 1)):
-        for c in source_cols:
-            src = ws_fmt.cell(row=r, column=c)
-            valcell = ws_val.cell(row=r, column=c)
-            if _is_formula_cell(src) and (valcell.value is None):
-                needs_refresh = True
-                break
-        if needs_refresh:
-            break
-
-    if needs_refresh:
-        refreshed = _try_refresh_with_xlwings(file_path)
-        if refreshed:
-            wb_fmt = load_workbook(file_path, data_only=False)
-            wb_val = load_workbook(file_path, data_only=True)
-            ws_fmt = wb_fmt[source_sheet]
-            ws_val = wb_val[source_sheet]
+    # Calculate the Group formulas we copy (and what they reference) with the
+    # built-in evaluator instead of asking Excel to refresh the file
+    session.calculate(source_sheet, columns=source_cols, min_row=start_row)
 
-    if new_sheet_name in wb_fmt.sheetnames:
-        del wb_fmt[new_sheet_name]
+    session.drop_sheet(new_sheet_name)
 
     ws_new = wb_fmt.create_sheet(new_sheet_name, index=wb_fmt.index(ws_fmt))
     mapping = {src_col: idx for idx, src_col in enumerate(source_cols, start=1)}
@@ -161,13 +143,18 @@ def step5_summary(file_path):
     for r in range(start_row, ws_fmt.max_row + 1):
         for src_col in source_cols:
             new_col = mapping[src_col]
-            src_cell_fmt = ws_fmt.cell(row=r, column=src_col)
-            src_cell_val = ws_val.cell(row=r, column=src_col)
+            src_cell_fmt = existing_cell(ws_fmt, r, src_col)
+            if src_cell_fmt is None:
+                # a cell Group does not have is empty; only its row's style shows
+                if r in row_styles:
+                    ws_new.cell(row=new_row, column=new_col)._style = copy(row_styles[r])
+                continue
+            src_value = session.value(source_sheet, r, src_col)
             dst = ws_new.cell(row=new_row, column=new_col)
 
             value = None
-            if src_cell_val.value is not None:
-                value = src_cell_val.value
+            if src_value is not None:
+                value = src_value
             elif not _is_formula_cell(src_cell_fmt):
                 value = src_cell_fmt.value
 
@@ -177,7 +164,8 @@ def step5_summary(file_path):
                     rt = CellRichText()
                     for block in src_cell_fmt.rich_text:
                         if isinstance(block, TextBlock):
-                            rt.append(deepcopy(block))
+                            # fonts are never mutated, the copy can share them
+                            rt.append(TextBlock(block.font, block.text))
                     dst.rich_text = rt
                 else:
                     dst.value = value
@@ -186,20 +174,15 @@ def step5_summary(file_path):
 
             try:
                 if getattr(src_cell_fmt, "comment", None) is not None:
-                    dst.comment = deepcopy(src_cell_fmt.comment)
+                    dst.comment = copy(src_cell_fmt.comment)
             except Exception:
                 pass
 
-            try:
-                if src_cell_fmt.has_style:
-                    dst.font = copy(src_cell_fmt.font)
-                    dst.border = copy(src_cell_fmt.border)
-                    dst.fill = copy(src_cell_fmt.fill)
-                    dst.number_format = src_cell_fmt.number_format
-                    dst.protection = copy(src_cell_fmt.protection)
-                    dst.alignment = copy(src_cell_fmt.alignment)
-            except Exception:
-                pass
+            # Same workbook, so the style IDs can be copied as they are
+            if src_cell_fmt.has_style:
+                dst._style = copy(src_cell_fmt._style)
+            elif r in row_styles:
+                dst._style = copy(row_styles[r])
 
         try:
             rd = ws_fmt.row_dimensions.get(r)
@@ -232,6 +215,4 @@ def step5_summary(file_path):
     wb_fmt.active = wb_fmt.index(ws_new)
     ws_new.sheet_view.selection = [Selection(activeCell="A1", sqref="A1")]
 
-    # Save workbook (this does not modify Group cells' formulas — we only read from Group)
-    wb_fmt.save(file_path)
-    print(f"Step 5: SUMMARY completed on {file_path}")
+    session.mark_fresh(new_sheet_name)
@@ -0,0 +1,100 @@
+"""
+Shared cell styles for the sheets the Carbonate steps build.
+
+Assigning `cell.font = Font(...)` registers the font with the workbook on
+every assignment: openpyxl hashes the whole object to find its index, and
+most callers build a fresh object per cell on top. StyleCache registers
+each distinct style object once and hands out the resulting style IDs, so
+styling a cell costs a dict lookup. Fills over whole ranges of mostly
+empty cells are conditional formatting rules instead (see band).
+"""
+from copy import copy
+from functools import lru_cache
+
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.styles.cell_style import StyleArray
+
+_PARTS = ("font", "fill", "border", "alignment")
+
+
+class StyleCache:
+    """
+    Style IDs of one workbook. `apply(cell, font=..., fill=..., border=...,
+    alignment=...)` sets those parts of the cell's style exactly like the
+    matching attribute assignments would, keeping the others.
+
+    Style objects are recognised by identity, so pass shared objects (the
+    constants below, or the helpers' cached ones) and never mutate them.
+    """
+
+    def __init__(self, wb):
+        self.tables = {
+            "font": wb._fonts,
+            "fill": wb._fills,
+            "border": wb._borders,
+            "alignment": wb._alignments,
+        }
+        self._ids = {}  # (part, id(object)) -> index in the workbook's list
+        self._objects = []  # keeps the objects alive while their id() is used as a key
+        self._styles = {}  # (current style, parts) -> StyleArray
+
+    def _index(self, part, obj):
+        key = (part, id(obj))
+        index = self._ids.get(key)
+        if index is None:
+            index = self._ids[key] = self.tables[part].add(obj)
+            self._objects.append(obj)
+        return index
+
+    def apply(self, cell, font=None, fill=None, border=None, alignment=None):
+        parts = (font, fill, border, alignment)
+        current = cell._style  # None until the cell is first styled
+        key = (tuple(current) if current is not None else None, id(font), id(fill), id(border), id(alignment))
+        style = self._styles.get(key)
+        if style is None:
+            style = copy(current) if current is not None else StyleArray()
+            for part, obj in zip(_PARTS, parts):
+                if obj is not None:
+                    setattr(style, f"{part}Id", self._index(part, obj))
+            self._styles[key] = style
+        cell._style = copy(style)
+
+
+@lru_cache(maxsize=None)
+def solid_fill(hex_color):
+    """Solid PatternFill of a color ("DAE9F8" or "#dae9f8"), one object per color."""
+    c = hex_color.replace("#", "").upper()
+    return PatternFill(start_color=c, end_color=c, fill_type="solid")
+
+
+@lru_cache(maxsize=None)
+def font(color=None, bold=None):
+    """Font with a color and weight, one object per combination."""
+    return Font(color=color, bold=bold)
+
+
+@lru_cache(maxsize=None)
+def box_border(style, top=False, bottom=False, left=False, right=False, color="000000"):
+    """Border with a `style` side ("thick", "medium") on the given edges."""
+    side = Side(border_style=style, color=color)
+    return Border(
+        top=side if top else None,
+        bottom=side if bottom else None,
+        left=side if left else None,
+        right=side if right else None,
+    )
+
+
+def band(ws, ranges, fill, formula="TRUE"):
+    """
+    Fill `ranges` (e.g. "R16:R80 U16:U80") with a conditional formatting
+    rule instead of a style on every cell, so the cells need not exist.
+    `formula` limits the fill to the cells where it is true; it is written
+    relative to the top-left cell of the first range, as in Excel.
+    """
+    ws.conditional_formatting.add(ranges, FormulaRule(formula=[formula], fill=fill))
+
+
+CENTER = Alignment(horizontal="center", vertical="center")
+RIGHT = Alignment(horizontal="right")
@@ -0,0 +1,96 @@
+import codecs
+import csv
+import os
+
+import pandas as pd
+from openpyxl import Workbook
+
+from steps.carbon.session import CarbonSession
+
+# Extensions of the delimited-text exports of the Isodat/Gas Bench software
+TEXT_EXTENSIONS = (".csv", ".txt")
+
+CHUNK_ROWS = 50_000
+
+# Suffix of the workbook written for a text export, so it never takes the
+# name of an xlsx export of the same session lying next to it
+WORKBOOK_SUFFIX = ".carbon.xlsx"
+
+
+def is_text_export(file_path):
+    """True for a .csv/.txt instrument export (instead of an xlsx workbook)."""
+    return os.path.splitext(str(file_path))[1].lower() in TEXT_EXTENSIONS
+
+
+def workbook_path_for(file_path):
+    """
+    The workbook written for a text export: same name with the extension
+    replaced by WORKBOOK_SUFFIX ('session.csv' -> 'session.carbon.xlsx').
+    Re-running the export overwrites that workbook, and only that one.
+    """
+    return os.path.splitext(file_path)[0] + WORKBOOK_SUFFIX
+
+
+def _sniff(file_path, sample_size=64 * 1024):
+    """Guess (encoding, delimiter) of a text export from its first bytes."""
+    with open(file_path, "rb") as f:
+        sample = f.read(sample_size)
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        try:
+            # final=False: a character cut at the end of the sample is not an error
+            codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+            encoding = "utf-8-sig"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+    text = sample.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = "\t" if "\t" in text else ","
+    return encoding, delimiter
+
+
+def read_text_export(file_path, chunksize=CHUNK_ROWS):
+    """
+    Iterate over a text export in DataFrames of at most `chunksize` rows.
+    The delimiter (comma, semicolon, tab or pipe) and encoding are detected.
+    Only the parsing works a chunk at a time; what the caller keeps of the
+    chunks is up to it.
+    """
+    encoding, delimiter = _sniff(file_path)
+    return pd.read_csv(file_path, sep=delimiter, encoding=encoding, chunksize=chunksize)
+
+
+def open_text_export(file_path, sheet_name='Default_Gas_Bench.wke', chunksize=CHUNK_ROWS):
+    """
+    Load a text export into a new workbook with one sheet, `sheet_name`,
+    holding the raw table. Returns (session, df): a CarbonSession on that
+    workbook, to be saved as workbook_path_for(file_path), and the raw table
+    as a DataFrame for step 1, so the text is only parsed once.
+
+    The file is parsed in chunks of `chunksize` rows, but memory is not
+    bounded by them: every chunk is kept, in the raw sheet and in df (the
+    chunks concatenated), so both hold the whole table.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = sheet_name
+
+    chunks = []
+    for chunk in read_text_export(file_path, chunksize):
+        if not chunks:
+            ws.append(list(chunk.columns))
+        chunks.append(chunk)
+        # empty fields become empty cells rather than NaN
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+
+    if chunks:
+        df = pd.concat(chunks, ignore_index=True)
+    else:
+        df = pd.DataFrame()
+    session = CarbonSession(workbook_path_for(file_path), wb=wb)
+    return session, df
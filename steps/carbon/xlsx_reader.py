@@ -0,0 +1,276 @@
+import posixpath
+import re
+import zipfile
+from datetime import datetime
+from xml.etree.ElementTree import iterparse, parse
+
+import numpy as np
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils.datetime import from_excel
+
+from steps.carbon.header_schema import resolve_headers
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Strings pandas reads as NaN by default
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}
+
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+
+
+def read_gas_bench_sheet(file_path, sheet_name, headers):
+    """
+    Read only the columns of `sheet_name` that `headers` resolve to (same
+    matching rules as step 1, see header_schema) into a DataFrame.
+
+    The sheet XML is streamed straight out of the xlsx zip and only the
+    projected columns are decoded, so no cell objects are built for the rest
+    of the instrument export. Column names, row count and dtypes follow what
+    pd.read_excel(file_path, sheet_name=sheet_name) returns for the same
+    columns: numbers become int64/float64 arrays, text stays object/str with
+    NaN for empty cells.
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        sheet_path = sheet_xml_path(zf, sheet_name)
+        strings = _shared_strings(zf)
+        date_styles = _date_styles(zf)
+
+        names = None
+        wanted = {}  # sheet column index -> (column name, {row: value})
+        header_row = last_row = row_num = 0  # last_row: last row with any non-empty cell
+
+        with zf.open(sheet_path) as src:
+            sheet_data = None
+            for event, el in iterparse(src, events=("start", "end")):
+                if event == "start":
+                    if el.tag == NS_MAIN + "sheetData":
+                        sheet_data = el
+                    continue
+                if el.tag != NS_MAIN + "row":
+                    continue
+                row_num = int(el.get("r")) if el.get("r") else row_num + 1
+                if names is None:
+                    # Header row: decode every cell, then pick the columns to keep
+                    header = {}
+                    for col, c in _row_cells(el):
+                        header[col] = _cell_value(c, strings, date_styles)
+                    names = _column_names(header)
+                    header_to_col = resolve_headers(headers, names.values())
+                    keep = {name for name in header_to_col.values() if name is not None}
+                    wanted = {col: (name, {}) for col, name in names.items() if name in keep}
+                    header_row = last_row = row_num
+                    _drop(sheet_data, el)
+                    continue
+                non_empty = False
+                for col, c in _row_cells(el):
+                    target = wanted.get(col)
+                    if target is None:
+                        # only check whether the row is empty
+                        if not non_empty and _has_value(c):
+                            non_empty = True
+                        continue
+                    value = _cell_value(c, strings, date_styles)
+                    if value is not None and value != "":
+                        target[1][row_num] = value
+                        non_empty = True
+                if non_empty:
+                    last_row = max(last_row, row_num)
+                _drop(sheet_data, el)
+
+    # rows after the header up to the last non-empty one (trailing blank rows dropped)
+    n_rows = last_row - header_row
+    data = {}
+    for col in sorted(wanted):
+        name, cells = wanted[col]
+        values = [None] * n_rows
+        for row_num, value in cells.items():
+            values[row_num - header_row - 1] = value
+        data[name] = _typed_column(values)
+    return pd.DataFrame(data, index=pd.RangeIndex(n_rows))
+
+
+def _drop(sheet_data, row):
+    """Free a parsed <row> so memory stays flat while streaming the sheet."""
+    row.clear()
+    if sheet_data is not None:
+        sheet_data.remove(row)
+
+
+def sheet_xml_path(zf, sheet_name):
+    """Path of the worksheet XML of `sheet_name` inside the archive."""
+    workbook = parse(zf.open("xl/workbook.xml")).getroot()
+    rel_id = None
+    for sheet in workbook.iter(NS_MAIN + "sheet"):
+        if sheet.get("name") == sheet_name:
+            rel_id = sheet.get(NS_REL + "id")
+            break
+    if rel_id is None:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    rels = parse(zf.open("xl/_rels/workbook.xml.rels")).getroot()
+    for rel in rels.iter(NS_PKG_REL + "Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError(f"Worksheet named '{sheet_name}' has no part in {zf.filename}")
+
+
+def _shared_strings(zf):
+    """The shared string table (plain text of every <si>, rich runs joined)."""
+    try:
+        src = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    with src:
+        for _, el in iterparse(src):
+            if el.tag == NS_MAIN + "si":
+                # phonetic runs (<rPh>) are not part of the cell text
+                for rph in el.findall(NS_MAIN + "rPh"):
+                    el.remove(rph)
+                strings.append("".join(t.text or "" for t in el.iter(NS_MAIN + "t")))
+                el.clear()
+    return strings
+
+
+def _date_styles(zf):
+    """Indexes of the cell formats (cellXfs) that display numbers as dates."""
+    try:
+        styles = parse(zf.open("xl/styles.xml")).getroot()
+    except KeyError:
+        return set()
+    formats = dict(BUILTIN_FORMATS)
+    num_fmts = styles.find(NS_MAIN + "numFmts")
+    if num_fmts is not None:
+        for fmt in num_fmts.findall(NS_MAIN + "numFmt"):
+            formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode")
+    cell_xfs = styles.find(NS_MAIN + "cellXfs")
+    if cell_xfs is None:
+        return set()
+    date_styles = set()
+    for i, xf in enumerate(cell_xfs.findall(NS_MAIN + "xf")):
+        code = formats.get(int(xf.get("numFmtId", 0)))
+        if code and is_date_format(code):
+            date_styles.add(i)
+    return date_styles
+
+
+def _row_cells(row):
+    """Yield (column index, <c> element) for the cells of a <row>."""
+    col = 0
+    for c in row.iter(NS_MAIN + "c"):
+        ref = c.get("r")
+        if ref:
+            col = column_index_from_string(_CELL_REF.match(ref).group(1))
+        else:
+            col += 1
+        yield col, c
+
+
+def _has_value(c):
+    v = c.find(NS_MAIN + "v")
+    if v is not None:
+        return c.get("t") not in ("s", "str") or bool(v.text)
+    return c.get("t") == "inlineStr" and any(t.text for t in c.iter(NS_MAIN + "t"))
+
+
+def _cell_value(c, strings, date_styles):
+    """Decode one <c> the way pandas' openpyxl reader converts cell values."""
+    kind = c.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in c.iter(NS_MAIN + "t"))
+    v = c.find(NS_MAIN + "v")
+    if v is None or v.text is None:
+        return None
+    text = v.text
+    if kind == "s":
+        return strings[int(text)]
+    if kind == "str":
+        return text
+    if kind == "b":
+        return text == "1"
+    if kind == "e":
+        return np.nan
+    if kind == "d":
+        return datetime.fromisoformat(text.rstrip("Z"))
+    number = float(text)
+    if c.get("s") and int(c.get("s")) in date_styles:
+        return from_excel(number)
+    # integral numbers come back as int, like pandas does
+    if number.is_integer():
+        return int(number)
+    return number
+
+
+def _column_names(header):
+    """Column names pandas gives a header row ({column index: value})."""
+    names = {}
+    seen = {}
+    for col in range(1, max(header, default=0) + 1):
+        value = header.get(col)
+        name = value if value is not None and value != "" else f"Unnamed: {col - 1}"
+        if name in seen:
+            # duplicated headers are mangled to "name.1", "name.2", ...
+            base = name
+            while name in seen:
+                seen[base] += 1
+                name = f"{base}.{seen[base]}"
+        seen.setdefault(name, 0)
+        names[col] = name
+    return names
+
+
+def _typed_column(values):
+    """
+    One column as a typed array, inferred like pandas' parser: numbers (and
+    numeric text) become int64, or float64 when something is missing or
+    fractional, booleans among them counting as 1/0; a column of booleans
+    only is bool; everything else stays object, with NaN for missing cells.
+    """
+    if not values:
+        return np.array([], dtype=object)
+    if all(isinstance(value, bool) for value in values):
+        return np.array(values, dtype=bool)
+    numbers = []
+    integral = True
+    for value in values:
+        if value is None or (isinstance(value, str) and value in NA_STRINGS) or (
+                isinstance(value, float) and np.isnan(value)):
+            numbers.append(np.nan)
+            integral = False
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        elif not isinstance(value, (int, float, str)):
+            break
+        if isinstance(value, str):
+            try:
+                value = int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    break
+        if isinstance(value, float):
+            integral = False
+        numbers.append(value)
+    else:
+        if integral:
+            return np.array(numbers, dtype=np.int64)
+        return np.array(numbers, dtype=np.float64)
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = [
+        np.nan if value is None or (isinstance(value, str) and value in NA_STRINGS) else value
+        for value in values
+    ]
+    return pd.Series(column, copy=False).infer_objects().array
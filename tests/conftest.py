@@ -0,0 +1,47 @@
+"""
+Fixtures shared by the tests: synthetic Gas Bench exports written with
+benchmarks/gas_bench.py, and a way to edit their raw peaks.
+"""
+import pytest
+from openpyxl import load_workbook
+
+from benchmarks.gas_bench import EXPORT_HEADERS, SHEET_NAME, generate
+
+
+def blank_peaks(path, identifier, header, first_peak=6):
+    """
+    Empty the `header` cells of the peaks from `first_peak` on of the first
+    Line whose Identifier 1 starts with `identifier`, e.g. the last 6 δ13C
+    values of an NBS 19 Line, whose 'last 6' C avg then is #DIV/0!.
+    """
+    wb = load_workbook(path)
+    ws = wb[SHEET_NAME]
+    col_line = EXPORT_HEADERS.index("Line") + 1
+    col_identifier = EXPORT_HEADERS.index("Identifier 1") + 1
+    col_peak = EXPORT_HEADERS.index("Peak Nr") + 1
+    column = EXPORT_HEADERS.index(header) + 1
+    line = None
+    for row in range(2, ws.max_row + 1):
+        if line is None and str(ws.cell(row=row, column=col_identifier).value).startswith(identifier):
+            line = ws.cell(row=row, column=col_line).value
+        if line is not None and ws.cell(row=row, column=col_line).value == line:
+            if ws.cell(row=row, column=col_peak).value >= first_peak:
+                ws.cell(row=row, column=column).value = None
+    assert line is not None, f"no {identifier} Line in {path}"
+    wb.save(path)
+
+
+@pytest.fixture(autouse=True)
+def local_caches(tmp_path, monkeypatch):
+    """Keep the raw sheet, header schema and fingerprint caches of every test to itself."""
+    monkeypatch.setenv("MRSI_CACHE_DIR", str(tmp_path / "cache"))
+    for name in ("MRSI_RAW_CACHE_DIR", "MRSI_HEADER_SCHEMA_DIR", "MRSI_FINGERPRINT_DIR", "MRSI_RAW_CACHE_MB"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def gas_bench(tmp_path):
+    """Path of a synthetic export of 60 Lines with all reference materials, some Lines short."""
+    path = str(tmp_path / "export.xlsx")
+    generate(path, lines=60, short=0.15, seed=3)
+    return path
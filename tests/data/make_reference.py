@@ -0,0 +1,271 @@
+"""
+Writes the reference workbooks of tests/test_formulas.py and
+tests/test_group.py:
+
+    python tests/data/make_reference.py
+
+functions.xlsx  ROUND / AVERAGE / STDEV / SUM on numbers, half-up ties,
+                blanks, text, TRUE and an #N/A cell ('Functions' sheet,
+                inputs in column A, formulas in column C)
+data_lines.xlsx three Lines as step 1 writes them into 'Data': ties
+                (0.0625, 1.0005, 0.375), blanks and single values (#DIV/0!
+                from STDEV and AVERAGE), and text / #N/A cells
+baseline_steps.xlsx
+                a synthetic export (benchmarks/gas_bench.py) with #DIV/0!
+                averages in two reference Lines, run through steps 1-4 of
+                the baseline commit (BASELINE): the Data, To Sort, Last 6 and
+                Group sheets the original code wrote
+
+In the first two, the cached value of every formula is Excel's result,
+listed below: the exact decimal result of the typed inputs, rounded half
+away from zero as Excel's ROUND does, with Excel's rules for blanks,
+text, booleans and errors. Opening a file in Excel and saving it again
+must leave them as they are; a copy saved by Excel can replace the
+generated one as is.
+
+The baseline steps had Excel recalculate the workbook (xlwings) before
+reading formula values. Without Excel, FormulaEvaluator does that
+recalculation here; it is pinned to Excel's results by the two files
+above. baseline_steps.xlsx needs the git history of the repository.
+"""
+import contextlib
+import importlib
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from benchmarks.gas_bench import DEFAULT_MIX, EXPORT_HEADERS, SHEET_NAME, generate  # noqa: E402
+from steps.carbon.formulas import DIV0, NA, VALUE, FormulaEvaluator  # noqa: E402
+from steps.carbon.session import CarbonSession, _writing_cached_values  # noqa: E402
+from steps.carbon.step1_data import HEADERS, build_data_sheet  # noqa: E402
+from tests.conftest import blank_peaks  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(HERE))
+
+# Commit holding the original steps, before the in-memory pipeline
+BASELINE = "6578a9e"
+
+# Functions!A1:A11
+INPUTS = [2.675, 1.005, -2.5, None, "text", "#N/A", 3, True, 1, 0.0625, 7]
+
+# Functions!C<row>: (formula, Excel's value)
+FUNCTIONS = [
+    ("=ROUND(A1,2)", 2.68),
+    ("=ROUND(A2,2)", 1.01),
+    ("=ROUND(A3,0)", -3),
+    ("=ROUND(-A10,3)", -0.063),
+    ("=ROUND(0.285,2)", 0.29),
+    ("=ROUND(1234.5678,-2)", 1200),
+    ("=ROUND(A4,2)", 0),
+    ("=ROUND(A5,2)", VALUE),
+    ("=ROUND(A6,2)", NA),
+    ("=ROUND(AVERAGE(A1,A1),2)", 2.68),
+    ("=ROUND(A1+A2,2)", 3.68),
+    ("=AVERAGE(A7,A4,A9)", 2),
+    ("=AVERAGE(A4)", DIV0),
+    ("=AVERAGE(A5,A7,A8,A9)", 2),
+    ("=AVERAGE(A6,A7)", NA),
+    ("=AVERAGE(A7:A11)", 2.765625),
+    ("=STDEV(A7)", DIV0),
+    ("=STDEV(A7,A4,A5)", DIV0),
+    ("=STDEV(A7,A9)", 1.4142135623730951),
+    ("=ROUND(STDEV(A7,A9,A10),3)", 1.5),
+    ("=ROUND(STDEV(A6,A7,A9),3)", NA),
+    ("=SUM(A4,A5)", 0),
+    ("=SUM(A7:A10)", 4.0625),
+    ("=SUM(A6,A7)", NA),
+    ("=ROUND(SUM(A7:A10)/A4,2)", DIV0),
+]
+
+# Raw peaks of the Lines in data_lines.xlsx, one list of 11 per column
+LINES = [
+    {   # Line 1: half-up ties in every summary
+        "Ampl 44": [5000 - 100 * i for i in range(11)],
+        "Area All": [0.375] * 11,
+        "d 13C/12C": [0.0625] * 5 + [1.0005] + [0.0625] * 4 + [2.0005],
+        "d 18O/16O": [-0.0625] * 5 + [-1.0005] + [-0.0625] * 3 + [-2.0005, -0.0625],
+    },
+    {   # Line 2: blanks, single values
+        "Ampl 44": [3000, 3000, 3000, 3000, 300, 500, None, 450, 450, 1000, 200],
+        "Area All": [None] * 11,
+        "d 13C/12C": [1] + [None] * 10,
+        "d 18O/16O": [2, 4, None, 6] + [None] * 6 + [-3.5],
+    },
+    {   # Line 3: text and error cells
+        "Ampl 44": [1000] * 11,
+        "Area All": [1, 1, 1, 1, 1, 2, "text", 4, 5, 6, 7],
+        "d 13C/12C": ["n/a", 3, 0.5, 5, 1, 2, 3, 4, 5, 6, "x"],
+        "d 18O/16O": ["#N/A", 1, 0.5, 2, 1, 2, 3, 4, 5, 6, 7],
+    },
+]
+
+# Excel's value of each formula of a Line: (row offset in the Line, Data header) -> value per Line
+CHECK = ["check", "ok", "check", "check", "check", "ok", "ok"]
+MIN_INTENSITY = ["check", "ok", "check", "ok", "ok", "ok", "check"]
+SUMMARIES = {
+    (0, "C avg"): [0.063, 1, 4],
+    (0, "C stdev"): [0, DIV0, 1.414],
+    (0, "O avg"): [-0.063, 4, NA],
+    (0, "O stdev"): [0, 2, NA],
+    (4, "C avg"): [0.473, DIV0, 3.5],
+    (4, "C stdev"): [0.759, DIV0, 1.871],
+    (4, "O avg"): [-0.473, -3.5, 4],
+    (4, "O stdev"): [0.759, DIV0, 2.16],
+    (4, "Sum area all"): [2.63, 0, 25],
+    (5, "C avg"): [0.542, DIV0, 4],
+    (5, "C stdev"): [0.807, DIV0, 1.581],
+    (5, "O avg"): [-0.542, -3.5, 4.5],
+    (5, "O stdev"): [0.807, DIV0, 1.871],
+    (5, "Sum area all"): [2.25, 0, 24],
+    (8, "C avg"): [1.001, 0, 2],
+    (8, "O avg"): [-1.001, 0, 2],
+    (9, "C avg"): [2.001, 0, VALUE],
+    (9, "O avg"): [-2.001, 0, 6],
+    (10, "C avg"): [1, 0, VALUE],
+    (10, "O avg"): [-1, 0, 4],
+}
+for i in range(4, 11):
+    SUMMARIES[(i, "funny peaks")] = ["ok", CHECK[i - 4], "check" if i < 10 else "ok"]
+    SUMMARIES[(i, "min intensity")] = ["ok", MIN_INTENSITY[i - 4], "ok"]
+
+FIRST_ROW = 3  # row of each Line's first peak: 3, 15, 27 (11 rows and a spacer each)
+
+
+def line_first_row(line):
+    return FIRST_ROW + line * 12
+
+
+def write_functions(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Functions"
+    for row, value in enumerate(INPUTS, start=1):
+        if value is not None:
+            ws.cell(row=row, column=1, value=value)
+    cached = {}
+    for row, (formula, value) in enumerate(FUNCTIONS, start=1):
+        ws.cell(row=row, column=3, value=formula)
+        cached[(row, 3)] = value
+    with _writing_cached_values({"Functions": cached}):
+        wb.save(path)
+
+
+def write_data_lines(path):
+    columns = {name: [] for name in ["Line", "Peak Nr", *LINES[0]]}
+    for number, line in enumerate(LINES, start=1):
+        columns["Line"] += [number] * 11
+        columns["Peak Nr"] += list(range(1, 12))
+        for name, values in line.items():
+            columns[name] += values
+    df = pd.DataFrame(columns, dtype=object)
+
+    wb = Workbook()
+    wb.active.title = "Default_Gas_Bench.wke"
+    session = CarbonSession(path, wb=wb)
+    build_data_sheet(session, df=df)
+    del wb["Default_Gas_Bench.wke"]
+
+    ws = wb["Data"]
+    col_of = {h: i for i, h in enumerate(HEADERS, start=1) if h}
+    cached = {}
+    for (offset, header), values in SUMMARIES.items():
+        for line, value in enumerate(values):
+            cached[(line_first_row(line) + offset, col_of[header])] = value
+    formulas = {key for key, cell in ws._cells.items() if cell.data_type == "f"}
+    assert formulas == set(cached), "every formula of Data needs Excel's value"
+    session.computed["Data"] = cached
+    session.save()
+
+
+def recalculate(path):
+    """Cache the value of every formula of a saved workbook, as Excel's recalculation would."""
+    wb = load_workbook(path)
+    computed = {}
+    for ws in wb.worksheets:
+        evaluator = FormulaEvaluator(ws)
+        formulas = [key for key, cell in ws._cells.items() if cell.data_type == "f"]
+        computed[ws.title] = {key: evaluator.cell_value(*key) for key in formulas}
+    with _writing_cached_values(computed):
+        wb.save(path)
+    return True
+
+
+@contextlib.contextmanager
+def baseline_steps():
+    """The step modules of BASELINE, imported from a checkout of it in a temporary directory."""
+    archive = subprocess.run(["git", "-C", REPO, "archive", BASELINE, "steps", "utils.py"],
+                             capture_output=True, check=True).stdout
+    ours = {name: module for name, module in sys.modules.items()
+            if name in ("steps", "utils") or name.startswith("steps.")}
+    with tempfile.TemporaryDirectory() as checkout:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(checkout)
+        for name in ours:
+            del sys.modules[name]
+        sys.path.insert(0, checkout)
+        try:
+            yield {n: importlib.import_module(f"steps.carbon.{m}") for n, m in (
+                (1, "step1_data"), (2, "step2_tosort"), (3, "step3_last6"), (4, "step4_group"))}
+        finally:
+            sys.path.remove(checkout)
+            for name in [n for n in sys.modules if n in ("steps", "utils") or n.startswith("steps.")]:
+                del sys.modules[name]
+            sys.modules.update(ours)
+
+
+# Identifier 1 given to the Lines of a name in baseline_steps.xlsx, in
+# order: CO2 runs with several minor runs per major run out of order, and
+# sample runs out of order with repeated run numbers
+RELABEL = {
+    "CO2": ["CO2 r1", "CO2 r2.2", "CO2 r3", "CO2 r2.1", "CO2 r3.2", "CO2 r1.1", "CO2 r4.3", "CO2 r4.2"],
+    "MC-": ["MC-01 r3", "MC-01 r1", "MC-01 r3", "MC-01 r2.1", "MC-01 r1"],
+}
+
+
+def relabel(path, names):
+    """Give the Lines whose Identifier 1 starts with a key of `names` the identifiers listed for it, in order."""
+    wb = load_workbook(path)
+    ws = wb[SHEET_NAME]
+    col_line = EXPORT_HEADERS.index("Line") + 1
+    col_identifier = EXPORT_HEADERS.index("Identifier 1") + 1
+    given = {}
+    left = {prefix: list(identifiers) for prefix, identifiers in names.items()}
+    for row in range(2, ws.max_row + 1):
+        line = ws.cell(row=row, column=col_line).value
+        cell = ws.cell(row=row, column=col_identifier)
+        if line not in given:
+            prefix = next((p for p in left if str(cell.value).startswith(p) and left[p]), None)
+            given[line] = left[prefix].pop(0) if prefix else None
+        if given[line] is not None:
+            cell.value = given[line]
+    assert not any(left.values()), f"not enough Lines to relabel: {left}"
+    wb.save(path)
+
+
+def write_baseline_steps(path):
+    generate(path, lines=100, short=0.15, mix={**DEFAULT_MIX, "CO2": 0.1}, seed=3)
+    relabel(path, RELABEL)
+    blank_peaks(path, "NBS 19", "d 13C/12C")
+    blank_peaks(path, "IAEA 603", "d 18O/16O")
+    with baseline_steps() as steps, contextlib.redirect_stdout(io.StringIO()):
+        steps[2]._try_force_excel_recalc = lambda file_path, timeout=5.0: recalculate(file_path)
+        steps[1].step1_data(path)
+        steps[2].step2_tosort(path, "Last 6")
+        steps[3].step3_last6(path)
+        steps[4].step4_group(path)
+    recalculate(path)
+
+
+if __name__ == "__main__":
+    write_functions(os.path.join(HERE, "functions.xlsx"))
+    write_data_lines(os.path.join(HERE, "data_lines.xlsx"))
+    write_baseline_steps(os.path.join(HERE, "baseline_steps.xlsx"))
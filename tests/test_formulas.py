@@ -0,0 +1,86 @@
+"""
+The formula evaluator and the summary values step 1 caches for Data,
+compared with the values cached in reference workbooks (tests/data, see
+make_reference.py there): every formula of a reference workbook must
+come out exactly as the cached value Excel shows for it.
+"""
+import os
+
+import numpy as np
+import pytest
+from openpyxl import load_workbook
+
+from steps.carbon.formulas import FormulaEvaluator
+from steps.carbon.step1_data import BLOCK_ROWS, HEADERS, _summary_values
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Data columns of the block array _summary_values gets: Ampl 44, Area All, d13C, d18O
+BLOCK_COLUMNS = [HEADERS.index(h) + 1 for h in ("Ampl 44", "Area All", "d 13C/12C", "d 18O/16O")]
+POSITIONS = {"pos_ampl": 0, "pos_area": 1, "pos_c": 2, "pos_o": 3}
+
+# Summary rows / columns _summary_values returns values for: offset in a Line, Data header
+SUMMARY_OFFSETS = {"ref avg": 0, "all": 4, "last 6": 5, "start": 8, "end": 9, "delta": 10}
+
+
+def _reference(name):
+    """(worksheet with formulas, worksheet with the cached values) of a reference workbook."""
+    path = os.path.join(DATA, name)
+    return load_workbook(path).worksheets[0], load_workbook(path, data_only=True).worksheets[0]
+
+
+def _same(value, expected):
+    """Exact equality, without letting 0 == False or 1 == "1" pass."""
+    if isinstance(expected, str):
+        return isinstance(value, str) and str(value) == expected
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == expected
+
+
+def _formula_cells(ws):
+    return sorted(key for key, cell in ws._cells.items() if cell.data_type == "f")
+
+
+@pytest.mark.parametrize("name", ["functions.xlsx", "data_lines.xlsx"])
+def test_evaluator_matches_cached_values(name):
+    ws, cached = _reference(name)
+    evaluator = FormulaEvaluator(ws)
+    cells = _formula_cells(ws)
+    assert cells
+    mismatches = []
+    for row, column in cells:
+        value = evaluator.cell_value(row, column)
+        expected = cached.cell(row=row, column=column).value
+        if not _same(value, expected):
+            mismatches.append((ws.cell(row=row, column=column).coordinate, value, expected))
+    assert not mismatches
+
+
+def test_summary_values_match_cached_values():
+    ws, cached = _reference("data_lines.xlsx")
+    first_rows = [row for row in range(1, ws.max_row + 1) if ws.cell(row=row, column=17).value == "ref avg"]
+    blocks = np.array(
+        [
+            [[ws.cell(row=first + i, column=c).value for c in BLOCK_COLUMNS] for i in range(BLOCK_ROWS)]
+            for first in first_rows
+        ],
+        dtype=object,
+    )
+    for first in first_rows:
+        for label, offset in SUMMARY_OFFSETS.items():
+            assert ws.cell(row=first + offset, column=17).value == label
+
+    eligible, values = _summary_values(blocks, **POSITIONS)
+
+    # the Line holding text and an #N/A cell is left to the evaluator
+    assert list(eligible) == [True, True, False]
+    assert set(offset for offset, _ in values) >= set(SUMMARY_OFFSETS.values())
+    mismatches = []
+    for (offset, header), per_line in values.items():
+        column = HEADERS.index(header) + 1
+        for line, first in enumerate(first_rows):
+            if not eligible[line]:
+                continue
+            expected = cached.cell(row=first + offset, column=column).value
+            if not _same(per_line[line], expected):
+                mismatches.append((line + 1, offset, header, per_line[line], expected))
+    assert not mismatches
@@ -0,0 +1,69 @@
+"""
+Steps 1-4 against the sheets the original, file-by-file steps wrote for
+the same export (tests/data/baseline_steps.xlsx, see make_reference.py):
+the Last 6 selection, the grouping of the reference and sample runs and
+the normalization must come out cell for cell the same, formulas and
+their values.
+"""
+import os
+import shutil
+
+import pytest
+from openpyxl import load_workbook
+
+from benchmarks.gas_bench import SHEET_NAME
+from steps.carbon.formulas import DIV0
+from steps.carbon.pipeline import run_pipeline
+
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_steps.xlsx")
+
+SHEETS = ["Data", "To Sort", "Last 6", "Group"]
+
+
+def _cells(ws, values):
+    """{coordinate: (formula or value, cached value)} of a sheet, rich text as plain text."""
+    cells = {}
+    for cell in ws._cells.values():
+        if cell.value is None or cell.value == "":
+            continue
+        value = cell.value if isinstance(cell.value, (int, float, bool)) else str(cell.value)
+        cells[cell.coordinate] = (value, values[cell.coordinate].value)
+    return cells
+
+
+@pytest.fixture(scope="module")
+def workbooks(tmp_path_factory):
+    """(reference sheets, sheets of the current steps 1-4 on the reference's raw sheet)."""
+    path = str(tmp_path_factory.mktemp("group") / "export.xlsx")
+    shutil.copy(REFERENCE, path)
+    wb = load_workbook(path)
+    for name in wb.sheetnames:
+        if name != SHEET_NAME:
+            del wb[name]
+    wb.save(path)
+    run_pipeline(path, steps=(1, 2, 3, 4), incremental=False)
+
+    def sheets(file_path):
+        formulas = load_workbook(file_path)
+        values = load_workbook(file_path, data_only=True)
+        return {name: _cells(formulas[name], values[name]) for name in SHEETS}
+
+    return sheets(REFERENCE), sheets(path)
+
+
+@pytest.mark.parametrize("sheet_name", SHEETS)
+def test_sheets_match_the_baseline(workbooks, sheet_name):
+    expected, actual = (sheets[sheet_name] for sheets in workbooks)
+    assert actual.keys() == expected.keys()
+    mismatches = [
+        (coordinate, actual[coordinate], value)
+        for coordinate, value in expected.items() if actual[coordinate] != value
+    ]
+    assert not mismatches
+
+
+def test_reference_covers_error_averages(workbooks):
+    # the reference groups of the blanked NBS 19 / IAEA 603 Lines average to #DIV/0!
+    group = workbooks[0]["Group"]
+    errors = [c for c, (formula, value) in group.items() if str(formula).startswith("=ROUND(AVERAGE") and value == DIV0]
+    assert len(errors) >= 2
@@ -0,0 +1,59 @@
+"""
+The reference normalization step 4 caches with the Group formulas
+(steps.carbon.normalization) against the formula evaluator.
+"""
+import pytest
+
+from steps.carbon.formulas import DIV0, NA, FormulaEvaluator
+from steps.carbon.normalization import group_statistics
+from steps.carbon.session import CarbonSession
+from steps.carbon.step1_data import build_data_sheet
+from steps.carbon.step2_tosort import build_to_sort
+from steps.carbon.step3_last6 import build_last6
+from steps.carbon.step4_group import build_group
+from tests.conftest import blank_peaks
+
+AVERAGE_COLUMNS = range(18, 24)  # R-W of the Average rows: C/O avg, stdev, count
+
+
+def test_group_statistics_skip_blanks_and_text():
+    assert group_statistics([-2.1, None, "n/a", True, -2.3]) == (-2.2, 0.141, 2.0)
+    assert group_statistics([None, "n/a"]) == (DIV0, DIV0, 0.0)
+    assert group_statistics([-2.1]) == (-2.1, DIV0, 1.0)
+
+
+@pytest.mark.parametrize("error", [DIV0, "#DIV/0!", NA, "#N/A"])
+def test_group_statistics_return_errors(error):
+    # AVERAGE and STDEV return the error of the range; COUNT skips it
+    assert group_statistics([-2.1, -2.3, error]) == (error, error, 2.0)
+
+
+@pytest.mark.parametrize("reload", [False, True], ids=["in session", "reloaded"])
+def test_cached_group_values_match_evaluator(gas_bench, reload):
+    # a 'last 6' C avg and an O avg of reference Lines are #DIV/0!
+    blank_peaks(gas_bench, "NBS 19", "d 13C/12C")
+    blank_peaks(gas_bench, "IAEA 603", "d 18O/16O")
+    session = CarbonSession(gas_bench)
+    build_data_sheet(session)
+    build_to_sort(session)
+    build_last6(session)
+    if reload:
+        # errors read back from the file are error codes, not ExcelError
+        session.save()
+        session = CarbonSession(gas_bench)
+    build_group(session)
+
+    ws = session.wb["Group"]
+    cached = session.computed["Group"]
+    evaluator = FormulaEvaluator(ws)
+    errors = [
+        key for key, value in cached.items()
+        if key[1] in AVERAGE_COLUMNS and value == DIV0
+    ]
+    assert len(errors) >= 4  # C avg/stdev of NBS 19, O avg/stdev of IAEA 603
+    mismatches = []
+    for (row, column), value in sorted(cached.items()):
+        expected = evaluator.cell_value(row, column)
+        if value != expected:
+            mismatches.append((ws.cell(row=row, column=column).coordinate, value, expected))
+    assert not mismatches
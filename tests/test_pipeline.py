@@ -0,0 +1,54 @@
+"""
+Incremental runs of run_pipeline: steps whose inputs did not change are
+skipped, and a run that failed resumes from the step that failed.
+"""
+import pytest
+from openpyxl import load_workbook
+
+import steps.carbon.pipeline as pipeline
+from steps.carbon.pipeline import run_pipeline
+
+
+def _run(path, **kwargs):
+    """run_pipeline, returning {step: status} of the events it sent."""
+    statuses = {}
+    kwargs.setdefault("on_event", lambda step, status, detail: statuses.__setitem__(step, status))
+    run_pipeline(path, **kwargs)
+    return statuses
+
+
+def test_unchanged_steps_are_skipped(gas_bench):
+    assert _run(gas_bench) == {step: "done" for step in range(1, 6)}
+    saved = open(gas_bench, "rb").read()
+
+    assert _run(gas_bench) == {step: "skipped" for step in range(1, 6)}
+    # nothing ran, so nothing was saved
+    assert open(gas_bench, "rb").read() == saved
+
+
+def test_filter_change_reruns_to_sort_only(gas_bench):
+    _run(gas_bench)
+
+    statuses = _run(gas_bench, filter_choice="All")
+
+    # the rows of To Sort stay the same, only which of them are hidden changes,
+    # so Last 6 and the steps after it are still current
+    assert statuses == {1: "skipped", 2: "done", 3: "skipped", 4: "skipped", 5: "skipped"}
+    ws = load_workbook(gas_bench)["To Sort"]
+    assert not any(dim.hidden for dim in ws.row_dimensions.values())
+    assert _run(gas_bench, filter_choice="All") == {step: "skipped" for step in range(1, 6)}
+
+
+def test_rerun_resumes_after_a_failure(gas_bench, monkeypatch):
+    def fail(session):
+        raise RuntimeError("step 3 failed")
+
+    statuses = {}
+    with monkeypatch.context() as patch, pytest.raises(RuntimeError, match="step 3 failed"):
+        patch.setattr(pipeline, "build_last6", fail)
+        _run(gas_bench, on_event=lambda step, status, detail: statuses.__setitem__(step, status))
+    assert statuses == {1: "done", 2: "done", 3: "error"}
+    # steps 1-2 were saved before the error was raised
+    assert {"Data", "To Sort"} <= set(load_workbook(gas_bench).sheetnames)
+
+    assert _run(gas_bench) == {1: "skipped", 2: "skipped", 3: "done", 4: "done", 5: "done"}
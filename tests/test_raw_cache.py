@@ -0,0 +1,87 @@
+"""
+The parsed raw sheet cache of step 1 (steps.carbon.raw_cache): round trips
+of every column kind, content keys and LRU eviction.
+"""
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from benchmarks.gas_bench import SHEET_NAME
+from steps.carbon.raw_cache import RawTableCache, sheet_key
+
+
+def _table(offset=0):
+    return pd.DataFrame({
+        "Line": np.arange(offset, offset + 6, dtype=np.int64),
+        "Rt": np.array([1.5, np.nan, 2.0, 3.25, -0.5, 1e-300]),
+        "Flag": np.array([True, False, True, True, False, False]),
+        "Time Code": pd.to_datetime(["2024-01-02 03:04:05"] * 6),
+        "Identifier 1": pd.Series(["NBS 19", None, "IAEA 603", "x", "", "CO2"], dtype=object),
+        "Analysis": pd.Series(["1", np.nan, "2", "3", "re-run", "4"], dtype="str"),
+        "Comment": pd.Series(
+            ["n/a", 7, 2.5, np.nan, True, datetime(2024, 5, 6, 7, 8, 9)], dtype=object,
+        ),
+    })
+
+
+def _entry_size(cache, key):
+    entry = os.path.join(cache.directory, key)
+    return sum(e.stat().st_size for e in os.scandir(entry))
+
+
+def test_put_get_round_trips_every_column_kind(tmp_path):
+    cache = RawTableCache(str(tmp_path))
+    df = _table()
+    cache.put("key", df)
+    cached = cache.get("key")
+    pd.testing.assert_frame_equal(cached, df, check_exact=True)
+    # mixed values keep their Python type, not just their value
+    assert [type(v) for v in cached["Comment"]] == [type(v) for v in df["Comment"]]
+    assert cache.get("other") is None
+
+
+def test_put_never_raises_for_an_uncacheable_table(tmp_path):
+    cache = RawTableCache(str(tmp_path))
+    cache.put("key", pd.DataFrame({"Comment": pd.Series([object()], dtype=object)}))
+    assert cache.get("key") is None
+    assert os.listdir(tmp_path) == []  # no half-written entry left behind
+
+    blocked = tmp_path / "file"
+    blocked.write_text("not a directory")
+    RawTableCache(str(blocked)).put("key", _table())
+
+
+def test_sheet_key_follows_the_sheet_content(gas_bench, tmp_path):
+    key = sheet_key(gas_bench, SHEET_NAME)
+    copy = str(tmp_path / "copy.xlsx")
+    shutil.copy(gas_bench, copy)
+    assert sheet_key(copy, SHEET_NAME) == key  # content, not path or mtime
+    assert sheet_key(gas_bench, SHEET_NAME, "pandas") != key
+
+    wb = load_workbook(copy)
+    ws = wb[SHEET_NAME]
+    ws["I2"] = ws["I2"].value + 1
+    wb.save(copy)
+    assert sheet_key(copy, SHEET_NAME) != key
+
+
+@pytest.mark.parametrize("hit", [False, True], ids=["unused", "read since"])
+def test_evicts_least_recently_used_first(tmp_path, hit):
+    cache = RawTableCache(str(tmp_path))
+    for age, key in enumerate(("old", "middle", "new")):
+        cache.put(key, _table(age))
+        meta = os.path.join(tmp_path, key, "meta.json")
+        os.utime(meta, (1_000_000 + age, 1_000_000 + age))
+    if hit:
+        assert cache.get("old") is not None  # a hit makes it the most recent
+
+    cache.max_bytes = 3 * _entry_size(cache, "new")
+    cache.put("newest", _table(3))
+    kept = sorted(os.listdir(tmp_path))
+    evicted = "middle" if hit else "old"
+    assert kept == sorted({"old", "middle", "new", "newest"} - {evicted})
@@ -0,0 +1,74 @@
+"""
+Text (.csv/.txt) instrument exports: the same Data as the xlsx export,
+written to a workbook of their own.
+"""
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from benchmarks.gas_bench import SHEET_NAME
+from cli import expand_inputs
+from steps.carbon.pipeline import run_pipeline
+from steps.carbon.text_import import workbook_path_for
+
+OUTPUT_SHEETS = ["Data", "To Sort", "Last 6", "Group", "Summary"]
+
+
+def _write_text_export(xlsx_path, text_path, sep):
+    """The raw sheet of an xlsx export as a delimited text export."""
+    pd.read_excel(xlsx_path, sheet_name=SHEET_NAME).to_csv(text_path, sep=sep, index=False)
+
+
+def _sheet_values(path):
+    """{sheet: {coordinate: (formula or value, cached value)}} of the OUTPUT_SHEETS of a saved workbook."""
+    formulas = load_workbook(path)
+    values = load_workbook(path, data_only=True)
+    return {
+        name: {
+            cell.coordinate: (cell.value, values[name][cell.coordinate].value)
+            for cell in formulas[name]._cells.values()
+            if cell.value is not None
+        }
+        for name in OUTPUT_SHEETS
+    }
+
+
+@pytest.mark.parametrize("name, sep", [("session.csv", ","), ("session.txt", "\t"), ("semicolons.csv", ";")])
+def test_text_export_gives_the_same_sheets_as_xlsx(gas_bench, tmp_path, name, sep):
+    text_path = str(tmp_path / name)
+    _write_text_export(gas_bench, text_path, sep)
+
+    run_pipeline(gas_bench)
+    run_pipeline(text_path)
+
+    written = workbook_path_for(text_path)
+    assert os.path.basename(written) == os.path.splitext(name)[0] + ".carbon.xlsx"
+    expected = _sheet_values(gas_bench)
+    for sheet_name, values in _sheet_values(written).items():
+        assert values == expected[sheet_name], sheet_name
+
+
+def test_text_export_never_overwrites_the_xlsx_export(gas_bench, tmp_path):
+    xlsx_path = str(tmp_path / "session.xlsx")
+    shutil.copy(gas_bench, xlsx_path)
+    original = open(xlsx_path, "rb").read()
+    text_path = str(tmp_path / "session.csv")
+    _write_text_export(xlsx_path, text_path, ",")
+
+    run_pipeline(text_path, steps=(1,))
+
+    assert open(xlsx_path, "rb").read() == original
+    assert load_workbook(str(tmp_path / "session.carbon.xlsx")).sheetnames == [SHEET_NAME, "Data"]
+
+
+def test_inputs_leave_out_the_workbooks_of_text_exports(tmp_path):
+    for name in ["a.csv", "a.carbon.xlsx", "a.xlsx", "b.carbon.xlsx"]:
+        (tmp_path / name).write_bytes(b"")
+
+    files = expand_inputs([str(tmp_path)])
+
+    # a.carbon.xlsx is rebuilt by the a.csv job; b.carbon.xlsx has no export next to it
+    assert [os.path.basename(f) for f in files] == ["a.csv", "a.xlsx", "b.carbon.xlsx"]
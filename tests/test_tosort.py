@@ -0,0 +1,103 @@
+"""
+The extra filter views of step 2 (steps.carbon.step2_tosort): the rows each
+layout hides, unknown views and the views of a previous run.
+"""
+import pytest
+
+from steps.carbon.session import CarbonSession
+from steps.carbon.step1_data import build_data_sheet
+from steps.carbon.step2_tosort import (
+    COL_Q, FILTER_CHOICES, VIEWS_TABLE_SHEET, build_to_sort, view_sheet_name,
+)
+
+VIEWS = ["Start", "Ref Avg", "Delta", "All"]
+
+
+@pytest.fixture
+def session(gas_bench):
+    session = CarbonSession(gas_bench)
+    build_data_sheet(session)
+    return session
+
+
+def _hidden(ws):
+    return {r for r, dim in ws.row_dimensions.items() if dim.hidden}
+
+
+def _other_rows(ws, labels):
+    """Data rows whose column Q label is none of `labels` (what a filter on them hides)."""
+    if "all" in labels:
+        return set()
+    return {
+        r for r in range(2, ws.max_row + 1)
+        if str(ws.cell(row=r, column=COL_Q).value or "").lower() not in labels
+    }
+
+
+def _view_sheets(wb):
+    names = {view_sheet_name(c) for c in FILTER_CHOICES} | {VIEWS_TABLE_SHEET}
+    return sorted(names & set(wb.sheetnames))
+
+
+def test_sheets_layout_hides_the_rows_of_other_labels(session):
+    build_to_sort(session, "Last 6", VIEWS, "sheets")
+    wb = session.wb
+    assert _view_sheets(wb) == sorted(view_sheet_name(v) for v in VIEWS)
+    to_sort = wb["To Sort"]
+    assert _hidden(to_sort) == _other_rows(to_sort, {"last 6"})
+    for view in VIEWS:
+        ws = wb[view_sheet_name(view)]
+        hidden = _hidden(ws)
+        assert hidden == _other_rows(ws, {view.lower()})
+        if view != "All":
+            assert ws.max_row - 1 > len(hidden) > 0  # some rows of each label in the export
+        assert [c.value for c in ws["Q"]] == [c.value for c in to_sort["Q"]]
+
+
+def test_table_layout_filters_on_all_views(session):
+    build_to_sort(session, "Last 6", ["Start", "Ref Avg"], "table")
+    wb = session.wb
+    assert _view_sheets(wb) == [VIEWS_TABLE_SHEET]
+    ws = wb[VIEWS_TABLE_SHEET]
+    assert _hidden(ws) == _other_rows(ws, {"start", "ref avg"})
+    (table,) = ws.tables.values()
+    (column,) = table.autoFilter.filterColumn
+    assert column.colId == COL_Q - 1
+    assert column.filters.filter == ["ref avg", "start"]
+
+
+def test_table_layout_with_all_hides_nothing(session):
+    build_to_sort(session, "Last 6", ["Start", "all"], "table")
+    ws = session.wb[VIEWS_TABLE_SHEET]
+    assert not _hidden(ws)
+    (table,) = ws.tables.values()
+    assert not table.autoFilter.filterColumn
+
+
+@pytest.mark.parametrize("views, layout", [
+    (["Start", "Last 7"], "sheets"),
+    (["Start", "Last 7"], "table"),
+    (["Start"], "tabs"),
+])
+def test_unknown_views_raise_before_any_change(session, views, layout):
+    with pytest.raises(ValueError):
+        build_to_sort(session, "Last 6", views, layout)
+    assert "To Sort" not in session.wb.sheetnames
+
+
+def test_rerun_drops_the_views_of_a_previous_run(session, gas_bench):
+    build_to_sort(session, "Last 6", ["Start", "End"], "sheets")
+    session.save()
+
+    session = CarbonSession(gas_bench)
+    build_to_sort(session, "Last 6", ["Delta"], "sheets")
+    assert _view_sheets(session.wb) == [view_sheet_name("Delta")]
+
+    build_to_sort(session, "Last 6", ["Start"], "table")
+    assert _view_sheets(session.wb) == [VIEWS_TABLE_SHEET]
+    session.save()
+
+    session = CarbonSession(gas_bench)
+    build_to_sort(session, "Last 6")
+    assert _view_sheets(session.wb) == []
+    assert "To Sort" in session.wb.sheetnames
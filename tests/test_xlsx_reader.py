@@ -0,0 +1,83 @@
+"""
+The iterparse reader of step 1 (steps.carbon.xlsx_reader) against
+pd.read_excel: the same frame for the columns step 1 uses.
+"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from benchmarks.gas_bench import EXPORT_HEADERS, SHEET_NAME
+from steps.carbon.step1_data import HEADERS
+from steps.carbon.xlsx_reader import read_gas_bench_sheet
+
+
+def _column(name):
+    return EXPORT_HEADERS.index(name) + 1
+
+
+def _untidy(path):
+    """Edit an export into what instrument exports and hand edits leave behind."""
+    wb = load_workbook(path)
+    ws = wb[SHEET_NAME]
+    last = ws.max_row
+    # duplicate headers (pandas mangles them to "name.1") and a blank one
+    ws.cell(row=1, column=_column("Ampl 45"), value="Ampl  44")
+    ws.cell(row=1, column=_column("Area 44"), value="Area All")
+    ws.cell(row=1, column=_column("d 45CO2/44CO2"), value=None)
+    # blanks and error cells in the delta columns
+    for row in (2, 7, 30):
+        ws.cell(row=row, column=_column("d 13C/12C"), value=None)
+    ws.cell(row=5, column=_column("d 13C/12C"), value="#DIV/0!")
+    ws.cell(row=6, column=_column("d 18O/16O"), value="#N/A")
+    ws.cell(row=9, column=_column("d 18O/16O"), value="#VALUE!")
+    # mixed types: numeric text, text, booleans and dates among numbers
+    ws.cell(row=3, column=_column("Rt"), value="47.2")
+    ws.cell(row=4, column=_column("Rt"), value="n/a")
+    ws.cell(row=8, column=_column("Area All"), value=True)
+    ws.cell(row=10, column=_column("Analysis"), value="re-run")
+    ws.cell(row=11, column=_column("Identifier 2"), value=7)
+    ws.cell(row=12, column=_column("Time Code"), value=datetime(2025, 5, 21, 9, 30))
+    ws.cell(row=13, column=_column("Comment"), value=3.5)
+    # an empty row inside the table, and empty styled cells below it
+    for column in range(1, len(EXPORT_HEADERS) + 1):
+        ws.cell(row=20, column=column).value = None
+    ws.cell(row=last + 3, column=1).number_format = "0.00"
+    wb.save(path)
+
+
+@pytest.mark.parametrize("untidy", [False, True], ids=["as exported", "untidy"])
+def test_reader_matches_read_excel(gas_bench, untidy):
+    if untidy:
+        _untidy(gas_bench)
+
+    df = read_gas_bench_sheet(gas_bench, SHEET_NAME, HEADERS)
+    expected = pd.read_excel(gas_bench, sheet_name=SHEET_NAME, engine="openpyxl")
+
+    assert len(df.columns) >= 12
+    pd.testing.assert_frame_equal(df, expected[list(df.columns)], check_exact=True)
+
+
+def test_reader_reads_the_first_of_duplicate_headers(gas_bench):
+    _untidy(gas_bench)
+
+    df = read_gas_bench_sheet(gas_bench, SHEET_NAME, HEADERS)
+
+    assert "Ampl  44" in df.columns and "Ampl  44.1" not in df.columns
+    assert "Area All" in df.columns and "Area All.1" not in df.columns
+
+
+def test_booleans_are_typed_like_read_excel(tmp_path):
+    columns = {
+        "Rt": [1.5, True, 2.0],  # among floats
+        "Peak Nr": [1, True, 2],  # among ints
+        "Comment": [True, False, True],  # only booleans
+        "Analysis": [True, "x", 1.5],  # with text
+        "Ampl 44": ["1", True, False],  # with numeric text
+    }
+    path = str(tmp_path / "flags.xlsx")
+    pd.DataFrame(columns).to_excel(path, sheet_name=SHEET_NAME, index=False)
+    df = read_gas_bench_sheet(path, SHEET_NAME, list(columns))
+    expected = pd.read_excel(path, sheet_name=SHEET_NAME)
+    pd.testing.assert_frame_equal(df, expected[list(df.columns)], check_exact=True)
@@ -1,4 +1,21 @@
+import os
+
+
 def normalize_name(s):
     if s is None:
         return ''
     return ' '.join(str(s).split()).lower()
+
+
+def cache_dir(*parts):
+    """
+    Directory for the tool's local caches: MRSI_CACHE_DIR if set, else the
+    per-user cache location (LOCALAPPDATA on Windows, XDG_CACHE_HOME or
+    ~/.cache elsewhere), joined with `parts`.
+    """
+    base = os.environ.get("MRSI_CACHE_DIR")
+    if not base:
+        root = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+        base = os.path.join(root, "MRSI Data Tool")
+    return os.path.join(base, *parts)